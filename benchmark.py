@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+
+"""Benchmarks the upload of synthetic trait CSV files to a local GeoStreams stand-in
+"""
+
+import argparse
+import collections
+import csv
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Default benchmark cases
+DEFAULT_SIZES = '1000,10000,100000'
+DEFAULT_PLOTS = 100
+DEFAULT_TRAITS = 2
+
+# The relative change from the baseline that is reported as a regression
+DEFAULT_TOLERANCE = 0.2
+
+# Metrics compared against the baseline, and whether larger values are better
+COMPARED_METRICS = {
+    'rows_per_second': True,
+    'requests_per_row': False,
+    'peak_rss_mb': False
+}
+
+# The number of times the startup of a fresh interpreter is measured; the median is reported
+DEFAULT_STARTUP_RUNS = 5
+
+# Measures the startup of a fresh interpreter: importing the transformer, rejecting a job without CSV files, and
+# making the first request to GeoStreams (when a URL is given); prints the times in seconds and the modules loaded
+STARTUP_SCRIPT = '''
+import sys, time
+started = time.perf_counter()
+import argparse, json
+import transformer, transformer_class
+imported = time.perf_counter()
+parser = argparse.ArgumentParser()
+parser.add_argument('file_list', nargs='*')
+transformer.add_parameters(parser)
+instance = transformer_class.Transformer()
+params = instance.get_transformer_params(parser.parse_args(['readme.txt']), [])
+transformer.check_continue(instance, **params)
+rejected = time.perf_counter()
+times = {'import': imported - started, 'reject': rejected - started,
+         'modules_at_reject': sorted(name for name in ('requests', 'terrautils') if name in sys.modules)}
+if len(sys.argv) > 1:
+    args = parser.parse_args(['--clowder_url', sys.argv[1], '--resolution_index', 'bypass'])
+    transformer.__internal__.configure_run(args)
+    transformer.__internal__.client.get(sys.argv[1] + 'api/geostreams/sensors', {'sensor_name': 'startup'})
+    times['first_request'] = time.perf_counter() - started
+    transformer.__internal__.release_run()
+print(json.dumps(times))
+'''
+
+# The resume check: the rows of the file uploaded, the row whose upload fails the first time, and the rows between
+# checkpoints
+RESUME_CHECK_ROWS = 1000
+RESUME_CHECK_FAIL_ROW = 750
+RESUME_CHECK_CHECKPOINT_ROWS = 200
+
+# The size and location of the generated plots
+PLOT_SIZE_DEGREES = 0.0001
+PLOT_ORIGIN = (33.07, -111.98)
+
+
+def get_plot_bounds(plot_index: int, plot_count: int) -> tuple:
+    """Returns the bounds of a synthetic plot
+    Arguments:
+        plot_index: the index of the plot
+        plot_count: the total number of plots, laid out in a square grid
+    Return:
+        Returns the (min latitude, min longitude, max latitude, max longitude) tuple of the plot
+    """
+    columns = max(1, int(math.ceil(math.sqrt(plot_count))))
+    min_lat = PLOT_ORIGIN[0] + (plot_index // columns) * PLOT_SIZE_DEGREES
+    min_lon = PLOT_ORIGIN[1] + (plot_index % columns) * PLOT_SIZE_DEGREES
+    return min_lat, min_lon, min_lat + PLOT_SIZE_DEGREES, min_lon + PLOT_SIZE_DEGREES
+
+
+def write_site_file(file_path: str, plot_count: int) -> None:
+    """Writes a GeoJSON file of synthetic plots
+    Arguments:
+        file_path: the path of the file to write
+        plot_count: the number of plots to write
+    """
+    features = []
+    for plot_index in range(plot_count):
+        min_lat, min_lon, max_lat, max_lon = get_plot_bounds(plot_index, plot_count)
+        features.append({
+            'type': 'Feature',
+            'properties': {'sitename': 'Benchmark Plot %s' % plot_index},
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [[[min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat],
+                                 [min_lon, min_lat]]]
+            }
+        })
+    with open(file_path, 'w') as out_file:
+        json.dump({'type': 'FeatureCollection', 'features': features}, out_file)
+
+
+def write_csv_file(file_path: str, row_count: int, plot_count: int, trait_count: int, seed: int = 0) -> None:
+    """Writes a CSV file of synthetic trait rows with the columns expected by the transformer
+    Arguments:
+        file_path: the path of the file to write
+        row_count: the number of rows to write
+        plot_count: the number of plots the rows are spread over
+        trait_count: the number of traits the rows are spread over
+        seed: the random number seed
+    """
+    rand = random.Random(seed)
+    centroids = []
+    for plot_index in range(plot_count):
+        min_lat, min_lon, max_lat, max_lon = get_plot_bounds(plot_index, plot_count)
+        centroids.append(('%.8f' % ((min_lat + max_lat) / 2), '%.8f' % ((min_lon + max_lon) / 2)))
+    start_time = datetime.datetime(2018, 6, 28, 8, tzinfo=datetime.timezone(datetime.timedelta(hours=-7)))
+
+    with open(file_path, 'w', newline='') as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(['lat', 'lon', 'dp_time', 'timestamp', 'source', 'value', 'trait'])
+        for row_index in range(row_count):
+            lat, lon = centroids[row_index % plot_count]
+            dp_time = start_time + datetime.timedelta(minutes=row_index // (plot_count * trait_count))
+            writer.writerow([lat, lon, dp_time.isoformat(), dp_time.date().isoformat(), 'benchmark',
+                             '%.4f' % rand.uniform(0, 100), 'trait_%s' % ((row_index // plot_count) % trait_count)])
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Returns a percentile of a list of values
+    Arguments:
+        values: the sorted values
+        fraction: the percentile as a fraction (eg: 0.99)
+    Return:
+        Returns the percentile, or 0 if there are no values
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_case(clowder_url: str, csv_path: str, site_path: str, work_dir: str, transformer_args: list, results) -> None:
+    """Runs the transformer on one CSV file and records the measurements; intended to run in its own process
+    Arguments:
+        clowder_url: the URL of the GeoStreams stand-in
+        csv_path: the path of the CSV file to upload
+        site_path: the path of the site file
+        work_dir: the working space of the transformer
+        transformer_args: additional command line arguments for the transformer
+        results: the queue the measurements are put into
+    """
+    # pylint: disable=import-outside-toplevel
+    import transformer
+    import transformer_class
+
+    latencies = []
+    original_request = transformer.GeoStreamsClient.request
+
+    def timed_request(self, method, url, **kwargs):
+        """Records the latency of each request"""
+        request_start = time.perf_counter()
+        try:
+            return original_request(self, method, url, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - request_start)
+    transformer.GeoStreamsClient.request = timed_request
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--metadata', nargs='*')
+    parser.add_argument('--working_space')
+    parser.add_argument('file_list', nargs='*')
+    transformer.add_parameters(parser)
+    args = parser.parse_args(['--clowder_url', clowder_url, '--working_space', work_dir, '--site_file', site_path,
+                              '--resolution_index', 'bypass', '--checkpoint_rows', '0'] + transformer_args + [csv_path])
+    instance = transformer_class.Transformer()
+    params = instance.get_transformer_params(args, [])
+
+    start = time.perf_counter()
+    result = transformer.perform_process(instance, **params)
+    elapsed = time.perf_counter() - start
+
+    results.put({
+        'code': result.get('code'),
+        'seconds': elapsed,
+        'requests': len(latencies),
+        'latencies': sorted(latencies),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    })
+
+
+def run_resume_check(csv_path: str, site_path: str, work_dir: str, results) -> None:
+    """Uploads a CSV file to an offline store with an upload that fails part of the way, resumes the upload, and records
+       the number of datapoints stored; intended to run in its own process
+    Arguments:
+        csv_path: the path of the CSV file to upload
+        site_path: the path of the site file
+        work_dir: the working space of the transformer
+        results: the queue the measurements are put into
+    """
+    # pylint: disable=import-outside-toplevel
+    import offline_backend
+    import transformer
+    import transformer_class
+
+    store_path = os.path.join(work_dir, 'resume_check.sqlite')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--metadata', nargs='*')
+    parser.add_argument('--working_space')
+    parser.add_argument('file_list', nargs='*')
+    transformer.add_parameters(parser)
+    args = parser.parse_args(['--offline', '--offline_store', store_path, '--working_space', work_dir,
+                              '--site_file', site_path, '--resolution_index', 'bypass',
+                              '--checkpoint_rows', str(RESUME_CHECK_CHECKPOINT_ROWS), csv_path])
+    instance = transformer_class.Transformer()
+    params = instance.get_transformer_params(args, [])
+
+    add_datapoints = transformer.__internal__.add_datapoints
+    calls = [0]
+
+    def failing_add_datapoints(*add_args, **add_kwargs):
+        """Fails when the datapoint of the chosen row is added"""
+        calls[0] += 1
+        if calls[0] == RESUME_CHECK_FAIL_ROW:
+            raise RuntimeError("Failing row %s for the resume check" % RESUME_CHECK_FAIL_ROW)
+        return add_datapoints(*add_args, **add_kwargs)
+
+    transformer.__internal__.add_datapoints = failing_add_datapoints
+    failed = transformer.perform_process(instance, **params)
+    transformer.__internal__.add_datapoints = add_datapoints
+    args.resume = True
+    resumed = transformer.perform_process(instance, **params)
+
+    store = offline_backend.OfflineGeoStreams(store_path)
+    results.put({'failed_code': failed.get('code'), 'resumed_code': resumed.get('code'),
+                 'datapoints_stored': store.get_counts()['datapoints']})
+    store.close()
+
+
+def check_resume(work_dir: str) -> dict:
+    """Checks that resuming an upload that failed part of the way uploads every row exactly once
+    Arguments:
+        work_dir: the folder for generated files
+    Return:
+        Returns the results of the check, with 'passed' set to whether the check passed
+    """
+    site_path = os.path.join(work_dir, 'resume_sites.geojson')
+    csv_path = os.path.join(work_dir, 'resume_check.csv')
+    write_site_file(site_path, DEFAULT_PLOTS)
+    write_csv_file(csv_path, RESUME_CHECK_ROWS, DEFAULT_PLOTS, DEFAULT_TRAITS)
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_resume_check, args=(csv_path, site_path, work_dir, results))
+    process.start()
+    measured = results.get()
+    process.join()
+
+    measured['rows'] = RESUME_CHECK_ROWS
+    measured['passed'] = measured['failed_code'] != 0 and measured['resumed_code'] == 0 and \
+        measured['datapoints_stored'] == RESUME_CHECK_ROWS
+    return measured
+
+
+def benchmark(sizes: list, plot_count: int, trait_count: int, latency: float, transformer_args: list, work_dir: str) -> list:
+    """Runs the benchmark cases against a GeoStreams stand-in served over HTTP
+    Arguments:
+        sizes: the numbers of rows of the cases to run
+        plot_count: the number of plots in each case
+        trait_count: the number of traits in each case
+        latency: the number of seconds each request to the stand-in takes
+        transformer_args: additional command line arguments for the transformer
+        work_dir: the folder for generated files
+    Return:
+        Returns the list of case results
+    """
+    # pylint: disable=import-outside-toplevel
+    import offline_backend
+
+    site_path = os.path.join(work_dir, 'sites.geojson')
+    write_site_file(site_path, plot_count)
+    context = multiprocessing.get_context('spawn')
+    cases = []
+    for row_count in sizes:
+        csv_path = os.path.join(work_dir, 'traits_%s_%s_%s.csv' % (row_count, plot_count, trait_count))
+        write_csv_file(csv_path, row_count, plot_count, trait_count)
+
+        stand_in = offline_backend.OfflineGeoStreams(latency=latency)
+        server = offline_backend.make_server(stand_in)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        try:
+            results = context.Queue()
+            process = context.Process(target=run_case, args=('http://%s:%s/' % server.server_address[:2], csv_path, site_path,
+                                                             work_dir, transformer_args, results))
+            process.start()
+            measured = results.get()
+            process.join()
+        finally:
+            server.shutdown()
+            server.server_close()
+        counts = stand_in.get_counts()
+        stand_in.close()
+        os.remove(csv_path)
+
+        cases.append({
+            'rows': row_count,
+            'plots': plot_count,
+            'traits': trait_count,
+            'code': measured['code'],
+            'seconds': round(measured['seconds'], 3),
+            'rows_per_second': round(row_count / measured['seconds'], 1) if measured['seconds'] else 0.0,
+            'requests': measured['requests'],
+            'requests_per_row': round(measured['requests'] / row_count, 5) if row_count else 0.0,
+            'requests_by_endpoint': counts['requests'],
+            'datapoints_stored': counts['datapoints'],
+            'latency_p50_ms': round(percentile(measured['latencies'], 0.5) * 1000, 3),
+            'latency_p99_ms': round(percentile(measured['latencies'], 0.99) * 1000, 3),
+            'peak_rss_mb': round(measured['peak_rss_mb'], 1)
+        })
+        print(json.dumps(cases[-1]))
+    return cases
+
+
+def measure_startup(runs: int, latency: float) -> dict:
+    """Measures the startup of the transformer in fresh interpreters, as when a container is started for each job
+    Arguments:
+        runs: the number of times each measurement is made
+        latency: the number of seconds each request to the stand-in takes
+    Return:
+        Returns the median times in milliseconds: 'import' for importing the transformer, 'reject' for rejecting a job
+        without CSV files, 'reject_process' for the whole process running the rejected job including interpreter startup,
+        and 'first_request' for the first request to GeoStreams; and the heavy modules loaded when the job was rejected
+    """
+    # pylint: disable=import-outside-toplevel
+    import offline_backend
+
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    stand_in = offline_backend.OfflineGeoStreams(latency=latency)
+    server = offline_backend.make_server(stand_in)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    measured = collections.defaultdict(list)
+    modules = []
+    try:
+        for _ in range(runs):
+            process_start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=code_dir, check=True, capture_output=True)
+            measured['reject_process'].append(time.perf_counter() - process_start)
+            rejected = json.loads(output.stdout)
+            modules = rejected['modules_at_reject']
+
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, 'http://%s:%s/' % server.server_address[:2]],
+                                    cwd=code_dir, check=True, capture_output=True)
+            requested = json.loads(output.stdout)
+            for name in ('import', 'reject', 'first_request'):
+                measured[name].append(requested[name])
+    finally:
+        server.shutdown()
+        server.server_close()
+        stand_in.close()
+
+    startup = {name + '_ms': round(statistics.median(values) * 1000, 1) for name, values in measured.items()}
+    startup['runs'] = runs
+    startup['modules_at_reject'] = modules
+    return startup
+
+
+def compare(cases: list, baseline: dict, tolerance: float) -> list:
+    """Compares benchmark cases against a baseline
+    Arguments:
+        cases: the list of case results
+        baseline: a previous benchmark report
+        tolerance: the relative change from the baseline that is reported as a regression
+    Return:
+        Returns a list of regression descriptions
+    """
+    baseline_cases = {(one_case['rows'], one_case['plots'], one_case['traits']): one_case
+                      for one_case in baseline.get('cases', [])}
+    regressions = []
+    for one_case in cases:
+        previous = baseline_cases.get((one_case['rows'], one_case['plots'], one_case['traits']))
+        if not previous:
+            continue
+        for metric, larger_is_better in COMPARED_METRICS.items():
+            old_value, new_value = previous.get(metric), one_case.get(metric)
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value
+            if (larger_is_better and change < -tolerance) or (not larger_is_better and change > tolerance):
+                regressions.append("%s rows: %s changed from %s to %s (%+.1f%%)" %
+                                   (one_case['rows'], metric, old_value, new_value, change * 100))
+    return regressions
+
+
+def main() -> int:
+    """Runs the benchmark from the command line
+    Return:
+        Returns the process exit code: 0 on success, 1 if there are regressions or a case failed
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks uploading synthetic trait CSV files to a local GeoStreams stand-in')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help="comma separated numbers of rows of the cases to run (default '%s')" % DEFAULT_SIZES)
+    parser.add_argument('--plots', type=int, default=DEFAULT_PLOTS,
+                        help='the number of plots the rows are spread over (default %s)' % DEFAULT_PLOTS)
+    parser.add_argument('--traits', type=int, default=DEFAULT_TRAITS,
+                        help='the number of traits the rows are spread over (default %s)' % DEFAULT_TRAITS)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='the number of seconds each request to the stand-in takes (default 0)')
+    parser.add_argument('--output', help='the file to write the JSON report to')
+    parser.add_argument('--baseline', help='a previous JSON report to compare the results against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='the relative change from the baseline reported as a regression (default %s)' % DEFAULT_TOLERANCE)
+    parser.add_argument('--startup', action='store_true',
+                        help='also measure the import time, the time to reject a job, and the time to the first request of '
+                             'fresh interpreters')
+    parser.add_argument('--startup_runs', type=int, default=DEFAULT_STARTUP_RUNS,
+                        help='the number of times the startup is measured (default %s)' % DEFAULT_STARTUP_RUNS)
+    parser.add_argument('--startup_budget', type=float,
+                        help='the most milliseconds a process rejecting a job may take, including interpreter startup')
+    parser.add_argument('--resume_check', action='store_true',
+                        help='also check that resuming an upload that failed part of the way stores every row exactly once')
+    parser.add_argument('--work_dir', help='the folder for generated files (default a temporary folder)')
+    parser.add_argument('transformer_args', nargs=argparse.REMAINDER,
+                        help='additional transformer arguments, following "--" (eg: -- --workers 4)')
+    args = parser.parse_args()
+
+    transformer_args = [one_arg for one_arg in args.transformer_args if one_arg != '--']
+    sizes = [int(one_size) for one_size in args.sizes.split(',') if one_size.strip()]
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        cases = benchmark(sizes, args.plots, args.traits, args.latency, transformer_args, work_dir)
+        resume_check = check_resume(work_dir) if args.resume_check else None
+
+    report = {
+        'utc_timestamp': datetime.datetime.utcnow().isoformat(),
+        'python': sys.version.split()[0],
+        'latency': args.latency,
+        'transformer_args': transformer_args,
+        'cases': cases
+    }
+    exit_code = 0 if all(one_case['code'] == 0 for one_case in cases) else 1
+    if resume_check:
+        report['resume_check'] = resume_check
+        print(json.dumps(resume_check))
+        if not resume_check['passed']:
+            print('RESUME CHECK FAILED: %s datapoints were stored for %s rows' %
+                  (resume_check['datapoints_stored'], resume_check['rows']))
+            exit_code = 1
+    if args.startup or args.startup_budget:
+        report['startup'] = measure_startup(args.startup_runs, args.latency)
+        print(json.dumps(report['startup']))
+        if args.startup_budget and report['startup']['reject_process_ms'] > args.startup_budget:
+            print('OVER BUDGET: rejecting a job took %s ms, the budget is %s ms' %
+                  (report['startup']['reject_process_ms'], args.startup_budget))
+            exit_code = 1
+    if args.baseline:
+        with open(args.baseline, 'r') as in_file:
+            regressions = compare(cases, json.load(in_file), args.tolerance)
+        report['regressions'] = regressions
+        for one_regression in regressions:
+            print('REGRESSION: ' + one_regression)
+        if regressions:
+            exit_code = 1
+
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""Local stand-in for the GeoStreams API used for dry runs and performance testing
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import logging
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qsl, urlparse
+
+import requests
+
+# The part of request URLs that precedes the GeoStreams endpoint
+GEOSTREAMS_API_URL_PARTICLE = 'api/geostreams/'
+
+
+class OfflineGeoStreams():
+    """Implements the sensors, streams, datapoints, and datapoints/bulk GeoStreams endpoints using SQLite
+    """
+    def __init__(self, store_path: str = ':memory:', latency: float = 0.0):
+        """Performs initialization of class instance
+        Arguments:
+            store_path: the path of the SQLite file to store objects in; objects are kept in memory by default
+            latency: the number of seconds each request takes
+        """
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.request_counts = {}
+        self.connection = sqlite3.connect(store_path, timeout=60, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS sensors (id INTEGER PRIMARY KEY, name TEXT, body TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS streams (id INTEGER PRIMARY KEY, name TEXT, body TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS datapoints (id INTEGER PRIMARY KEY, stream_id INTEGER, '
+                                    'start_time TEXT, body TEXT)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS sensors_name ON sensors (name)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS streams_name ON streams (name)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS datapoints_stream ON datapoints (stream_id, start_time)')
+
+    @staticmethod
+    def normalize_time(time_str: str) -> str:
+        """Returns a timestamp in UTC so that timestamps can be compared as strings
+        Arguments:
+            time_str: the ISO 8601 timestamp (eg: 2017-01-25T09:33:02-06:00)
+        Return:
+            Returns the UTC timestamp, or the original string if it can't be parsed
+        """
+        try:
+            parsed = datetime.datetime.fromisoformat(str(time_str).strip().replace('Z', '+00:00'))
+        except ValueError:
+            return str(time_str)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return parsed.isoformat()
+
+    @staticmethod
+    def make_response(url: str, status_code: int, body=None) -> requests.Response:
+        """Returns a response to a request
+        Arguments:
+            url: the URL of the request
+            status_code: the HTTP status code of the response
+            body: the JSON serializable body of the response
+        Return:
+            The response
+        """
+        response = requests.Response()
+        response.url = url
+        response.status_code = status_code
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(body).encode('utf-8')  # pylint: disable=protected-access
+        return response
+
+    @staticmethod
+    def get_endpoint(url: str) -> str:
+        """Returns the GeoStreams endpoint of a request URL
+        Arguments:
+            url: the URL of the request
+        Return:
+            Returns the endpoint (eg: 'datapoints/bulk'), or an empty string if the URL isn't a GeoStreams URL
+        """
+        path = urlparse(url).path
+        if GEOSTREAMS_API_URL_PARTICLE not in path:
+            return ''
+        return path.split(GEOSTREAMS_API_URL_PARTICLE, 1)[1].strip('/')
+
+    def count_request(self, method: str, endpoint: str) -> None:
+        """Counts a request and waits for the configured latency
+        Arguments:
+            method: the HTTP method of the request
+            endpoint: the GeoStreams endpoint of the request
+        """
+        with self.lock:
+            key = method + ' ' + endpoint
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def find_by_name(self, table: str, name: Optional[str]) -> list:
+        """Returns the objects in a table, optionally restricted to a name
+        Arguments:
+            table: the table to search ('sensors' or 'streams')
+            name: the name to match
+        Return:
+            Returns the list of objects
+        """
+        with self.lock:
+            if name is None:
+                rows = self.connection.execute('SELECT body FROM %s' % table).fetchall()
+            else:
+                rows = self.connection.execute('SELECT body FROM %s WHERE name=?' % table, (name,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def find_datapoints(self, stream_id: str, since: Optional[str], until: Optional[str]) -> list:
+        """Returns the datapoints of a stream
+        Arguments:
+            stream_id: the ID of the stream
+            since: the earliest start time of the datapoints to return
+            until: the latest start time of the datapoints to return
+        Return:
+            Returns the list of datapoints
+        """
+        query = 'SELECT body FROM datapoints WHERE stream_id=?'
+        params = [int(stream_id)]
+        if since:
+            query += ' AND start_time>=?'
+            params.append(OfflineGeoStreams.normalize_time(since))
+        if until:
+            query += ' AND start_time<=?'
+            params.append(OfflineGeoStreams.normalize_time(until))
+        with self.lock:
+            rows = self.connection.execute(query + ' ORDER BY id', params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def exists(self, table: str, object_id) -> bool:
+        """Returns whether an object exists
+        Arguments:
+            table: the table of the object ('sensors' or 'streams')
+            object_id: the ID of the object
+        Return:
+            Returns True if the object exists and False otherwise
+        """
+        try:
+            object_id = int(object_id)
+        except (TypeError, ValueError):
+            return False
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM %s WHERE id=?' % table, (object_id,)).fetchone() is not None
+
+    def insert(self, table: str, body: dict) -> int:
+        """Stores a new sensor or stream
+        Arguments:
+            table: the table to store the object in ('sensors' or 'streams')
+            body: the object
+        Return:
+            The ID of the new object
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute('INSERT INTO %s (name) VALUES (?)' % table, (body.get('name'),))
+            body = dict(body, id=cursor.lastrowid)
+            self.connection.execute('UPDATE %s SET body=? WHERE id=?' % table, (json.dumps(body), cursor.lastrowid))
+        return cursor.lastrowid
+
+    def insert_datapoints(self, stream_id: str, data_points: list) -> int:
+        """Stores datapoints
+        Arguments:
+            stream_id: the ID of the stream the datapoints belong to
+            data_points: the datapoints to store
+        Return:
+            The number of datapoints stored
+        """
+        rows = [(int(stream_id), OfflineGeoStreams.normalize_time(one_point.get('start_time')),
+                 json.dumps(dict(one_point, stream_id=str(stream_id)))) for one_point in data_points]
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT INTO datapoints (stream_id, start_time, body) VALUES (?, ?, ?)', rows)
+        return len(rows)
+
+    def get(self, url: str, params: dict = None) -> requests.Response:
+        """Handles a GET request
+        Arguments:
+            url: the URL of the request
+            params: the query parameters of the request
+        Return:
+            Returns the response
+        """
+        endpoint = OfflineGeoStreams.get_endpoint(url)
+        params = params or {}
+        self.count_request('GET', endpoint)
+        if endpoint == 'sensors':
+            return OfflineGeoStreams.make_response(url, 200, self.find_by_name('sensors', params.get('sensor_name')))
+        if endpoint == 'streams':
+            return OfflineGeoStreams.make_response(url, 200, self.find_by_name('streams', params.get('stream_name')))
+        if endpoint == 'datapoints' and params.get('stream_id'):
+            if not self.exists('streams', params['stream_id']):
+                return OfflineGeoStreams.make_response(url, 404, {'status': 'stream not found'})
+            return OfflineGeoStreams.make_response(url, 200, self.find_datapoints(params['stream_id'], params.get('since'),
+                                                                                  params.get('until')))
+        return OfflineGeoStreams.make_response(url, 404, {'status': 'not found'})
+
+    def post(self, url: str, headers: dict = None, data=None) -> requests.Response:
+        """Handles a POST request
+        Arguments:
+            url: the URL of the request
+            headers: the headers of the request
+            data: the JSON body of the request, compressed with gzip when the Content-Encoding header says so
+        Return:
+            Returns the response
+        """
+        endpoint = OfflineGeoStreams.get_endpoint(url)
+        self.count_request('POST', endpoint)
+        encoding = {name.lower(): value for name, value in (headers or {}).items()}.get('content-encoding', '')
+        try:
+            if encoding.lower() == 'gzip':
+                data = gzip.decompress(data)
+            body = json.loads(data)
+        except (TypeError, ValueError, OSError):
+            return OfflineGeoStreams.make_response(url, 400, {'status': 'invalid JSON'})
+
+        if endpoint == 'sensors':
+            return OfflineGeoStreams.make_response(url, 200, {'id': self.insert('sensors', body)})
+        if endpoint == 'streams':
+            if not self.exists('sensors', body.get('sensor_id')):
+                return OfflineGeoStreams.make_response(url, 404, {'status': 'sensor not found'})
+            return OfflineGeoStreams.make_response(url, 200, {'id': self.insert('streams', body)})
+        if endpoint in ['datapoints', 'datapoints/bulk']:
+            if not self.exists('streams', body.get('stream_id')):
+                return OfflineGeoStreams.make_response(url, 404, {'status': 'stream not found'})
+            data_points = body.get('datapoints', []) if endpoint == 'datapoints/bulk' else [body]
+            count = self.insert_datapoints(body['stream_id'], data_points)
+            return OfflineGeoStreams.make_response(url, 200, {'status': 'ok', 'count': count})
+        return OfflineGeoStreams.make_response(url, 404, {'status': 'not found'})
+
+    def get_counts(self) -> dict:
+        """Returns the number of objects stored and requests made
+        Return:
+            Returns a dictionary with the number of sensors, streams, datapoints, and requests to each endpoint
+        """
+        with self.lock:
+            counts = {table: self.connection.execute('SELECT COUNT(*) FROM %s' % table).fetchone()[0]
+                      for table in ['sensors', 'streams', 'datapoints']}
+            counts['requests'] = dict(self.request_counts)
+        return counts
+
+    def close(self) -> None:
+        """Closes the store
+        """
+        with self.lock:
+            self.connection.close()
+
+
+def make_server(backend: OfflineGeoStreams, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """Returns an HTTP server that answers GeoStreams requests using the offline stand-in
+    Arguments:
+        backend: the stand-in that handles the requests
+        host: the address to listen on
+        port: the port to listen on; a free port is chosen when zero
+    Return:
+        The server, which is started by calling its serve_forever() method
+    """
+    class GeoStreamsRequestHandler(BaseHTTPRequestHandler):
+        """Passes HTTP requests to the stand-in"""
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            """Logs requests at debug level only"""
+            logging.debug("Offline GeoStreams: " + format, *args)
+
+        def send(self, response: requests.Response) -> None:
+            """Writes a stand-in response"""
+            self.send_response(response.status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response.content)))
+            self.end_headers()
+            self.wfile.write(response.content)
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """Handles GET requests"""
+            self.send(backend.get(self.path, dict(parse_qsl(urlparse(self.path).query))))
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            """Handles POST requests"""
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.send(backend.post(self.path, dict(self.headers), body))
+
+    return ThreadingHTTPServer((host, port), GeoStreamsRequestHandler)
+
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(description='Serves a local stand-in for the GeoStreams API')
+    PARSER.add_argument('--host', default='127.0.0.1', help='the address to listen on (default 127.0.0.1)')
+    PARSER.add_argument('--port', type=int, default=8000, help='the port to listen on (default 8000)')
+    PARSER.add_argument('--store', default=':memory:', help='the SQLite file to store objects in (default in memory)')
+    PARSER.add_argument('--latency', type=float, default=0.0, help='the number of seconds each request takes (default 0)')
+    ARGS = PARSER.parse_args()
+
+    SERVER = make_server(OfflineGeoStreams(ARGS.store, ARGS.latency), ARGS.host, ARGS.port)
+    print('Serving GeoStreams stand-in at http://%s:%s/' % SERVER.server_address[:2])
+    SERVER.serve_forever()
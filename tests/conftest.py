@@ -0,0 +1,98 @@
+"""Fixtures shared by the tests, which upload to the offline GeoStreams stand-in
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import benchmark
+import offline_backend
+import transformer
+import transformer_class
+
+# The size of the synthetic files uploaded by the tests
+TEST_PLOTS = 5
+TEST_TRAITS = 2
+
+
+@pytest.fixture(name='site_file')
+def fixture_site_file(tmp_path) -> str:
+    """Returns the path of a GeoJSON file of synthetic plots"""
+    file_path = str(tmp_path / 'sites.geojson')
+    benchmark.write_site_file(file_path, TEST_PLOTS)
+    return file_path
+
+
+@pytest.fixture(name='make_csv_file')
+def fixture_make_csv_file(tmp_path):
+    """Returns a function writing a CSV file of synthetic rows over the plots of the site file"""
+    def make_csv_file(row_count: int, name: str = 'traits.csv') -> str:
+        file_path = str(tmp_path / name)
+        benchmark.write_csv_file(file_path, row_count, TEST_PLOTS, TEST_TRAITS)
+        return file_path
+    return make_csv_file
+
+
+@pytest.fixture(name='run_upload')
+def fixture_run_upload(tmp_path, site_file):
+    """Returns a function running the transformer on CSV files with an offline store, returning the result"""
+    working_space = tmp_path / 'working_space'
+    working_space.mkdir()
+
+    def run_upload(file_paths: list, *options) -> dict:
+        parser = argparse.ArgumentParser()
+        parser.add_argument('--metadata', nargs='*')
+        parser.add_argument('--working_space')
+        parser.add_argument('file_list', nargs='*')
+        transformer.add_parameters(parser)
+        args = parser.parse_args(['--offline', '--offline_store', str(tmp_path / 'store.sqlite'),
+                                  '--working_space', str(working_space), '--site_file', site_file,
+                                  '--resolution_index', 'bypass'] + list(options) + list(file_paths))
+        instance = transformer_class.Transformer()
+        return transformer.perform_process(instance, **instance.get_transformer_params(args, []))
+    return run_upload
+
+
+@pytest.fixture(name='stored_datapoints')
+def fixture_stored_datapoints(tmp_path):
+    """Returns a function returning the number of datapoints, and of distinct datapoints, in the offline store"""
+    def stored_datapoints() -> tuple:
+        connection = sqlite3.connect(str(tmp_path / 'store.sqlite'))
+        try:
+            return connection.execute('SELECT COUNT(*), COUNT(DISTINCT body) FROM datapoints').fetchone()
+        finally:
+            connection.close()
+    return stored_datapoints
+
+
+@pytest.fixture(name='geostreams_server')
+def fixture_geostreams_server():
+    """Returns the offline stand-in and the Clowder URL of an HTTP server answering with it; the GeoStreams helpers use a
+       client with the default settings"""
+    stand_in = offline_backend.OfflineGeoStreams()
+    server = offline_backend.make_server(stand_in)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    yield stand_in, 'http://%s:%s/' % server.server_address[:2]
+    if transformer.__internal__.client:
+        transformer.__internal__.client.close()
+        transformer.__internal__.client = None
+    server.shutdown()
+    server.server_close()
+    stand_in.close()
+
+
+@pytest.fixture(name='offline_client')
+def fixture_offline_client(monkeypatch):
+    """Returns the offline stand-in in memory, used by the GeoStreams helpers in place of an HTTP client"""
+    stand_in = offline_backend.OfflineGeoStreams()
+    monkeypatch.setattr(transformer.__internal__, 'client', stand_in)
+    yield stand_in
+    stand_in.close()
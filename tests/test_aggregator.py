@@ -0,0 +1,68 @@
+"""Tests of rolling datapoints up into periods
+"""
+
+import pytest
+
+import transformer
+
+# The streams of the test datapoints
+STREAMS = [('7', {'type': 'Point', 'coordinates': [-111.98, 33.07, 0]})]
+
+
+@pytest.mark.parametrize('time_str, period', [
+    ('2018-06-28T12:00:00-07:00', ('2018-06-28T12:00:00-07:00', '2018-06-28T13:00:00-07:00')),
+    ('2018-06-28T12:59:59.999-07:00', ('2018-06-28T12:00:00-07:00', '2018-06-28T13:00:00-07:00')),
+    ('2018-06-28T13:00:00-07:00', ('2018-06-28T13:00:00-07:00', '2018-06-28T14:00:00-07:00')),
+    ('2018-06-28T23:30:00-07:00', ('2018-06-28T23:00:00-07:00', '2018-06-29T00:00:00-07:00')),
+    ('2018-06-28T12:30:00Z', ('2018-06-28T12:00:00+00:00', '2018-06-28T13:00:00+00:00')),
+    ('2018-06-28T12:30:00', ('2018-06-28T12:00:00+00:00', '2018-06-28T13:00:00+00:00')),
+])
+def test_hour_periods(time_str, period):
+    """Hours start on the hour in the time zone of the datapoint, and a time on the boundary starts the next hour"""
+    assert transformer.DatapointAggregator('hour').get_period(time_str) == period
+
+
+@pytest.mark.parametrize('time_str, period', [
+    ('2018-06-28T00:00:00-07:00', ('2018-06-28T00:00:00-07:00', '2018-06-29T00:00:00-07:00')),
+    ('2018-06-28T23:59:59-07:00', ('2018-06-28T00:00:00-07:00', '2018-06-29T00:00:00-07:00')),
+    ('2018-06-29T00:00:00-07:00', ('2018-06-29T00:00:00-07:00', '2018-06-30T00:00:00-07:00')),
+    ('2018-06-29T06:00:00Z', ('2018-06-29T00:00:00+00:00', '2018-06-30T00:00:00+00:00')),
+])
+def test_day_periods(time_str, period):
+    """Days start at midnight in the time zone of the datapoint"""
+    assert transformer.DatapointAggregator('day').get_period(time_str) == period
+
+
+def test_unparsable_time_has_no_period():
+    """A time that can't be parsed has no period"""
+    assert transformer.DatapointAggregator('hour').get_period('yesterday') is None
+
+
+def test_values_are_summarized_per_period_and_source():
+    """The mean, minimum, maximum and count of the values of each period and source are uploaded"""
+    aggregator = transformer.DatapointAggregator('hour')
+    for time_str, value, source in [('2018-06-28T12:00:00-07:00', '4', 'a'), ('2018-06-28T12:30:00-07:00', '1', 'a'),
+                                    ('2018-06-28T12:59:59-07:00', '7', 'a'), ('2018-06-28T13:00:00-07:00', '5', 'a'),
+                                    ('2018-06-28T12:10:00-07:00', '2', 'b')]:
+        assert aggregator.add(STREAMS, time_str, {'value': value, 'source': source})
+
+    datapoints = sorted((start_time, properties['source'], properties)
+                        for _, start_time, _, properties in aggregator.get_datapoints())
+    assert [(start_time, source) for start_time, source, _ in datapoints] == [
+        ('2018-06-28T12:00:00-07:00', 'a'), ('2018-06-28T12:00:00-07:00', 'b'), ('2018-06-28T13:00:00-07:00', 'a')]
+    assert datapoints[0][2] == {'source': 'a', 'value': 4.0, 'min': 1.0, 'max': 7.0, 'count': 3}
+    assert datapoints[1][2] == {'source': 'b', 'value': 2.0, 'min': 2.0, 'max': 2.0, 'count': 1}
+    assert datapoints[2][2]['count'] == 1
+    assert aggregator.rows_aggregated == 5
+    assert not list(aggregator.get_datapoints())
+
+
+@pytest.mark.parametrize('time_str, value', [('2018-06-28T12:00:00-07:00', 'n/a'),
+                                             ('2018-06-28T12:00:00-07:00', 'nan'),
+                                             ('not a time', '1')])
+def test_rows_that_cant_be_aggregated(time_str, value):
+    """Rows without a numeric value or a time that can be parsed aren't aggregated"""
+    aggregator = transformer.DatapointAggregator('day')
+    assert not aggregator.add(STREAMS, time_str, {'value': value, 'source': 'a'})
+    assert aggregator.rows_not_aggregated == 1
+    assert not list(aggregator.get_datapoints())
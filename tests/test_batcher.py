@@ -0,0 +1,127 @@
+"""Tests of the batching of datapoint uploads
+"""
+
+import concurrent.futures
+import json
+import random
+import threading
+import time
+
+import pytest
+
+import transformer
+
+# The geometry of the test datapoints
+POINT = {'type': 'Point', 'coordinates': [-111.98, 33.07, 0]}
+
+
+def get_time(index: int) -> str:
+    """Returns the start time of the datapoint with an index"""
+    return '2018-06-28T12:%02d:%02d-07:00' % (index // 60, index % 60)
+
+
+@pytest.fixture(name='uploads')
+def fixture_uploads(monkeypatch):
+    """Records the uploads made by batchers as (stream ID, list of datapoint JSON) tuples, taking a random time for each"""
+    uploads = []
+    lock = threading.Lock()
+    rand = random.Random(0)
+
+    def record_upload(clowder_url, clowder_key, stream_id, data_points):
+        # pylint: disable=unused-argument
+        time.sleep(rand.uniform(0, 0.002))
+        with lock:
+            uploads.append((str(stream_id), list(data_points)))
+
+    monkeypatch.setattr(transformer.__internal__, 'create_encoded_data_points', record_upload)
+    return uploads
+
+
+def get_stream_times(uploads: list, stream_id: str) -> list:
+    """Returns the start times of the datapoints uploaded to a stream, in the order they were uploaded"""
+    return [json.loads(one_point)['start_time'] for upload_stream, data_points in uploads if upload_stream == stream_id
+            for one_point in data_points]
+
+
+def test_batches_are_limited_by_size(uploads):
+    """A stream's datapoints are uploaded once the batch is full, and the remaining ones when flushed"""
+    batcher = transformer.DatapointBatcher('http://localhost/', '', batch_size=4)
+    for index in range(10):
+        batcher.add('1', POINT, get_time(index), get_time(index), {'value': str(index)})
+    assert [len(data_points) for _, data_points in uploads] == [4, 4]
+
+    batcher.flush()
+    batcher.wait()
+    assert [len(data_points) for _, data_points in uploads] == [4, 4, 2]
+    assert batcher.batch_sizes == [4, 4, 2]
+
+
+def test_batches_are_limited_by_bytes(uploads):
+    """A batch is sent before it grows past the size limit"""
+    batcher = transformer.DatapointBatcher('http://localhost/', '', batch_size=1000, max_bytes=500)
+    for index in range(10):
+        batcher.add('1', POINT, get_time(index), get_time(index), {'value': str(index)})
+    batcher.flush()
+    for _, data_points in uploads:
+        assert sum(len(one_point) + 1 for one_point in data_points) <= 500
+    assert sum(len(data_points) for _, data_points in uploads) == 10
+
+
+def test_background_uploads_keep_each_stream_in_order(uploads):
+    """Uploads made by several threads keep the datapoints of each stream in the order they were added"""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        batcher = transformer.DatapointBatcher('http://localhost/', '', batch_size=3, executor=executor, max_in_flight=6)
+        for index in range(300):
+            stream_id = str(index % 4)
+            batcher.add(stream_id, POINT, get_time(index), get_time(index), {'value': str(index)})
+        batcher.flush()
+        batcher.wait()
+
+    for stream_id in ['0', '1', '2', '3']:
+        times = get_stream_times(uploads, stream_id)
+        assert times == [get_time(index) for index in range(300) if str(index % 4) == stream_id]
+    assert not batcher.uploads
+
+
+def test_failed_upload_is_kept_and_raised(monkeypatch):
+    """A failed upload is kept by the batcher and raised by every wait(), and the stream's later batches aren't sent"""
+    uploaded = []
+
+    def failing_upload(clowder_url, clowder_key, stream_id, data_points):
+        # pylint: disable=unused-argument
+        if not uploaded and str(stream_id) == '1':
+            uploaded.append(None)
+            raise RuntimeError("Upload failed")
+        uploaded.append((str(stream_id), len(data_points)))
+
+    monkeypatch.setattr(transformer.__internal__, 'create_encoded_data_points', failing_upload)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        batcher = transformer.DatapointBatcher('http://localhost/', '', batch_size=2, executor=executor)
+        for index in range(8):
+            batcher.add(str(index % 2 + 1), POINT, get_time(index), get_time(index), {'value': str(index)})
+        batcher.flush()
+        with pytest.raises(RuntimeError):
+            batcher.wait()
+        with pytest.raises(RuntimeError):
+            batcher.wait()
+
+    # Every batch of stream 1 follows the failed one, so none are stored; stream 2 isn't affected
+    assert [one_upload for one_upload in uploaded if one_upload] == [('2', 2), ('2', 2)]
+    assert sorted((stream_id, len(data_points)) for stream_id, data_points, _ in batcher.failed) == [('1', 2), ('1', 2)]
+    assert batcher.batch_sizes == [2, 2]
+
+
+def test_failed_upload_without_executor_is_raised(monkeypatch):
+    """A failed upload made by the calling thread is raised, and raised again by wait()"""
+    def failing_upload(clowder_url, clowder_key, stream_id, data_points):
+        # pylint: disable=unused-argument
+        raise RuntimeError("Upload failed")
+
+    monkeypatch.setattr(transformer.__internal__, 'create_encoded_data_points', failing_upload)
+    batcher = transformer.DatapointBatcher('http://localhost/', '', batch_size=2)
+    batcher.add('1', POINT, get_time(0), get_time(0), {'value': '0'})
+    with pytest.raises(RuntimeError):
+        batcher.add('1', POINT, get_time(1), get_time(1), {'value': '1'})
+    with pytest.raises(RuntimeError):
+        batcher.wait()
+    assert len(batcher.failed) == 1
@@ -0,0 +1,118 @@
+"""Tests of upload checkpoints and resuming uploads
+"""
+
+import threading
+
+import pytest
+import requests
+
+import transformer
+
+# The rows of the uploaded file, and the bulk upload that fails the first time
+ROW_COUNT = 1000
+FAILED_UPLOAD = 30
+
+
+def fail_upload(monkeypatch, upload_number: int) -> None:
+    """Makes one bulk upload of datapoints fail with a server error"""
+    create_encoded_data_points = transformer.__internal__.create_encoded_data_points
+    lock = threading.Lock()
+    calls = [0]
+
+    def failing_create_encoded_data_points(*args, **kwargs):
+        with lock:
+            calls[0] += 1
+            failing = calls[0] == upload_number
+        if failing:
+            response = requests.Response()
+            response.status_code = 500
+            raise requests.HTTPError("500 Server Error", response=response)
+        return create_encoded_data_points(*args, **kwargs)
+
+    monkeypatch.setattr(transformer.__internal__, 'create_encoded_data_points', failing_create_encoded_data_points)
+
+
+@pytest.mark.parametrize('workers', ['1', '4'])
+def test_resume_after_failed_upload_stores_every_row(monkeypatch, make_csv_file, run_upload, stored_datapoints, workers):
+    """A failed upload never moves the checkpoint past datapoints that weren't stored"""
+    csv_file = make_csv_file(ROW_COUNT)
+    options = ['--checkpoint_rows', '200', '--batch_size', '10', '--workers', workers]
+    with monkeypatch.context() as patch:
+        fail_upload(patch, FAILED_UPLOAD)
+        assert run_upload([csv_file], *options)['code'] == -1001
+
+    assert run_upload([csv_file], '--resume', *options)['code'] == 0
+    total, distinct = stored_datapoints()
+    # The rows since the last checkpoint are uploaded again, so some may be stored twice, but none are missing
+    assert distinct == ROW_COUNT
+    assert total >= ROW_COUNT
+
+
+def test_resume_after_failed_upload_with_dedup_stores_each_row_once(monkeypatch, make_csv_file, run_upload,
+                                                                    stored_datapoints):
+    """Resuming with --dedup after a failed upload stores each row exactly once"""
+    csv_file = make_csv_file(ROW_COUNT)
+    options = ['--checkpoint_rows', '200', '--batch_size', '10', '--dedup']
+    with monkeypatch.context() as patch:
+        fail_upload(patch, FAILED_UPLOAD)
+        assert run_upload([csv_file], *options)['code'] == -1001
+
+    assert run_upload([csv_file], '--resume', *options)['code'] == 0
+    assert stored_datapoints() == (ROW_COUNT, ROW_COUNT)
+
+
+def test_resume_after_bad_row_stores_each_row_once(monkeypatch, make_csv_file, run_upload, stored_datapoints):
+    """Resuming after a row that can't be read continues after the rows that were uploaded"""
+    csv_file = make_csv_file(ROW_COUNT)
+    add_datapoints = transformer.__internal__.add_datapoints
+    calls = [0]
+
+    def failing_add_datapoints(*args, **kwargs):
+        calls[0] += 1
+        if calls[0] == 750:
+            raise ValueError("Bad row")
+        return add_datapoints(*args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(transformer.__internal__, 'add_datapoints', failing_add_datapoints)
+        assert run_upload([csv_file], '--checkpoint_rows', '200')['code'] == -1001
+
+    assert run_upload([csv_file], '--checkpoint_rows', '200', '--resume')['code'] == 0
+    assert stored_datapoints() == (ROW_COUNT, ROW_COUNT)
+
+
+def test_completed_file_is_skipped_on_resume(make_csv_file, run_upload, stored_datapoints):
+    """A file whose rows were all uploaded isn't uploaded again"""
+    csv_file = make_csv_file(ROW_COUNT)
+    assert run_upload([csv_file], '--checkpoint_rows', '200')['code'] == 0
+    assert run_upload([csv_file], '--checkpoint_rows', '200', '--resume')['code'] == 0
+    assert stored_datapoints() == (ROW_COUNT, ROW_COUNT)
+
+
+def test_copied_file_keeps_its_checkpoints(tmp_path, make_csv_file, run_upload, stored_datapoints):
+    """A copy of an uploaded file in another folder, with a new modification time, isn't uploaded again"""
+    csv_file = make_csv_file(ROW_COUNT)
+    assert run_upload([csv_file], '--checkpoint_rows', '200')['code'] == 0
+
+    copy_folder = tmp_path / 'copy'
+    copy_folder.mkdir()
+    copy_file = copy_folder / 'renamed.csv'
+    with open(csv_file, 'rb') as in_file:
+        copy_file.write_bytes(in_file.read())
+    assert run_upload([str(copy_file)], '--checkpoint_rows', '200', '--resume')['code'] == 0
+    assert stored_datapoints() == (ROW_COUNT, ROW_COUNT)
+
+
+def test_changed_file_has_a_new_key(tmp_path, make_csv_file):
+    """Files with the same size but different contents are identified separately"""
+    csv_file = make_csv_file(ROW_COUNT)
+    with open(csv_file, 'rb') as in_file:
+        contents = in_file.read()
+    same_file = tmp_path / 'same.csv'
+    same_file.write_bytes(contents)
+    changed_file = tmp_path / 'changed.csv'
+    changed_file.write_bytes(contents[:-3] + (b'1\r\n' if contents[-3:] != b'1\r\n' else b'2\r\n'))
+
+    file_key = transformer.CheckpointJournal.get_file_key(csv_file)
+    assert transformer.CheckpointJournal.get_file_key(str(same_file)) == file_key
+    assert transformer.CheckpointJournal.get_file_key(str(changed_file)) != file_key
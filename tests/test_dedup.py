@@ -0,0 +1,65 @@
+"""Tests of skipping datapoints that already exist
+"""
+
+import datetime
+
+import transformer
+
+# The geometry of the test sensor and stream
+POINT = {'type': 'Point', 'coordinates': [-111.98, 33.07, 0]}
+
+# The time window the existing datapoints are fetched for
+SINCE = datetime.datetime(2018, 6, 28, tzinfo=datetime.timezone.utc)
+UNTIL = datetime.datetime(2018, 6, 30, tzinfo=datetime.timezone.utc)
+
+
+def create_stream(offline_client) -> str:
+    """Creates a stream with two datapoints in the offline store, returning the ID of the stream"""
+    sensor_id = offline_client.insert('sensors', {'name': 'Test Plot'})
+    stream_id = offline_client.insert('streams', {'name': 'Test Trait (Test Plot)', 'sensor_id': sensor_id})
+    transformer.__internal__.create_data_points('http://localhost/', '', stream_id, [
+        {'start_time': '2018-06-28T12:00:00-07:00', 'end_time': '2018-06-28T12:00:00-07:00', 'type': 'Point',
+         'geometry': POINT, 'properties': {'value': '1.5', 'source': 'a'}},
+        {'start_time': '2018-06-29T12:00:00-07:00', 'end_time': '2018-06-29T12:00:00-07:00', 'type': 'Point',
+         'geometry': POINT, 'properties': {'value': '2', 'source': 'a'}}])
+    return str(stream_id)
+
+
+def test_existing_datapoints_are_found(offline_client):
+    """A datapoint with the time, value, and source of an existing one is a duplicate"""
+    stream_id = create_stream(offline_client)
+    deduplicator = transformer.DatapointDeduplicator('http://localhost/', '', slice_hours=6)
+    deduplicator.load_stream(stream_id, SINCE, UNTIL)
+
+    # Times in other time zones and values with other formatting identify the same datapoint
+    assert deduplicator.is_duplicate(stream_id, '2018-06-28T19:00:00+00:00', {'value': '1.50', 'source': 'a'})
+    assert deduplicator.is_duplicate(stream_id, '2018-06-29T12:00:00-07:00', {'value': 2.0, 'source': 'a'})
+    assert not deduplicator.is_duplicate(stream_id, '2018-06-28T12:00:00-07:00', {'value': '1.6', 'source': 'a'})
+    assert not deduplicator.is_duplicate(stream_id, '2018-06-28T12:00:00-07:00', {'value': '1.5', 'source': 'b'})
+    assert not deduplicator.is_duplicate(stream_id, '2018-06-28T12:01:00-07:00', {'value': '1.5', 'source': 'a'})
+    assert deduplicator.skipped == 2
+
+
+def test_streams_not_loaded_have_no_duplicates(offline_client):
+    """Datapoints of streams whose existing datapoints weren't fetched aren't duplicates"""
+    stream_id = create_stream(offline_client)
+    deduplicator = transformer.DatapointDeduplicator('http://localhost/', '')
+    assert not deduplicator.is_duplicate(stream_id, '2018-06-28T12:00:00-07:00', {'value': '1.5', 'source': 'a'})
+
+
+def test_removed_stream_has_no_datapoints(offline_client):
+    """A stream that no longer exists has no existing datapoints"""
+    deduplicator = transformer.DatapointDeduplicator('http://localhost/', '')
+    deduplicator.load_stream('12345', SINCE, UNTIL)
+    assert deduplicator.existing['12345'] == set()
+    assert offline_client.get_counts()['requests']
+
+
+def test_uploading_a_file_again_skips_every_row(make_csv_file, run_upload, stored_datapoints):
+    """Uploading the same file again with --dedup stores nothing new"""
+    csv_file = make_csv_file(500)
+    assert run_upload([csv_file], '--checkpoint_rows', '0')['code'] == 0
+    result = run_upload([csv_file], '--checkpoint_rows', '0', '--dedup')
+    assert result['code'] == 0
+    assert result[transformer.configuration.TRANSFORMER_NAME]['datapoints_skipped'] == '500'
+    assert stored_datapoints() == (500, 500)
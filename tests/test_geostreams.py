@@ -0,0 +1,40 @@
+"""Tests of the GeoStreams helpers
+"""
+
+import transformer
+
+# The geometry of the test sensor and stream
+POINT = {'type': 'Point', 'coordinates': [-111.98, 33.07, 0]}
+
+
+def create_stream(clowder_url: str) -> str:
+    """Creates a sensor and a stream, returning the ID of the stream"""
+    sensor_id = transformer.__internal__.create_sensor('Test Plot', clowder_url, '', POINT, {'id': 'MAC Field Scanner'},
+                                                       'Maricopa')
+    return transformer.__internal__.create_stream('Test Trait (Test Plot)', clowder_url, '', sensor_id, POINT)
+
+
+def test_create_data_points_accepts_dictionaries(geostreams_server):
+    """Data points given as dictionaries are serialized and uploaded"""
+    stand_in, clowder_url = geostreams_server
+    stream_id = create_stream(clowder_url)
+    data_points = [{'start_time': '2018-06-28T12:0%s:00-07:00' % minute, 'end_time': '2018-06-28T12:0%s:00-07:00' % minute,
+                    'type': 'Point', 'geometry': POINT, 'properties': {'value': str(minute)}} for minute in range(3)]
+    transformer.__internal__.create_data_points(clowder_url, '', stream_id, data_points)
+
+    stored = stand_in.find_datapoints(stream_id, None, None)
+    assert [one_point['properties'] for one_point in stored] == [one_point['properties'] for one_point in data_points]
+
+
+def test_create_encoded_data_points_uploads_json(geostreams_server):
+    """Data points already serialized by the batcher are uploaded as they are"""
+    stand_in, clowder_url = geostreams_server
+    stream_id = create_stream(clowder_url)
+    batcher = transformer.DatapointBatcher(clowder_url, '', batch_size=10)
+    for minute in range(3):
+        batcher.add(stream_id, POINT, '2018-06-28T12:0%s:00-07:00' % minute, '2018-06-28T12:0%s:00-07:00' % minute,
+                    {'value': str(minute)})
+    transformer.__internal__.create_encoded_data_points(clowder_url, '', stream_id, batcher.pending[str(stream_id)])
+
+    assert [one_point['properties']['value'] for one_point in stand_in.find_datapoints(stream_id, None, None)] == \
+        ['0', '1', '2']
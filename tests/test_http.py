@@ -0,0 +1,102 @@
+"""Tests of the retries made by the GeoStreams client
+"""
+
+import socket
+import threading
+
+import pytest
+import requests
+
+import transformer
+
+# The number of retries the tests allow
+RETRIES = 2
+
+
+class DroppingServer():
+    """Accepts connections, reads a request from each, and closes the connection without responding"""
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(8)
+        self.requests_received = 0
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        """Returns the URL of the server"""
+        return 'http://%s:%s/api/geostreams/datapoints/bulk' % self.listener.getsockname()
+
+    def serve(self) -> None:
+        """Answers connections until the listener is closed"""
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            with connection:
+                if connection.recv(65536):
+                    self.requests_received += 1
+
+    def close(self) -> None:
+        """Stops the server"""
+        self.listener.close()
+
+
+@pytest.fixture(name='dropping_server')
+def fixture_dropping_server():
+    """Returns a server that drops every connection after reading the request"""
+    server = DroppingServer()
+    yield server
+    server.close()
+
+
+def get_unused_url() -> str:
+    """Returns a URL that nothing listens on"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as unused:
+        unused.bind(('127.0.0.1', 0))
+        return 'http://%s:%s/api/geostreams/sensors' % unused.getsockname()
+
+
+def count_attempts(monkeypatch, client: transformer.GeoStreamsClient) -> list:
+    """Counts the attempts made by a client"""
+    attempts = []
+    send = client.send
+
+    def counted_send(method, url, retry, bytes_sent, **kwargs):
+        attempts.append(retry)
+        return send(method, url, retry, bytes_sent, **kwargs)
+
+    monkeypatch.setattr(client, 'send', counted_send)
+    return attempts
+
+
+def test_post_isnt_retried_after_the_request_was_sent(monkeypatch, dropping_server):
+    """A POST whose connection is lost after it was sent may have been processed, so it isn't sent again"""
+    client = transformer.GeoStreamsClient(retries=RETRIES, backoff=0, timeout=5)
+    attempts = count_attempts(monkeypatch, client)
+    with pytest.raises(requests.ConnectionError):
+        client.post(dropping_server.url, data=b'{"datapoints": []}')
+    client.close()
+    assert len(attempts) == 1
+
+
+def test_get_is_retried_after_the_connection_is_lost(monkeypatch, dropping_server):
+    """A GET doesn't change anything, so it's retried whenever its connection is lost"""
+    client = transformer.GeoStreamsClient(retries=RETRIES, backoff=0, timeout=5)
+    attempts = count_attempts(monkeypatch, client)
+    with pytest.raises(requests.ConnectionError):
+        client.get(dropping_server.url)
+    client.close()
+    assert len(attempts) == RETRIES + 1
+
+
+def test_post_is_retried_when_the_connection_cant_be_made(monkeypatch):
+    """A POST that never reached the server is retried"""
+    client = transformer.GeoStreamsClient(retries=RETRIES, backoff=0, timeout=5)
+    attempts = count_attempts(monkeypatch, client)
+    with pytest.raises(requests.ConnectionError):
+        client.post(get_unused_url(), data=b'{}')
+    client.close()
+    assert len(attempts) == RETRIES + 1
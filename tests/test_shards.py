@@ -0,0 +1,74 @@
+"""Tests of sharing uploads between runs
+"""
+
+import collections
+import itertools
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import transformer
+
+# The shard counts tested
+SHARD_COUNTS = [1, 2, 3, 7]
+
+
+@pytest.mark.parametrize('count', SHARD_COUNTS)
+def test_each_stream_belongs_to_one_shard(tmp_path, count):
+    """Every trait and plot belongs to exactly one shard, and the streams are spread over the shards"""
+    coordinators = [transformer.ShardCoordinator(str(tmp_path), (number, count)) for number in range(1, count + 1)]
+    streams = list(itertools.product(['trait_%s' % trait for trait in range(10)], ['Plot %s' % plot for plot in range(100)]))
+    owners = collections.Counter()
+    for trait, plot_name in streams:
+        owned_by = [one_coordinator.number for one_coordinator in coordinators if one_coordinator.owns(trait, plot_name)]
+        assert len(owned_by) == 1
+        owners[owned_by[0]] += 1
+    assert sorted(owners) == list(range(1, count + 1))
+    assert min(owners.values()) > len(streams) / count / 2
+
+
+def test_ownership_is_the_same_in_every_process(tmp_path):
+    """Ownership doesn't depend on the hash seed of the process, so runs on different nodes agree"""
+    script = ('import json, sys, transformer\n'
+              'coordinator = transformer.ShardCoordinator(sys.argv[1], (2, 3))\n'
+              'print(json.dumps([coordinator.owns("trait_1", "Plot %s" % plot) for plot in range(50)]))\n')
+    owned = []
+    for hash_seed in ['1', '2']:
+        output = subprocess.run([sys.executable, '-c', script, str(tmp_path)], check=True, capture_output=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                env=dict(os.environ, PYTHONHASHSEED=hash_seed))
+        owned.append(json.loads(output.stdout))
+    coordinator = transformer.ShardCoordinator(str(tmp_path), (2, 3))
+    assert owned[0] == owned[1] == [coordinator.owns('trait_1', 'Plot %s' % plot) for plot in range(50)]
+    assert any(owned[0]) and not all(owned[0])
+
+
+def test_shards_upload_every_row_once(tmp_path, make_csv_file, run_upload, stored_datapoints):
+    """Runs uploading each shard of a file store every datapoint, sensor, and stream once, and summarize the shards"""
+    csv_file = make_csv_file(500)
+    for number in range(1, 4):
+        result = run_upload([csv_file], '--shard', '%s/3' % number, '--checkpoint_rows', '100')
+        assert result['code'] == 0
+
+    assert stored_datapoints() == (500, 500)
+    connection = sqlite3.connect(str(tmp_path / 'store.sqlite'))
+    try:
+        sensor_names = [row[0] for row in connection.execute('SELECT name FROM sensors')]
+        stream_names = [row[0] for row in connection.execute('SELECT name FROM streams')]
+    finally:
+        connection.close()
+    assert len(sensor_names) == len(set(sensor_names)) == 5
+    assert len(stream_names) == len(set(stream_names)) == 10
+
+    summary = result[transformer.configuration.TRANSFORMER_NAME]['shard']
+    assert summary['complete'] == 'True'
+    assert summary['datapoints_uploaded'] == '500'
+    with open(summary['summary_file'], 'r') as in_file:
+        progress = json.load(in_file)['progress']
+    assert sorted(progress) == ['1', '2', '3']
+    for shard_progress in progress.values():
+        assert shard_progress['files'][os.path.basename(csv_file)]['status'] == 'complete'
@@ -0,0 +1,95 @@
+"""Tests of matching data points to plots locally
+"""
+
+import json
+
+import benchmark
+import transformer
+
+
+def make_square(min_lon: float, min_lat: float, size: float) -> list:
+    """Returns the closed ring of a square"""
+    return [[min_lon, min_lat], [min_lon + size, min_lat], [min_lon + size, min_lat + size], [min_lon, min_lat + size],
+            [min_lon, min_lat]]
+
+
+# Two adjacent plots, a plot with a hole, and a plot made of two separate polygons
+SITES = [
+    ('West', {'type': 'Polygon', 'coordinates': [make_square(-112.0, 33.0, 0.001)]}),
+    ('East', {'type': 'Polygon', 'coordinates': [make_square(-111.999, 33.0, 0.001)]}),
+    ('Ring', {'type': 'Polygon', 'coordinates': [make_square(-111.99, 33.0, 0.003), make_square(-111.989, 33.001, 0.001)]}),
+    ('Split', {'type': 'MultiPolygon', 'coordinates': [[make_square(-111.98, 33.0, 0.001)],
+                                                      [make_square(-111.97, 33.0, 0.001)]]})
+]
+
+
+def get_names(found: list) -> list:
+    """Returns the sorted names of the sites found"""
+    return sorted(site_name for site_name, _ in found)
+
+
+def test_site_index_matches_points_to_polygons():
+    """Points match the polygon containing them, and not the holes of polygons"""
+    index = transformer.SiteIndex(SITES)
+    assert get_names(index.find((33.0005, -111.9995))) == ['West']
+    assert get_names(index.find((33.0005, -111.9985))) == ['East']
+    assert get_names(index.find((33.0005, -111.9895))) == ['Ring']
+    assert get_names(index.find((33.0015, -111.9885))) == []
+    assert get_names(index.find((33.0005, -111.9795))) == ['Split']
+    assert get_names(index.find((33.0005, -111.9695))) == ['Split']
+    assert get_names(index.find((33.0005, -111.975))) == []
+    assert get_names(index.find((34.0, -112.0))) == []
+
+
+def test_site_index_returns_the_site_geometry():
+    """The GeoJSON geometry of a matched site is returned as given"""
+    index = transformer.SiteIndex(SITES)
+    assert index.find((33.0005, -111.9995)) == [SITES[0]]
+
+
+def test_site_index_ignores_unsupported_geometries():
+    """Sites that aren't polygons are left out of the index"""
+    index = transformer.SiteIndex([('Point', {'type': 'Point', 'coordinates': [-112.0, 33.0]})] + SITES)
+    assert get_names(index.find((33.0005, -111.9995))) == ['West']
+
+
+def test_file_sites_match_the_plots_of_a_geojson_file(tmp_path):
+    """The sites of a GeoJSON file are matched to the points inside them"""
+    site_file = str(tmp_path / 'sites.geojson')
+    benchmark.write_site_file(site_file, 9)
+    sites = transformer.FileSites(site_file)
+    assert len(sites.get_sites('2018-06-28')) == 9
+
+    for plot_index in range(9):
+        min_lat, min_lon, max_lat, max_lon = benchmark.get_plot_bounds(plot_index, 9)
+        found = sites.get_sites_by_latlon(((min_lat + max_lat) / 2, (min_lon + max_lon) / 2), '2018-06-28')
+        assert get_names(found) == ['Benchmark Plot %s' % plot_index]
+    assert sites.get_sites_by_latlon((0.0, 0.0), '2018-06-28') == []
+
+
+def test_file_sites_use_name_properties(tmp_path):
+    """Features with a 'name' property instead of 'sitename' are loaded"""
+    site_file = tmp_path / 'sites.json'
+    site_file.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'name': site_name}, 'geometry': geom} for site_name, geom in SITES]}))
+    sites = transformer.FileSites(str(site_file))
+    assert get_names(sites.get_sites_by_latlon((33.0005, -111.9985), '')) == ['East']
+
+
+def test_site_matcher_indexes_each_date_once():
+    """The sites of a date are fetched once and reused for every point on that date"""
+    class CountingSites():
+        """Site source counting the times its sites are fetched"""
+        def __init__(self):
+            self.fetched = []
+
+        def get_sites(self, filter_date: str) -> list:
+            self.fetched.append(filter_date)
+            return SITES
+
+    source = CountingSites()
+    matcher = transformer.SiteMatcher(source)
+    assert get_names(matcher.get_sites((33.0005, -111.9995), '2018-06-28')) == ['West']
+    assert get_names(matcher.get_sites((33.0005, -111.9985), '2018-06-28')) == ['East']
+    assert get_names(matcher.get_sites((33.0005, -111.9985), '2018-06-29')) == ['East']
+    assert source.fetched == ['2018-06-28', '2018-06-29']
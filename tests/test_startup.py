@@ -0,0 +1,24 @@
+"""Tests of the time the transformer takes to start and reject a job
+"""
+
+import benchmark
+import transformer
+
+# The most milliseconds a whole process rejecting a job may take, including interpreter startup; generous so that slow
+# test machines don't fail, while still catching heavy modules being imported at startup again
+STARTUP_BUDGET_MS = 1000
+
+
+def test_rejecting_a_job_imports_no_heavy_modules():
+    """A job without CSV files is rejected without importing requests or terrautils, and within the startup budget"""
+    startup = benchmark.measure_startup(1, 0.0)
+    assert startup['modules_at_reject'] == []
+    assert startup['reject_process_ms'] <= STARTUP_BUDGET_MS
+    assert startup['first_request_ms'] > 0
+
+
+def test_helpers_work_without_configure_run(geostreams_server):
+    """The GeoStreams helpers create a client with the default settings when the run wasn't configured"""
+    stand_in, clowder_url = geostreams_server
+    assert transformer.__internal__.get_sensor_by_name('missing', clowder_url, '') is None
+    assert stand_in.get_counts()['requests']
@@ -0,0 +1,63 @@
+"""Tests of running the transformer as a service
+"""
+
+import argparse
+import json
+import queue
+import socket
+import threading
+
+import pytest
+
+import watch_folder
+
+
+@pytest.fixture(name='service')
+def fixture_service(monkeypatch):
+    """Returns a service that doesn't prepare any clients when it runs"""
+    monkeypatch.setattr(watch_folder.transformer, 'start_service', lambda args: None)
+    monkeypatch.setattr(watch_folder.transformer, 'stop_service', lambda: None)
+    return watch_folder.UploadService(argparse.Namespace(stats_file=None, done_folder=None))
+
+
+def test_watchers_report_the_files_the_transformer_loads(tmp_path):
+    """The files reported are the ones the transformer loads, compressed ones included"""
+    for name in ['a.csv', 'b.CSV', 'c.csv.gz', 'd.txt', 'e.csv.bak']:
+        (tmp_path / name).write_text('x')
+    watcher = watch_folder.PollingWatcher(str(tmp_path), poll_interval=0, include_existing=True)
+    watcher.wait(0)
+    ready = watcher.wait(0)
+    assert sorted(file_path.rsplit('/', 1)[1] for file_path in ready) == ['a.csv', 'b.CSV', 'c.csv.gz']
+
+
+def test_queued_jobs_are_answered_when_the_service_stops(tmp_path, service):
+    """A client whose job is still queued when the service stops is sent an error instead of waiting forever"""
+    socket_path = str(tmp_path / 'jobs.sock')
+    server = watch_folder.JobServer(socket_path, service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(10)
+            client.connect(socket_path)
+            client.sendall(json.dumps({'files': ['traits.csv']}).encode('utf-8') + b'\n')
+            while not service.jobs.qsize():
+                threading.Event().wait(0.01)
+
+            service.stopping.set()
+            service.run()
+            response = json.loads(client.makefile('rb').readline())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert response == watch_folder.STOPPED_RESULT
+    assert service.get_stats()['jobs'] == 0
+
+
+def test_jobs_submitted_after_stopping_are_answered(service):
+    """A job submitted after the service stopped isn't queued and is answered right away"""
+    service.stopping.set()
+    service.run()
+    reply = queue.Queue()
+    service.submit(['traits.csv'], reply)
+    assert reply.get(timeout=1) == watch_folder.STOPPED_RESULT
+    assert not service.jobs.qsize()
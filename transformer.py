@@ -1,22 +1,78 @@
 """Loads CSV files into GeoStreams
 """
 
+from __future__ import annotations
+
 import argparse
+import bz2
+import collections
+import concurrent.futures
+import contextlib
 import csv
 import datetime
+import fcntl
+import gzip
+import hashlib
+import importlib
+import io
+import itertools
 import json
 import logging
+import math
+import mmap
+import multiprocessing
 import os
-from typing import Optional, Union
+import socket
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable, Optional, Union
 from urllib.parse import urlparse
-import requests
-
-from terrautils.betydb import get_sites_by_latlon
-from terrautils.spatial import wkt_to_geojson
 
 import configuration
 import transformer_class
 
+# Request bodies are serialized with the fastest JSON library installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+
+class LazyModule():
+    """Stands in for a module that's imported when one of its attributes is first used
+    """
+    def __init__(self, name: str):
+        """Performs initialization of class instance
+        Arguments:
+            name: the name of the module
+        """
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attribute: str):
+        """Returns an attribute of the module, importing the module if it hasn't been imported yet
+        Arguments:
+            attribute: the name of the attribute
+        """
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attribute)
+
+
+# requests and terrautils are imported when they're first used, so that jobs rejected by check_continue() start quickly
+if TYPE_CHECKING:
+    import requests
+    import urllib3
+else:
+    requests = LazyModule('requests')
+    urllib3 = LazyModule('urllib3')
+
 # Clowder and GeoStreams related definitions
 CLOWDER_DEFAULT_URL = os.environ.get('CLOWDER_URL', 'https://terraref.ncsa.illinois.edu/clowder/')
 CLOWDER_DEFAULT_KEY = os.environ.get('CLOWDER_KEY', '')
@@ -24,306 +80,3198 @@ GEOSTREAMS_API_URL_PARTICLE = 'api/geostreams'
 
 GEOSTREAMS_CSV_SENSOR_TYPE = 4
 
-class __internal__():
-    """Class for functions intended for internal use only for this file
+# Persistent sensor and stream index definitions
+RESOLUTION_INDEX_FILE_NAME = 'geostreams_index.sqlite'
+RESOLUTION_INDEX_MODES = ['use', 'bypass', 'rebuild']
+DEFAULT_RESOLUTION_INDEX_TTL_HOURS = 7 * 24
+
+# Defaults for the HTTP connections to GeoStreams
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_HTTP_TIMEOUT = 60.0
+DEFAULT_HTTP_RETRIES = 5
+DEFAULT_HTTP_BACKOFF = 0.5
+
+# Response codes for requests that are retried; POST requests are only retried when the server didn't process them, and
+# after connection errors only when the connection couldn't be made
+HTTP_RETRY_GET_CODES = [429, 500, 502, 503, 504]
+HTTP_RETRY_POST_CODES = [429, 503]
+
+# Compression of request bodies: disabled by default, the compression level used favours speed, and the codes of the
+# responses that may mean a server doesn't accept compressed bodies
+DEFAULT_HTTP_GZIP_MIN_BYTES = 0
+HTTP_GZIP_LEVEL = 3
+HTTP_GZIP_REJECTED_CODES = [400, 415]
+
+# Defaults for remembering the sites matched to data point locations
+DEFAULT_SITE_CACHE_SIZE = 4096
+DEFAULT_SITE_CACHE_PRECISION = 6
+
+# Defaults for concurrent processing
+DEFAULT_WORKERS = 1
+DEFAULT_FILE_WORKERS = 1
+UPLOADS_IN_FLIGHT_PER_WORKER = 2
+
+# Checkpoint journal definitions
+CHECKPOINT_FOLDER_NAME = 'checkpoints'
+DEFAULT_CHECKPOINT_ROWS = 50000
+
+# The number of bytes at the start and at the end of a file that identify its contents in the checkpoint journal
+CHECKPOINT_KEY_SAMPLE_BYTES = 1024 * 1024
+
+# Sharded uploads: the folder in the working space holding their lease, lock, and progress files, and the number of lock
+# files that the creation of sensors and streams is spread over
+SHARD_FOLDER_NAME = 'shards'
+SHARD_LOCK_STRIPES = 64
+
+# Number of hours of existing datapoints fetched in each request when removing duplicates
+DEFAULT_DEDUP_SLICE_HOURS = 24
+
+# The periods datapoints can be aggregated over, and the number of distinct datapoint times whose periods are remembered
+AGGREGATE_PERIODS = {'hour': datetime.timedelta(hours=1), 'day': datetime.timedelta(days=1)}
+AGGREGATE_TIME_CACHE_SIZE = 4096
+
+# Limits on the datapoints sent to GeoStreams in one bulk upload
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BATCH_MAX_BYTES = 8 * 1024 * 1024
+
+# How CSV files are read, the columns they need, and the size of the blocks read at one time by the columnar reader
+CSV_READERS = ['dict', 'columnar']
+CSV_REQUIRED_COLUMNS = ['lat', 'lon', 'dp_time', 'timestamp', 'source', 'value', 'trait']
+DEFAULT_CSV_BLOCK_BYTES = 16 * 1024 * 1024
+
+# The extensions of the CSV files loaded, with the compression of compressed files
+CSV_FILE_EXTENSIONS = {'.csv': None, '.csv.gz': 'gzip', '.csv.bz2': 'bz2', '.csv.zst': 'zstd'}
+
+# The size of the buffer used when reading zstd compressed files
+ZSTD_READ_BUFFER_BYTES = 1024 * 1024
+
+# Uncompressed files of at least this size are split into ranges of rows that are scanned by separate processes
+DEFAULT_CSV_SPLIT_BYTES = 256 * 1024 * 1024
+
+# Columns the columnar reader converts to numbers, and the pattern of the values it treats as numbers
+CSV_NUMBER_COLUMNS = ['lat', 'lon', 'value']
+CSV_NUMBER_PATTERN = r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$'
+
+# Maximum number of invalid rows described when a CSV file fails validation
+CSV_MAX_REPORTED_ERRORS = 10
+
+# Adaptive rate limiting: responses that slow the rate down, the slowest rate, how quickly the rate recovers (requests per
+# second gained each second), how much it drops, how often it may drop, and the seconds of requests that may be sent at once
+RATE_LIMIT_THROTTLE_CODES = [429, 503]
+RATE_LIMIT_MIN_RATE = 0.5
+RATE_LIMIT_INCREASE = 1.0
+RATE_LIMIT_DECREASE_FACTOR = 0.5
+RATE_LIMIT_DECREASE_INTERVAL = 1.0
+RATE_LIMIT_BURST_SECONDS = 0.5
+
+# Number of threads creating sensors and streams when warming up a season, and the file types a manifest can be saved as
+DEFAULT_WARM_UP_WORKERS = 8
+MANIFEST_FILE_EXTENSIONS = ['.json', '.geojson']
+
+# Upper bounds, in seconds, of the GeoStreams request latency histogram buckets
+HTTP_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Formats of the metrics file and the prefix of the metric names written to it
+METRICS_FORMATS = ['prometheus', 'openmetrics']
+METRICS_NAME_PREFIX = 'geostreams_upload'
+
+
+class RunMetrics():
+    """Thread safe counters and timers of the processing stages of a run and of the requests made to GeoStreams
     """
     def __init__(self):
         """Performs initialization of class instance
         """
+        self.stages = {}
+        self.requests = {}
+        self.lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float, calls: int = 1) -> None:
+        """Adds time spent in a processing stage
+        Arguments:
+            stage: the name of the stage (eg: 'csv_parse')
+            seconds: the time spent in the stage
+            calls: the number of times the stage was entered
+        """
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0, 0.0])
+            totals[0] += calls
+            totals[1] += seconds
+
+    @contextlib.contextmanager
+    def time_stage(self, stage: str):
+        """Context manager adding the time spent in its body to a processing stage
+        Arguments:
+            stage: the name of the stage
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(stage, time.perf_counter() - started)
+
+    def add_request(self, method: str, endpoint: str, seconds: float, bytes_sent: int, response: requests.Response = None,
+                    retry: bool = False) -> None:
+        """Adds a request made to a GeoStreams endpoint
+        Arguments:
+            method: the HTTP method of the request (eg: 'GET')
+            endpoint: the GeoStreams endpoint requested (eg: 'datapoints/bulk')
+            seconds: the time taken by the request
+            bytes_sent: the size of the request body
+            response: the response to the request, None if there was no response
+            retry: whether the request was a retry of a failed request
+        """
+        bucket = 0
+        while bucket < len(HTTP_LATENCY_BUCKETS) and seconds > HTTP_LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        with self.lock:
+            totals = self.requests.get((method, endpoint))
+            if totals is None:
+                totals = {'requests': 0, 'retries': 0, 'errors': 0, 'bytes_sent': 0, 'bytes_received': 0, 'seconds': 0.0,
+                          'buckets': [0] * (len(HTTP_LATENCY_BUCKETS) + 1)}
+                self.requests[(method, endpoint)] = totals
+            totals['requests'] += 1
+            totals['retries'] += 1 if retry else 0
+            totals['errors'] += 1 if response is None or response.status_code >= 400 else 0
+            totals['bytes_sent'] += bytes_sent
+            totals['bytes_received'] += len(response.content) if response is not None else 0
+            totals['seconds'] += seconds
+            totals['buckets'][bucket] += 1
+
+    def get_state(self) -> dict:
+        """Returns a copy of the counters that can be passed between processes and merged with merge()
+        """
+        with self.lock:
+            return {'stages': {stage: list(totals) for stage, totals in self.stages.items()},
+                    'requests': {key: dict(totals, buckets=list(totals['buckets'])) for key, totals in self.requests.items()}}
+
+    def merge(self, state: Optional[dict]) -> None:
+        """Adds the counters of another instance, as returned by its get_state() method
+        Arguments:
+            state: the counters to add
+        """
+        if not state:
+            return
+        for stage, (calls, seconds) in state['stages'].items():
+            self.add_stage(stage, seconds, calls)
+        with self.lock:
+            for key, other in state['requests'].items():
+                totals = self.requests.get(key)
+                if totals is None:
+                    self.requests[key] = dict(other, buckets=list(other['buckets']))
+                    continue
+                for name, value in other.items():
+                    if name == 'buckets':
+                        totals['buckets'] = [mine + theirs for mine, theirs in zip(totals['buckets'], value)]
+                    else:
+                        totals[name] += value
+
+    def get_report(self) -> dict:
+        """Returns the counters in the form used in the processing result
+        Return:
+            Returns a dictionary with the stage timers and the requests made to each endpoint
+        """
+        state = self.get_state()
+        stages = {stage: {'calls': str(calls), 'seconds': '%.3f' % seconds}
+                  for stage, (calls, seconds) in sorted(state['stages'].items())}
+        endpoints = {}
+        for (method, endpoint), totals in sorted(state['requests'].items()):
+            cumulative = 0
+            latency_buckets = {}
+            for upper_bound, count in zip(HTTP_LATENCY_BUCKETS + ['+Inf'], totals['buckets']):
+                cumulative += count
+                latency_buckets[str(upper_bound)] = str(cumulative)
+            endpoints[method + ' ' + endpoint] = {
+                'requests': str(totals['requests']),
+                'retries': str(totals['retries']),
+                'errors': str(totals['errors']),
+                'bytes_sent': str(totals['bytes_sent']),
+                'bytes_received': str(totals['bytes_received']),
+                'seconds': '%.3f' % totals['seconds'],
+                'latency_buckets': latency_buckets
+            }
+        return {'stages': stages, 'requests': endpoints}
+
+    def get_text(self, run_values: dict, open_metrics: bool = False) -> str:
+        """Returns the counters in the Prometheus text exposition format
+        Arguments:
+            run_values: additional values describing the run, written as gauges (eg: {'lines_loaded': 10})
+            open_metrics: writes the OpenMetrics format when True
+        Return:
+            Returns the text
+        """
+        lines = []
+
+        def add_family(name: str, metric_type: str, help_text: str, samples: list) -> None:
+            """Adds a metric family and its samples of (name suffix, labels, value) tuples"""
+            full_name = METRICS_NAME_PREFIX + '_' + name
+            type_name = full_name + ('_total' if metric_type == 'counter' and not open_metrics else '')
+            lines.append('# HELP %s %s' % (type_name, help_text))
+            lines.append('# TYPE %s %s' % (type_name, metric_type))
+            for suffix, labels, value in samples:
+                label_text = ','.join('%s="%s"' % (label, str(label_value).replace('\\', '\\\\').replace('"', '\\"'))
+                                      for label, label_value in labels)
+                lines.append('%s%s%s %s' % (full_name, suffix, '{' + label_text + '}' if label_text else '', repr(value)))
+
+        state = self.get_state()
+        for name, value in run_values.items():
+            add_family(name, 'gauge', name.replace('_', ' '), [('', [], value)])
+        add_family('stage_calls', 'counter', 'number of times each processing stage was entered',
+                   [('_total', [('stage', stage)], calls) for stage, (calls, _) in sorted(state['stages'].items())])
+        add_family('stage_seconds', 'counter', 'time spent in each processing stage, summed over threads',
+                   [('_total', [('stage', stage)], seconds) for stage, (_, seconds) in sorted(state['stages'].items())])
+
+        requests_by_key = sorted(state['requests'].items())
+        for name, help_text in [('http_requests', 'number of requests made to each GeoStreams endpoint'),
+                                ('http_retries', 'number of requests retried after a failure'),
+                                ('http_errors', 'number of requests that failed'),
+                                ('http_bytes_sent', 'size of the request bodies sent'),
+                                ('http_bytes_received', 'size of the response bodies received')]:
+            add_family(name, 'counter', help_text,
+                       [('_total', [('method', method), ('endpoint', endpoint)], totals[name.replace('http_', '', 1)])
+                        for (method, endpoint), totals in requests_by_key])
+
+        samples = []
+        for (method, endpoint), totals in requests_by_key:
+            labels = [('method', method), ('endpoint', endpoint)]
+            cumulative = 0
+            for upper_bound, count in zip(HTTP_LATENCY_BUCKETS + ['+Inf'], totals['buckets']):
+                cumulative += count
+                samples.append(('_bucket', labels + [('le', upper_bound)], cumulative))
+            samples.append(('_sum', labels, totals['seconds']))
+            samples.append(('_count', labels, totals['requests']))
+        add_family('http_request_duration_seconds', 'histogram', 'latency of the requests made to each GeoStreams endpoint',
+                   samples)
+
+        if open_metrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+class RateLimiter():
+    """Thread safe token bucket limiting the rate of requests to a service, and the number of requests in flight. The rate
+       is adapted to the service's responses: it's halved when the service is overloaded and grows back slowly (AIMD)
+    """
+    def __init__(self, name: str, max_rate: float = 0.0, max_in_flight: int = 0, target_latency: float = 0.0):
+        """Performs initialization of class instance
+        Arguments:
+            name: the name of the service, used when logging
+            max_rate: the highest number of requests per second; 0 for no fixed limit, in which case requests aren't
+                      limited until the service reports that it's overloaded
+            max_in_flight: the highest number of requests made at one time, 0 for no limit
+            target_latency: the number of seconds of a response after which the service is treated as overloaded, 0 to only
+                            treat throttling and connection failures as overload
+        """
+        self.name = name
+        self.max_rate = max(0.0, max_rate)
+        self.rate = self.max_rate or None
+        self.max_in_flight = max(0, max_in_flight)
+        self.target_latency = max(0.0, target_latency)
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.last_decrease = 0.0
+        self.in_flight = 0
+        self.completed = collections.deque()
+        self.throttled = 0
+        self.wait_seconds = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Waits until a request may be made
+        """
+        started = time.monotonic()
+        with self.condition:
+            while True:
+                if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                    self.condition.wait()
+                    continue
+                if self.rate is None:
+                    break
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rate * RATE_LIMIT_BURST_SECONDS),
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    break
+                self.condition.wait((1.0 - self.tokens) / self.rate)
+            self.in_flight += 1
+            self.wait_seconds += time.monotonic() - started
+
+    def release(self, latency: float, overloaded: bool = False) -> None:
+        """Records the outcome of a request made after calling acquire(), adapting the rate
+        Arguments:
+            latency: the number of seconds the request took
+            overloaded: whether the service reported that it's overloaded, or couldn't be reached
+        """
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            self.completed.append(now)
+            while self.completed and self.completed[0] < now - 1.0:
+                self.completed.popleft()
+
+            if overloaded or (self.target_latency and latency > self.target_latency):
+                self.throttled += 1
+                if now - self.last_decrease >= RATE_LIMIT_DECREASE_INTERVAL:
+                    # Start from the rate requests were completing at when there's no limit yet
+                    current_rate = self.rate if self.rate is not None else len(self.completed)
+                    self.rate = max(RATE_LIMIT_MIN_RATE, current_rate * RATE_LIMIT_DECREASE_FACTOR)
+                    self.tokens = min(self.tokens, 1.0)
+                    self.last_decrease = now
+                    logging.info("Slowing %s requests to %.1f per second", self.name, self.rate)
+            elif self.rate is not None:
+                self.rate += RATE_LIMIT_INCREASE / max(self.rate, 1.0)
+                if self.max_rate:
+                    self.rate = min(self.rate, self.max_rate)
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def limit(self):
+        """Context manager waiting until a request may be made, and recording the outcome of the request made in its body;
+           requests raising an HTTP error with a throttling status, or a connection error, are treated as overload
+        """
+        self.acquire()
+        started = time.monotonic()
+        overloaded = False
+        try:
+            yield
+        except requests.ConnectionError:
+            overloaded = True
+            raise
+        except requests.HTTPError as ex:
+            overloaded = getattr(ex.response, 'status_code', None) in RATE_LIMIT_THROTTLE_CODES
+            raise
+        finally:
+            self.release(time.monotonic() - started, overloaded)
+
+    def get_report(self) -> dict:
+        """Returns the state of the limiter in the form used in the processing result
+        """
+        with self.condition:
+            return {'rate': '%.1f' % self.rate if self.rate is not None else 'unlimited',
+                    'throttled': str(self.throttled),
+                    'wait_seconds': '%.3f' % self.wait_seconds}
+
+
+class GeoStreamsClient():
+    """Connection pooled HTTP client that retries failed requests with exponential backoff
+    """
+    def __init__(self, pool_size: int = DEFAULT_HTTP_POOL_SIZE, timeout: float = DEFAULT_HTTP_TIMEOUT,
+                 retries: int = DEFAULT_HTTP_RETRIES, backoff: float = DEFAULT_HTTP_BACKOFF, metrics: RunMetrics = None,
+                 gzip_min_bytes: int = DEFAULT_HTTP_GZIP_MIN_BYTES, limiter: RateLimiter = None):
+        """Performs initialization of class instance
+        Arguments:
+            pool_size: the maximum number of connections kept open to a host
+            timeout: the number of seconds to wait for a connection or a response
+            retries: the number of times a failed request is retried
+            backoff: the number of seconds to wait before the first retry; the wait doubles for each following retry
+            metrics: each request is counted and timed when specified
+            gzip_min_bytes: POST bodies of at least this size are compressed with gzip; 0 disables compression
+            limiter: each request waits for the rate limiter when specified
+        """
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.metrics = metrics
+        self.gzip_min_bytes = max(0, gzip_min_bytes)
+        self.limiter = limiter
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_retry_wait(self, attempt: int, response: requests.Response = None) -> float:
+        """Returns the number of seconds to wait before retrying a request
+        Arguments:
+            attempt: the number of the attempt that failed, starting at 0
+            response: the response of the failed attempt, if there was one
+        Return:
+            The number of seconds to wait
+        """
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * (2 ** attempt)
 
     @staticmethod
-    def get_geostreams_api_url(base_url: str, url_particles: Union[str, tuple, None]) -> str:
-        """Returns the URL constructed from parameters
+    def get_endpoint(url: str) -> str:
+        """Returns the GeoStreams endpoint of a URL, used to group request metrics
         Arguments:
-            base_url: the base URL (assumes scheme:[//authority] with optional path)
-            url_particles: additional strings to append to the end of the base url
+            url: the URL of the request
         Return:
-            Returns the formatted URL (guaranteed to not have a trailing slash)
+            Returns the endpoint (eg: 'datapoints/bulk')
         """
-        def url_join(base_url: str, url_parts: tuple) -> str:
-            """Internal function to create URLs in a consistent fashion
-            Arguments:
-                base_url: the starting part of the URL
-                url_parts: the parts of the URL to join
-            Return:
-                The formatted URL
-            """
-            built_url = ''
-            base_parse = urlparse(base_url)
-            if base_parse.scheme:
-                built_url = base_parse.scheme + '://'
-            if base_parse.netloc:
-                built_url += base_parse.netloc + '/'
-            if base_parse.path and not base_parse.path == '/':
-                built_url += base_parse.path.lstrip('/') + '/'
+        path = urlparse(url).path
+        particle_index = path.find(GEOSTREAMS_API_URL_PARTICLE)
+        if particle_index >= 0:
+            path = path[particle_index + len(GEOSTREAMS_API_URL_PARTICLE):]
+        return path.strip('/')
+
+    def send(self, method: str, url: str, retry: bool, bytes_sent: int, **kwargs) -> requests.Response:
+        """Makes one attempt at a request, waiting for the rate limiter and recording the request's metrics
+        Arguments:
+            method: the HTTP method of the request
+            url: the URL to request
+            retry: whether the attempt is a retry
+            bytes_sent: the size of the request body
+            kwargs: additional parameters for requests.Session.request
+        Return:
+            Returns the response
+        """
+        if self.limiter:
+            self.limiter.acquire()
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            if self.limiter:
+                self.limiter.release(elapsed, response is None or response.status_code in RATE_LIMIT_THROTTLE_CODES)
+            if self.metrics:
+                self.metrics.add_request(method.upper(), self.get_endpoint(url), elapsed, bytes_sent, response, retry)
+
+    @staticmethod
+    def is_unsent_error(ex: Exception) -> bool:
+        """Returns whether a connection error happened before the request was sent, so the server can't have processed it
+        Arguments:
+            ex: the requests.ConnectionError raised by the request
+        Return:
+            Returns True if the connection couldn't be made, and False if it may have failed after the request was sent
+        """
+        if isinstance(ex, requests.ConnectTimeout):
+            return True
+        reason = getattr(ex.args[0], 'reason', None) if ex.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Makes an HTTP request, retrying on connection errors and on responses indicating a temporary problem
+        Arguments:
+            method: the HTTP method of the request (eg: 'GET')
+            url: the URL to request
+            kwargs: additional parameters for requests.Session.request
+        Return:
+            Returns the response to the last attempt
+        Exceptions:
+            Raises requests.ConnectionError when the last attempt can't connect, or when a request other than a GET loses
+            its connection after the request may have been sent
+        Notes:
+            Requests other than GETs create objects, so they're only retried when the server can't have processed them
+        """
+        retry_codes = HTTP_RETRY_GET_CODES if method.upper() == 'GET' else HTTP_RETRY_POST_CODES
+        kwargs.setdefault('timeout', self.timeout)
+        body = kwargs.get('data')
+        bytes_sent = len(body) if isinstance(body, (str, bytes)) else 0
+        attempt = 0
+        while True:
+            try:
+                response = self.send(method, url, attempt > 0, bytes_sent, **kwargs)
+            except requests.ConnectionError as ex:
+                if attempt >= self.retries or (method.upper() != 'GET' and not self.is_unsent_error(ex)):
+                    raise
+                response = None
+                logging.warning("Unable to connect for %s request, retrying", method)
+            else:
+                if response.status_code not in retry_codes or attempt >= self.retries:
+                    return response
+                logging.warning("Received status %s for %s request, retrying", response.status_code, method)
+
+            time.sleep(self.get_retry_wait(attempt, response))
+            attempt += 1
+
+    def get(self, url: str, params: dict = None) -> requests.Response:
+        """Makes a GET request
+        Arguments:
+            url: the URL to request
+            params: the query parameters of the request
+        Return:
+            Returns the response
+        """
+        return self.request('GET', url, params=params)
+
+    def post(self, url: str, headers: dict = None, data=None) -> requests.Response:
+        """Makes a POST request, compressing large bodies when enabled
+        Arguments:
+            url: the URL to request
+            headers: the headers of the request
+            data: the body of the request
+        Return:
+            Returns the response
+        Notes:
+            When a compressed request is rejected and the same request succeeds uncompressed, compression is turned off
+            for the following requests
+        """
+        if not self.gzip_min_bytes or not isinstance(data, (str, bytes)) or len(data) < self.gzip_min_bytes:
+            return self.request('POST', url, headers=headers, data=data)
+
+        body = data.encode('utf-8') if isinstance(data, str) else data
+        response = self.request('POST', url, headers=dict(headers or {}, **{'Content-Encoding': 'gzip'}),
+                                data=gzip.compress(body, HTTP_GZIP_LEVEL))
+        if response.status_code not in HTTP_GZIP_REJECTED_CODES:
+            return response
+
+        response = self.request('POST', url, headers=headers, data=data)
+        if response.status_code < 400:
+            logging.warning("GeoStreams doesn't accept compressed requests, sending requests uncompressed")
+            self.gzip_min_bytes = 0
+        return response
+
+    def close(self) -> None:
+        """Closes the pooled connections
+        """
+        self.session.close()
+
+
+class LruCache():
+    """Bounded cache that discards the least recently used entries
+    """
+    def __init__(self, max_size: int):
+        """Performs initialization of class instance
+        Arguments:
+            max_size: the maximum number of entries to keep; nothing is cached if zero or less
+        """
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns a cached value
+        Arguments:
+            key: the key of the value
+        Return:
+            Returns the value, or None if it's not cached
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value) -> None:
+        """Adds a value to the cache
+        Arguments:
+            key: the key of the value
+            value: the value to cache
+        """
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Removes all cached values
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+class SiteIndex():
+    """Grid based spatial index of plot polygons used to match points to sites locally
+    """
+    def __init__(self, sites: list):
+        """Performs initialization of class instance
+        Arguments:
+            sites: list of (site name, GeoJSON geometry) tuples to index; geometries are Polygons or MultiPolygons
+        """
+        self.sites = []
+        extents = []
+        for site_name, geom in sites:
+            polygons = SiteIndex.get_polygons(geom)
+            if not polygons:
+                logging.warning("Ignoring site '%s' with unsupported geometry", site_name)
+                continue
+            points = [point for polygon in polygons for point in polygon[0]]
+            bounds = (min(pt[0] for pt in points), min(pt[1] for pt in points),
+                      max(pt[0] for pt in points), max(pt[1] for pt in points))
+            self.sites.append((site_name, geom, polygons, bounds))
+            extents.append(max(bounds[2] - bounds[0], bounds[3] - bounds[1]))
+
+        # Size the grid cells to the typical site so that each cell only references a few sites
+        extents = sorted(extent for extent in extents if extent > 0)
+        self.cell_size = extents[len(extents) // 2] if extents else 1.0
+        self.cells = {}
+        for idx, one_site in enumerate(self.sites):
+            min_x, min_y = self.get_cell(one_site[3][0], one_site[3][1])
+            max_x, max_y = self.get_cell(one_site[3][2], one_site[3][3])
+            for cell_x in range(min_x, max_x + 1):
+                for cell_y in range(min_y, max_y + 1):
+                    self.cells.setdefault((cell_x, cell_y), []).append(idx)
+
+    @staticmethod
+    def get_polygons(geom: dict) -> list:
+        """Returns the list of polygons making up a GeoJSON geometry
+        Arguments:
+            geom: the GeoJSON geometry
+        Return:
+            Returns a list of polygons as lists of rings, or an empty list if the geometry isn't supported
+        """
+        geom_type = geom.get('type') if isinstance(geom, dict) else None
+        if geom_type == 'Polygon':
+            return [geom['coordinates']]
+        if geom_type == 'MultiPolygon':
+            return list(geom['coordinates'])
+        return []
+
+    @staticmethod
+    def ring_contains(ring: list, x: float, y: float) -> bool:
+        """Returns whether a point lies within a linear ring
+        Arguments:
+            ring: the list of ring coordinates
+            x: the X coordinate (longitude) of the point
+            y: the Y coordinate (latitude) of the point
+        Return:
+            Returns True if the point is in the ring and False otherwise
+        """
+        inside = False
+        prev_x, prev_y = ring[-1][0], ring[-1][1]
+        for point in ring:
+            cur_x, cur_y = point[0], point[1]
+            if (cur_y > y) != (prev_y > y) and x < (prev_x - cur_x) * (y - cur_y) / (prev_y - cur_y) + cur_x:
+                inside = not inside
+            prev_x, prev_y = cur_x, cur_y
+        return inside
+
+    def get_cell(self, x: float, y: float) -> tuple:
+        """Returns the grid cell containing a point
+        Arguments:
+            x: the X coordinate (longitude) of the point
+            y: the Y coordinate (latitude) of the point
+        Return:
+            Returns the (column, row) tuple of the cell
+        """
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def find(self, lat_lon: tuple) -> list:
+        """Returns the sites containing a point
+        Arguments:
+            lat_lon: [latitude, longitude] tuple of the point
+        Return:
+            Returns the list of (site name, GeoJSON geometry) tuples of the sites containing the point
+        """
+        y, x = float(lat_lon[0]), float(lat_lon[1])
+        found = []
+        for idx in self.cells.get(self.get_cell(x, y), []):
+            site_name, geom, polygons, bounds = self.sites[idx]
+            if not bounds[0] <= x <= bounds[2] or not bounds[1] <= y <= bounds[3]:
+                continue
+            for polygon in polygons:
+                if SiteIndex.ring_contains(polygon[0], x, y) and \
+                        not any(SiteIndex.ring_contains(hole, x, y) for hole in polygon[1:]):
+                    found.append((site_name, geom))
+                    break
+        return found
+
+
+class BetydbSites():
+    """Site source that queries BETYdb
+    """
+    @staticmethod
+    def get_sites(filter_date: str) -> list:
+        """Returns all the sites for a date
+        Arguments:
+            filter_date: date used to restrict the sites returned from BETYdb
+        Return:
+            Returns the list of (site name, GeoJSON geometry) tuples
+        """
+        # pylint: disable=import-outside-toplevel
+        from terrautils.betydb import get_sites
+        logging.info("Fetching sites for date '%s' from BETYdb", filter_date)
+        with __internal__.betydb_limiter.limit():
+            sites = get_sites(filter_date)
+        return [(one_site['sitename'], __internal__.parse_site_geometry(one_site['geometry'])) for one_site in sites]
+
+    @staticmethod
+    def get_sites_by_latlon(lat_lon: tuple, filter_date: str) -> list:
+        """Returns the sites containing a point
+        Arguments:
+            lat_lon: [latitude, longitude] tuple of the point
+            filter_date: date used to restrict the sites returned from BETYdb
+        Return:
+            Returns the list of (site name, GeoJSON geometry) tuples
+        """
+        # pylint: disable=import-outside-toplevel
+        from terrautils.betydb import get_sites_by_latlon
+        with __internal__.betydb_limiter.limit():
+            sites = get_sites_by_latlon(lat_lon, filter_date)
+        return [(one_site['sitename'], __internal__.parse_site_geometry(one_site['geometry'])) for one_site in sites]
+
+
+class FileSites():
+    """Site source that loads the sites from a local file, allowing sites to be matched offline
+    """
+    def __init__(self, site_file: str):
+        """Performs initialization of class instance
+        Arguments:
+            site_file: the path of a GeoJSON FeatureCollection with 'sitename' (or 'name') properties, or of a
+                       CSV file with 'sitename' and 'geometry' (WKT) columns
+        """
+        self.site_file = site_file
+        self.sites = None
+        self.index = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load_site_file(site_file: str) -> list:
+        """Loads the sites in a file
+        Arguments:
+            site_file: the path of a GeoJSON FeatureCollection with 'sitename' (or 'name') properties, or of a
+                       CSV file with 'sitename' and 'geometry' (WKT) columns
+        Return:
+            Returns the list of (site name, GeoJSON geometry) tuples
+        """
+        if os.path.splitext(site_file)[1].lower() in ['.json', '.geojson']:
+            with open(site_file, 'r') as in_file:
+                features = json.load(in_file).get('features', [])
+            return [(one_feature['properties'].get('sitename', one_feature['properties'].get('name')), one_feature['geometry'])
+                    for one_feature in features]
+
+        with open(site_file, 'r') as in_file:
+            return [(row['sitename'], __internal__.parse_site_geometry(row['geometry'])) for row in csv.DictReader(in_file)]
+
+    def get_sites(self, filter_date: str) -> list:
+        """Returns all the sites in the file
+        Arguments:
+            filter_date: ignored since the file holds the sites for one date
+        Return:
+            Returns the list of (site name, GeoJSON geometry) tuples
+        """
+        # pylint: disable=unused-argument
+        with self.lock:
+            if self.sites is None:
+                logging.info("Loading sites from file '%s'", self.site_file)
+                self.sites = FileSites.load_site_file(self.site_file)
+            return self.sites
+
+    def get_sites_by_latlon(self, lat_lon: tuple, filter_date: str) -> list:
+        """Returns the sites containing a point
+        Arguments:
+            lat_lon: [latitude, longitude] tuple of the point
+            filter_date: ignored since the file holds the sites for one date
+        Return:
+            Returns the list of (site name, GeoJSON geometry) tuples
+        """
+        sites = self.get_sites(filter_date)
+        with self.lock:
+            if self.index is None:
+                self.index = SiteIndex(sites)
+        return self.index.find(lat_lon)
+
+
+class SiteMatcher():
+    """Matches points to sites using spatial indexes of sites fetched once for each date
+    """
+    def __init__(self, site_source=None):
+        """Performs initialization of class instance
+        Arguments:
+            site_source: the BetydbSites or FileSites instance to fetch sites from; BETYdb is used by default
+        """
+        self.site_source = site_source if site_source is not None else BetydbSites()
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def get_index(self, filter_date: str) -> SiteIndex:
+        """Returns the spatial index of the sites for a date, fetching the sites if needed
+        Arguments:
+            filter_date: date used to restrict the sites returned
+        Return:
+            Returns the spatial index
+        """
+        with self.lock:
+            if filter_date not in self.indexes:
+                self.indexes[filter_date] = SiteIndex(self.site_source.get_sites(filter_date))
+            return self.indexes[filter_date]
+
+    def get_sites(self, lat_lon: tuple, filter_date: str) -> list:
+        """Returns the sites containing a point
+        Arguments:
+            lat_lon: [latitude, longitude] tuple of the point
+            filter_date: date used to restrict the sites returned
+        Return:
+            Returns the list of (site name, GeoJSON geometry) tuples of the sites containing the point
+        """
+        return self.get_index(filter_date).find(lat_lon)
+
+
+class ResolutionIndex():
+    """Persistent index of GeoStreams sensor and stream names to their information, shared across runs
+    """
+    def __init__(self, index_path: str, clowder_url: str, ttl_seconds: float = DEFAULT_RESOLUTION_INDEX_TTL_HOURS * 3600):
+        """Performs initialization of class instance
+        Arguments:
+            index_path: the path to the index file
+            clowder_url: the URL of the Clowder instance the index entries belong to
+            ttl_seconds: the number of seconds an entry is considered valid after it's stored
+        """
+        self.clowder_url = clowder_url
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(index_path, timeout=60, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS resolved (clowder_url TEXT, endpoint TEXT, name TEXT, '
+                                    'info TEXT, updated REAL, PRIMARY KEY (clowder_url, endpoint, name))')
+
+    def get(self, url_endpoint: str, name: str) -> Optional[dict]:
+        """Returns the stored information on a named GeoStreams object
+        Arguments:
+            url_endpoint: the endpoint of the object (eg: 'streams')
+            name: the name of the object
+        Return:
+            Returns the stored information or None if the object isn't stored or its entry has expired
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT info FROM resolved WHERE clowder_url=? AND endpoint=? AND name=? AND updated>=?',
+                                          (self.clowder_url, url_endpoint, name, time.time() - self.ttl_seconds)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, url_endpoint: str, name: str, info: dict) -> None:
+        """Stores the information on a named GeoStreams object
+        Arguments:
+            url_endpoint: the endpoint of the object (eg: 'streams')
+            name: the name of the object
+            info: the object's information
+        """
+        stored = {key: info[key] for key in ('id', 'name', 'geometry', 'sensor_id') if key in info}
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO resolved VALUES (?, ?, ?, ?, ?)',
+                                    (self.clowder_url, url_endpoint, name, json.dumps(stored), time.time()))
+
+    def evict(self, url_endpoint: str, name: str) -> None:
+        """Removes a named GeoStreams object from the index
+        Arguments:
+            url_endpoint: the endpoint of the object (eg: 'streams')
+            name: the name of the object
+        """
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM resolved WHERE clowder_url=? AND endpoint=? AND name=?',
+                                    (self.clowder_url, url_endpoint, name))
+
+    def clear(self) -> None:
+        """Removes all the entries belonging to the Clowder instance from the index
+        """
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM resolved WHERE clowder_url=?', (self.clowder_url,))
+
+    def close(self) -> None:
+        """Closes the index file
+        """
+        with self.lock:
+            self.connection.close()
+
+
+class ResolutionCache():
+    """Remembers the GeoStreams sensors and streams found or created during a run
+    """
+    def __init__(self, index: ResolutionIndex = None):
+        """Performs initialization of class instance
+        Arguments:
+            index: optional persistent index to consult when an object isn't in memory
+        """
+        self.index = index
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.index_hits = 0
+        self.lock = threading.Lock()
+        self.name_locks = {}
+
+    def get(self, url_endpoint: str, name: str) -> Optional[dict]:
+        """Returns the cached information on a named GeoStreams object
+        Arguments:
+            url_endpoint: the endpoint of the object (eg: 'streams')
+            name: the name of the object
+        Return:
+            Returns the cached information or None if the object isn't cached
+        """
+        with self.lock:
+            found = self.entries.get((url_endpoint, name))
+            if found is not None:
+                self.hits += 1
+                return found
+
+        found = self.index.get(url_endpoint, name) if self.index else None
+        with self.lock:
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.index_hits += 1
+                self.entries[(url_endpoint, name)] = found
+        return found
+
+    def put(self, url_endpoint: str, name: str, info: dict) -> None:
+        """Adds the information on a named GeoStreams object to the cache
+        Arguments:
+            url_endpoint: the endpoint of the object (eg: 'streams')
+            name: the name of the object
+            info: the object's information; must contain an 'id' key
+        """
+        if not info or info.get('id') is None:
+            return
+        with self.lock:
+            self.entries[(url_endpoint, name)] = info
+        if self.index:
+            self.index.put(url_endpoint, name, info)
+
+    def evict(self, url_endpoint: str, name: str) -> None:
+        """Removes a named GeoStreams object from the cache and any persistent index
+        Arguments:
+            url_endpoint: the endpoint of the object (eg: 'streams')
+            name: the name of the object
+        """
+        with self.lock:
+            self.entries.pop((url_endpoint, name), None)
+        if self.index:
+            self.index.evict(url_endpoint, name)
+
+    def name_lock(self, url_endpoint: str, name: str) -> threading.Lock:
+        """Returns the lock used to make sure that only one thread at a time resolves a named GeoStreams object
+        Arguments:
+            url_endpoint: the endpoint of the object (eg: 'streams')
+            name: the name of the object
+        Return:
+            The lock for the object
+        """
+        with self.lock:
+            return self.name_locks.setdefault((url_endpoint, name), threading.Lock())
+
+    def close(self) -> None:
+        """Releases the persistent index, if there is one
+        """
+        if self.index:
+            self.index.close()
+            self.index = None
+
+    def evict_id(self, url_endpoint: str, object_id: str) -> Optional[dict]:
+        """Removes a GeoStreams object from the cache and any persistent index by its ID
+        Arguments:
+            url_endpoint: the endpoint of the object (eg: 'streams')
+            object_id: the ID of the object
+        Return:
+            Returns the information of the removed object, or None if the object wasn't in memory
+        """
+        with self.lock:
+            found = None
+            for key, info in self.entries.items():
+                if key[0] == url_endpoint and str(info.get('id')) == str(object_id):
+                    found = (key, info)
+                    break
+        if not found:
+            return None
+        self.evict(url_endpoint, found[0][1])
+        return found[1]
+
+
+class CheckpointJournal():
+    """Records how far the upload of a CSV file has progressed, identifying the file by its contents
+    """
+    def __init__(self, journal_folder: str, file_path: str):
+        """Performs initialization of class instance
+        Arguments:
+            journal_folder: the folder to store the journal in
+            file_path: the path of the CSV file
+        """
+        self.file_path = file_path
+        self.journal_path = os.path.join(journal_folder, CheckpointJournal.get_file_key(file_path) + '.json')
+
+    @staticmethod
+    def get_file_key(file_path: str) -> str:
+        """Returns a key identifying a file by its contents
+        Arguments:
+            file_path: the path of the file
+        Return:
+            The hex digest of the SHA-256 hash of the file's size and of the contents at its start and end
+        Notes:
+            Only the start and the end of the file are read, so that opening the journal of a large file is quick; a copy
+            of the file has the same key wherever it is, while files with different contents have different keys
+        """
+        content_hash = hashlib.sha256()
+        with open(file_path, 'rb') as in_file:
+            file_size = os.fstat(in_file.fileno()).st_size
+            content_hash.update(str(file_size).encode('utf-8') + b'\n')
+            content_hash.update(in_file.read(CHECKPOINT_KEY_SAMPLE_BYTES))
+            if file_size > CHECKPOINT_KEY_SAMPLE_BYTES:
+                in_file.seek(max(CHECKPOINT_KEY_SAMPLE_BYTES, file_size - CHECKPOINT_KEY_SAMPLE_BYTES))
+                content_hash.update(in_file.read(CHECKPOINT_KEY_SAMPLE_BYTES))
+        return content_hash.hexdigest()
+
+    def load(self) -> dict:
+        """Returns the last checkpoint recorded for the file
+        Return:
+            Returns a dictionary with the byte 'offset' of the next row to upload, the number of 'rows' uploaded, and whether
+            the upload is 'complete'
+        """
+        checkpoint = {'offset': 0, 'rows': 0, 'complete': False}
+        if os.path.exists(self.journal_path):
+            try:
+                with open(self.journal_path, 'r') as in_file:
+                    checkpoint.update(json.load(in_file))
+            except (OSError, ValueError):
+                logging.exception("Unable to read checkpoint journal '%s', starting from the beginning", self.journal_path)
+        return checkpoint
+
+    def save(self, offset: int, rows: int, complete: bool = False) -> None:
+        """Records a checkpoint for the file
+        Arguments:
+            offset: the byte offset of the next row to upload
+            rows: the number of rows uploaded
+            complete: whether all the rows have been uploaded
+        """
+        temp_path = self.journal_path + '.tmp'
+        with open(temp_path, 'w') as out_file:
+            json.dump({'file': self.file_path, 'offset': offset, 'rows': rows, 'complete': complete,
+                       'updated': datetime.datetime.utcnow().isoformat()}, out_file)
+        os.replace(temp_path, self.journal_path)
+
+
+class ShardCoordinator():
+    """Coordinates the runs uploading shares of the same CSV files through lease, lock, and progress files in a working
+       space shared by the runs
+    """
+    def __init__(self, working_space: str, shard: tuple):
+        """Performs initialization of class instance
+        Arguments:
+            working_space: the working space shared by the runs
+            shard: the (shard number, shard count) tuple of this run, with shard numbers starting at 1
+        """
+        self.folder = os.path.join(working_space, SHARD_FOLDER_NAME)
+        self.number, self.count = shard
+        self.run_folder = None
+        self.lease_file = None
+        self.stripe_locks = [threading.Lock() for _ in range(SHARD_LOCK_STRIPES)]
+        self.progress_lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+
+    @staticmethod
+    def get_hash(*values) -> int:
+        """Returns a hash of values that's the same in every process, unlike hash()
+        Arguments:
+            values: the strings to hash
+        """
+        return int.from_bytes(hashlib.blake2b('\n'.join(values).encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def owns(self, trait: str, plot_name: str) -> bool:
+        """Returns whether the stream of a trait at a plot belongs to this shard
+        Arguments:
+            trait: the name of the trait
+            plot_name: the name of the plot
+        """
+        return ShardCoordinator.get_hash(trait, plot_name) % self.count == self.number - 1
+
+    @contextlib.contextmanager
+    def creation_lock(self, url_endpoint: str, name: str):
+        """Context manager holding the lock that runs take before creating a named GeoStreams object, so that only one of
+           them creates it
+        Arguments:
+            url_endpoint: the endpoint of the object (eg: 'streams')
+            name: the name of the object
+        Notes:
+            File locks are held by a process, so a thread lock keeps the threads of a process from sharing a lock file
+        """
+        stripe = ShardCoordinator.get_hash(url_endpoint, name) % SHARD_LOCK_STRIPES
+        with self.stripe_locks[stripe], open(os.path.join(self.folder, 'create-%02d.lock' % stripe), 'a') as lock_file:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(lock_file, fcntl.LOCK_UN)
+
+    def start(self, file_paths: list) -> None:
+        """Takes the lease on this shard of a set of CSV files; the lease is held until finish() is called or the process
+           ends
+        Arguments:
+            file_paths: the paths of the CSV files
+        Exceptions:
+            Raises RuntimeError if another run holds the lease
+        """
+        run_hash = hashlib.sha256()
+        for one_file in sorted(file_paths, key=os.path.basename):
+            run_hash.update(('%s\n%s\n' % (os.path.basename(one_file), os.path.getsize(one_file))).encode('utf-8'))
+        self.run_folder = os.path.join(self.folder, '%s-of-%s' % (run_hash.hexdigest()[:16], self.count))
+        os.makedirs(self.run_folder, exist_ok=True)
+
+        lease_file = open(os.path.join(self.run_folder, 'shard-%s.lease' % self.number), 'a+')
+        try:
+            fcntl.lockf(lease_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as ex:
+            lease_file.close()
+            raise RuntimeError("Shard %s/%s of these files is already being uploaded by another run" %
+                               (self.number, self.count)) from ex
+        lease_file.truncate(0)
+        lease_file.write(json.dumps({'host': socket.gethostname(), 'pid': os.getpid(),
+                                     'started': datetime.datetime.utcnow().isoformat()}))
+        lease_file.flush()
+        self.lease_file = lease_file
+        self.save_progress({'status': 'running', 'csv_files': len(file_paths)})
+
+    def save_progress(self, progress: dict, file_path: str = None) -> None:
+        """Records the progress of this shard, or of one of its CSV files
+        Arguments:
+            progress: the values to record; the 'status' of the shard when no file is specified
+            file_path: the path of the CSV file the progress is of; the progress of the shard's files is kept when the
+                       progress of the shard is recorded
+        Notes:
+            The processes uploading the shard's files record their progress in the same file, so it's updated under a lock
+        """
+        progress_path = os.path.join(self.run_folder, 'shard-%s.json' % self.number)
+        with self.progress_lock, open(os.path.join(self.run_folder, 'shard-%s.lock' % self.number), 'a') as lock_file:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX)
+            try:
+                saved = {}
+                if os.path.exists(progress_path):
+                    try:
+                        with open(progress_path, 'r') as in_file:
+                            saved = json.load(in_file)
+                    except (OSError, ValueError):
+                        logging.exception("Unable to read shard progress '%s', starting it afresh", progress_path)
+                files = saved.get('files', {})
+                if file_path:
+                    files[os.path.basename(file_path)] = dict(progress, updated=datetime.datetime.utcnow().isoformat())
+                    progress = {key: value for key, value in saved.items() if key != 'files'}
+                temp_path = progress_path + '.tmp'
+                with open(temp_path, 'w') as out_file:
+                    json.dump(dict(progress, shard='%s/%s' % (self.number, self.count), host=socket.gethostname(),
+                                   updated=datetime.datetime.utcnow().isoformat(), files=files), out_file)
+                os.replace(temp_path, progress_path)
+            finally:
+                fcntl.lockf(lock_file, fcntl.LOCK_UN)
+
+    def is_abandoned(self, number: int) -> bool:
+        """Returns whether a shard's lease isn't held, meaning the run uploading it ended without finishing
+        Arguments:
+            number: the number of the shard
+        Notes:
+            File locks are held by a process, so the lease of a shard uploaded by this process always appears to be free
+        """
+        lease_path = os.path.join(self.run_folder, 'shard-%s.lease' % number)
+        if number == self.number or not os.path.exists(lease_path):
+            return False
+        with open(lease_path, 'a') as lease_file:
+            try:
+                fcntl.lockf(lease_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+            fcntl.lockf(lease_file, fcntl.LOCK_UN)
+        return True
+
+    def finish(self, progress: dict) -> dict:
+        """Records the final progress of this shard, releases its lease, and merges the progress of all the shards
+        Arguments:
+            progress: the values to record, with the 'status' of the shard
+        Return:
+            Returns the summary of all the shards, as written to the summary file
+        """
+        self.save_progress(progress)
+        if self.lease_file:
+            fcntl.lockf(self.lease_file, fcntl.LOCK_UN)
+            self.lease_file.close()
+            self.lease_file = None
+
+        with open(os.path.join(self.run_folder, 'summary.lock'), 'a') as lock_file:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX)
+            shards = {}
+            for number in range(1, self.count + 1):
+                try:
+                    with open(os.path.join(self.run_folder, 'shard-%s.json' % number), 'r') as in_file:
+                        shards[str(number)] = json.load(in_file)
+                except (OSError, ValueError):
+                    continue
+                if shards[str(number)]['status'] == 'running' and self.is_abandoned(number):
+                    shards[str(number)]['status'] = 'abandoned'
+            finished = [one_shard for one_shard in shards.values() if one_shard['status'] != 'running']
+            summary = {
+                'shards': str(self.count),
+                'shards_finished': str(len(finished)),
+                'shards_failed': str(sum(1 for one_shard in finished if one_shard['status'] != 'complete')),
+                'complete': str(len(finished) == self.count and all(one_shard['status'] == 'complete'
+                                                                     for one_shard in finished)),
+                # Every shard reads all the lines, and uploads the datapoints of its own streams
+                'lines_loaded': str(max([int(one_shard.get('lines_loaded', 0)) for one_shard in finished] or [0])),
+                'datapoints_uploaded': str(sum(int(one_shard.get('datapoints_uploaded', 0)) for one_shard in finished)),
+                'progress': shards
+            }
+            temp_path = os.path.join(self.run_folder, 'summary.json.tmp')
+            with open(temp_path, 'w') as out_file:
+                json.dump(summary, out_file, indent=2)
+            os.replace(temp_path, os.path.join(self.run_folder, 'summary.json'))
+            fcntl.lockf(lock_file, fcntl.LOCK_UN)
+        return summary
+
+
+class DatapointDeduplicator():
+    """Finds the datapoints that already exist in their GeoStreams streams
+    """
+    def __init__(self, clowder_url: str, clowder_key: str, slice_hours: float = DEFAULT_DEDUP_SLICE_HOURS):
+        """Performs initialization of class instance
+        Arguments:
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            slice_hours: the number of hours of existing datapoints to fetch in each request
+        """
+        self.clowder_url = clowder_url
+        self.clowder_key = clowder_key
+        self.slice_hours = slice_hours
+        self.existing = {}
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_datapoint_hash(start_time: str, properties: dict) -> int:
+        """Returns a compact hash identifying a datapoint by its start time, value, and source
+        Arguments:
+            start_time: the start time of the datapoint
+            properties: the properties of the datapoint
+        Return:
+            The hash value
+        """
+        properties = properties or {}
+        parsed_time = __internal__.parse_time(start_time)
+        value = properties.get('value')
+        try:
+            value = repr(float(value))
+        except (TypeError, ValueError):
+            value = str(value)
+        identity = '\x1f'.join((parsed_time.isoformat() if parsed_time else str(start_time), value,
+                                 str(properties.get('source'))))
+        return int.from_bytes(hashlib.blake2b(identity.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def load_stream(self, stream_id: str, since: datetime.datetime, until: datetime.datetime) -> None:
+        """Fetches the hashes of a stream's existing datapoints in a time window
+        Arguments:
+            stream_id: the ID of the stream
+            since: the start of the time window
+            until: the end of the time window
+        """
+        hashes = set()
+        started = time.perf_counter()
+        try:
+            for one_point in __internal__.get_stream_datapoints(self.clowder_url, self.clowder_key, stream_id, since, until,
+                                                                self.slice_hours):
+                hashes.add(DatapointDeduplicator.get_datapoint_hash(one_point.get('start_time'), one_point.get('properties')))
+        except requests.HTTPError as ex:
+            # A stream that was removed has no datapoints; it's replaced when its datapoints are uploaded
+            if not __internal__.is_not_found_error(ex):
+                raise
+        finally:
+            __internal__.metrics.add_stage('dedup_fetch', time.perf_counter() - started)
+        logging.debug("Found %s existing datapoints in stream %s", len(hashes), stream_id)
+        with self.lock:
+            self.existing[str(stream_id)] = hashes
+
+    def is_duplicate(self, stream_id: str, start_time: str, properties: dict) -> bool:
+        """Returns whether a datapoint already exists in a stream, counting the datapoints found
+        Arguments:
+            stream_id: the ID of the stream
+            start_time: the start time of the datapoint
+            properties: the properties of the datapoint
+        Return:
+            Returns True if the datapoint exists and False otherwise
+        """
+        hashes = self.existing.get(str(stream_id))
+        if not hashes or DatapointDeduplicator.get_datapoint_hash(start_time, properties) not in hashes:
+            return False
+        self.skipped += 1
+        return True
+
+
+class DatapointBatcher():
+    """Groups datapoints by stream and uploads them through the GeoStreams bulk endpoint
+    """
+    def __init__(self, clowder_url: str, clowder_key: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_bytes: int = DEFAULT_BATCH_MAX_BYTES, executor: concurrent.futures.Executor = None,
+                 max_in_flight: int = 1):
+        """Performs initialization of class instance
+        Arguments:
+            clowder_url: the URL of the Clowder instance to upload to
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            batch_size: the maximum number of datapoints in one upload
+            max_bytes: the approximate maximum size of the datapoints in one upload
+            executor: uploads are made in the background using the executor when specified
+            max_in_flight: the maximum number of background uploads that are queued or running at one time
+        """
+        self.clowder_url = clowder_url
+        self.clowder_key = clowder_key
+        self.batch_size = max(1, batch_size)
+        self.max_bytes = max(1, max_bytes)
+        self.executor = executor
+        self.max_in_flight = max(1, max_in_flight)
+        self.pending = {}
+        self.pending_bytes = {}
+        self.templates = {}
+        self.batch_sizes = []
+        self.uploads = []
+        self.last_upload = {}
+        self.failed = []
+        self.lock = threading.Lock()
+
+    @property
+    def batches_sent(self) -> int:
+        """Returns the number of bulk uploads made"""
+        return len(self.batch_sizes)
+
+    def add(self, stream_id: str, geom: dict, start_time: str, end_time: str, properties: dict = None) -> None:
+        """Queues a datapoint for upload, sending the stream's batch when a limit is reached
+        Arguments:
+            stream_id: the ID of the stream the datapoint belongs to
+            geom: GeoJSON object of the datapoint geometry
+            start_time: start time, in format 2017-01-25T09:33:02-06:00
+            end_time: end time, in format 2017-01-25T09:33:02-06:00
+            properties: JSON object with any desired properties
+        Notes:
+            Datapoints are queued as JSON; the JSON of the geometry is kept for each stream so that the geometry shared by
+            a stream's datapoints is only serialized once
+        """
+        stream_id = str(stream_id)
+        template = self.templates.get(stream_id)
+        if template is None or template[0] is not geom:
+            template = (geom, b',"type":"Point","geometry":' + __internal__.encode_json(geom) + b'}')
+            self.templates[stream_id] = template
+        datapoint = __internal__.encode_json({"start_time": start_time, "end_time": end_time,
+                                              "properties": properties})[:-1] + template[1]
+
+        point_bytes = len(datapoint) + 1
+        if self.pending.get(stream_id) and self.pending_bytes[stream_id] + point_bytes > self.max_bytes:
+            self.flush(stream_id)
+
+        self.pending.setdefault(stream_id, []).append(datapoint)
+        self.pending_bytes[stream_id] = self.pending_bytes.get(stream_id, 0) + point_bytes
+        if len(self.pending[stream_id]) >= self.batch_size:
+            self.flush(stream_id)
+
+    def flush(self, stream_id: str = None) -> None:
+        """Uploads queued datapoints, or starts their upload in the background when there's an executor
+        Arguments:
+            stream_id: the stream to upload the datapoints of; all streams are uploaded if not specified
+        Notes:
+            Queued datapoints are removed before they are uploaded so that a failed upload isn't repeated; the datapoints
+            of failed uploads are kept in `failed` instead, and wait() raises while there are any
+        """
+        stream_ids = [str(stream_id)] if stream_id is not None else list(self.pending.keys())
+        for one_id in stream_ids:
+            data_points = self.pending.pop(one_id, None)
+            self.pending_bytes.pop(one_id, None)
+            if not data_points:
+                continue
+
+            if not self.executor:
+                self.upload(one_id, data_points)
+                continue
+
+            # Forget the uploads that succeeded so the list stays short, keeping failed ones for wait() to raise
+            self.uploads = [one_upload for one_upload in self.uploads
+                            if not one_upload.done() or one_upload.cancelled() or one_upload.exception()]
+            # Limit the uploads waiting to be made, and chain uploads to the same stream to keep them in order
+            running = [one_upload for one_upload in self.uploads if not one_upload.done()]
+            if len(running) >= self.max_in_flight:
+                concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            upload = self.executor.submit(self.upload, one_id, data_points, self.last_upload.get(one_id))
+            self.last_upload[one_id] = upload
+            self.uploads.append(upload)
+
+    def wait(self) -> None:
+        """Waits for the background uploads to finish
+        Exceptions:
+            Raises the exception of the first upload that failed; a failed upload keeps being raised by every following call
+            so that nothing is treated as uploaded after it
+        """
+        uploads, self.uploads = self.uploads, []
+        self.last_upload = {}
+        concurrent.futures.wait(uploads)
+        for one_upload in uploads:
+            if one_upload.exception():
+                raise one_upload.exception()
+        if self.failed:
+            raise self.failed[0][2]
+
+    def upload(self, stream_id: str, data_points: list, previous: concurrent.futures.Future = None) -> None:
+        """Uploads datapoints to a stream
+        Arguments:
+            stream_id: the ID of the stream to upload to
+            data_points: the datapoints to upload
+            previous: the earlier upload to the same stream that needs to finish first
+        Exceptions:
+            Raises the exception of a failed upload, after recording the datapoints in `failed`; the datapoints following a
+            failed upload to the same stream aren't uploaded, so that a stream's datapoints are never stored out of order
+        """
+        try:
+            if previous:
+                concurrent.futures.wait([previous])
+                if previous.cancelled() or previous.exception():
+                    raise RuntimeError("An earlier upload to stream %s failed" % stream_id)
+
+            logging.info("Posting %s datapoints to stream %s", len(data_points), stream_id)
+            try:
+                __internal__.create_encoded_data_points(self.clowder_url, self.clowder_key, stream_id, data_points)
+            except requests.HTTPError as ex:
+                # The stream may have been removed since it was stored in the cache
+                stream_info = __internal__.resolution_cache.evict_id('streams', stream_id) \
+                    if __internal__.is_not_found_error(ex) else None
+                if not stream_info or 'sensor_id' not in stream_info:
+                    raise
+                new_id = __internal__.resolve_stream(stream_info['name'], self.clowder_url, self.clowder_key,
+                                                     stream_info['sensor_id'], stream_info['geometry'])
+                logging.info("Stream %s is no longer available, posting datapoints to stream %s", stream_id, new_id)
+                __internal__.create_encoded_data_points(self.clowder_url, self.clowder_key, new_id, data_points)
+        except Exception as ex:
+            with self.lock:
+                self.failed.append((stream_id, data_points, ex))
+            raise
+        with self.lock:
+            self.batch_sizes.append(len(data_points))
+
+
+class DatapointAggregator():
+    """Rolls up the numeric values of datapoints into one datapoint for each stream, source, and time period, keeping only
+       the running count, sum, minimum, and maximum of each
+    """
+    def __init__(self, period: str):
+        """Performs initialization of class instance
+        Arguments:
+            period: the period to aggregate over, one of the keys of AGGREGATE_PERIODS
+        """
+        self.period = period
+        self.groups = {}
+        self.periods = {}
+        self.rows_aggregated = 0
+        self.rows_not_aggregated = 0
+
+    def get_period(self, time_str: str) -> Optional[tuple]:
+        """Returns the period containing a datapoint time, in the time zone of the datapoint time
+        Arguments:
+            time_str: the datapoint time (eg: 2017-01-25T09:33:02-06:00); times without a time zone are treated as UTC
+        Return:
+            Returns a tuple of the start and end times of the period, or None if the time can't be parsed
+        """
+        period = self.periods.get(time_str)
+        if period is None:
+            try:
+                parsed = datetime.datetime.fromisoformat(time_str.strip().replace('Z', '+00:00'))
+            except (AttributeError, ValueError):
+                return None
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+            start = parsed.replace(minute=0, second=0, microsecond=0)
+            if self.period == 'day':
+                start = start.replace(hour=0)
+            period = (start.isoformat(), (start + AGGREGATE_PERIODS[self.period]).isoformat())
+            if len(self.periods) >= AGGREGATE_TIME_CACHE_SIZE:
+                self.periods.clear()
+            self.periods[time_str] = period
+        return period
+
+    def add(self, streams: list, time_str: str, properties: dict) -> bool:
+        """Adds the value of a datapoint to the running totals of its period in each of its streams
+        Arguments:
+            streams: the list of (stream ID, plot geometry) tuples returned by resolve_datapoint_streams()
+            time_str: the time of the datapoint
+            properties: the properties of the datapoint, with the 'source' and 'value' of the datapoint
+        Return:
+            Returns True if the value was added, and False if the datapoint can't be aggregated because its value isn't a
+            number or its time can't be parsed
+        """
+        period = self.get_period(time_str)
+        try:
+            value = float(properties.get('value'))
+        except (TypeError, ValueError):
+            value = None
+        if period is None or value is None or math.isnan(value):
+            self.rows_not_aggregated += 1
+            return False
+
+        source = properties.get('source')
+        for stream_id, plot_geom in streams:
+            key = (str(stream_id), period, source)
+            totals = self.groups.get(key)
+            if totals is None:
+                self.groups[key] = [1, value, value, value, plot_geom]
+            else:
+                totals[0] += 1
+                totals[1] += value
+                if value < totals[2]:
+                    totals[2] = value
+                elif value > totals[3]:
+                    totals[3] = value
+        self.rows_aggregated += 1
+        return True
+
+    def get_datapoints(self):
+        """Generator returning the aggregated datapoints and removing them from the aggregator
+        Return:
+            Yields a tuple of the list of the (stream ID, plot geometry) tuple of the datapoint, the start and end times of
+            the period, and the properties of the datapoint with the 'source', the mean as the 'value', and the 'min', 'max',
+            and 'count' of the values
+        """
+        groups, self.groups = self.groups, {}
+        for (stream_id, (start_time, end_time), source), (count, total, low, high, plot_geom) in groups.items():
+            yield [(stream_id, plot_geom)], start_time, end_time, {"source": source, "value": total / count, "min": low,
+                                                                   "max": high, "count": count}
+
+
+class __internal__():
+    """Class for functions intended for internal use only for this file
+    """
+    # Makes the HTTP requests to GeoStreams, created by configure_run() or, with the default settings, by get_client()
+    client = None
+
+    # Runs work concurrently when more than one worker is requested
+    executor = None
+
+    # Sensors and streams already resolved during the current run
+    resolution_cache = ResolutionCache()
+
+    # Where sites are fetched from
+    site_source = BetydbSites()
+
+    # Matches points to sites locally when set, otherwise the site source is queried for each point
+    site_matcher = None
+
+    # Sites matched to rounded data point locations, and parsed site geometries
+    matched_sites_cache = LruCache(DEFAULT_SITE_CACHE_SIZE)
+    site_geometry_cache = LruCache(DEFAULT_SITE_CACHE_SIZE)
+    site_cache_precision = DEFAULT_SITE_CACHE_PRECISION
+
+    # Counters and timers of the processing stages and GeoStreams requests of the current run
+    metrics = RunMetrics()
+
+    # Limit the rate of requests to GeoStreams and BETYdb
+    geostreams_limiter = RateLimiter('GeoStreams')
+    betydb_limiter = RateLimiter('BETYdb')
+
+    # Coordinates with the runs uploading other shards of the same files, when the run is a shard
+    shard_coordinator = None
+
+    # The arguments the clients and caches were prepared with by start_service(), kept between jobs until stop_service()
+    service_args = None
+
+    def __init__(self):
+        """Performs initialization of class instance
+        """
+
+    @staticmethod
+    def get_geostreams_api_url(base_url: str, url_particles: Union[str, tuple, None]) -> str:
+        """Returns the URL constructed from parameters
+        Arguments:
+            base_url: the base URL (assumes scheme:[//authority] with optional path)
+            url_particles: additional strings to append to the end of the base url
+        Return:
+            Returns the formatted URL (guaranteed to not have a trailing slash)
+        """
+        def url_join(base_url: str, url_parts: tuple) -> str:
+            """Internal function to create URLs in a consistent fashion
+            Arguments:
+                base_url: the starting part of the URL
+                url_parts: the parts of the URL to join
+            Return:
+                The formatted URL
+            """
+            built_url = ''
+            base_parse = urlparse(base_url)
+            if base_parse.scheme:
+                built_url = base_parse.scheme + '://'
+            if base_parse.netloc:
+                built_url += base_parse.netloc + '/'
+            if base_parse.path and not base_parse.path == '/':
+                built_url += base_parse.path.lstrip('/') + '/'
+
+            joined_parts = '/'.join(url_parts).replace('//', '/').strip('/')
+
+            return built_url + joined_parts
+
+        if not url_particles:
+            return url_join(base_url, tuple(GEOSTREAMS_API_URL_PARTICLE))
+
+        if isinstance(url_particles, str):
+            return url_join(base_url, (GEOSTREAMS_API_URL_PARTICLE, url_particles))
+
+        formatted_particles = tuple(str(part) for part in url_particles)
+        return url_join(base_url, tuple(GEOSTREAMS_API_URL_PARTICLE) + formatted_particles)
+
+    @staticmethod
+    def get_client() -> GeoStreamsClient:
+        """Returns the client making the HTTP requests to GeoStreams, or the offline stand-in, creating a client with the
+           default settings when configure_run() hasn't been called
+        """
+        if __internal__.client is None:
+            __internal__.client = GeoStreamsClient(metrics=__internal__.metrics)
+        return __internal__.client
+
+    @staticmethod
+    def encode_json(value) -> bytes:
+        """Returns the compact JSON of a value, using orjson or ujson when installed
+        Arguments:
+            value: the value to serialize
+        Return:
+            Returns the UTF-8 encoded JSON
+        """
+        if orjson:
+            return orjson.dumps(value)
+        if ujson:
+            return ujson.dumps(value, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def _common_geostreams_name_get(clowder_url: str, clowder_key: str, url_endpoint: str, name_query_key: str, name: str) -> \
+            Optional[dict]:
+        """Common function for retrieving data from GeoStreams by name
+        Arguments:
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            url_endpoint: the endpoint to query (URL particle appended to the base URL, eg: 'streams')
+            name_query_key: the name of the query portion of URL identifying the name to search on (eg: 'stream_name')
+            name: the name to search on
+        Return:
+            Returns the found information, or None if not found
+        """
+        cached = __internal__.resolution_cache.get(url_endpoint, name)
+        if cached is not None:
+            return cached
+
+        url = __internal__.get_geostreams_api_url(clowder_url, url_endpoint)
+        params = {name_query_key: name}
+        if clowder_key:
+            params['key'] = clowder_key
+
+        logging.debug("Calling geostreams url '%s' with params '%s'", url, str(params))
+        resp = __internal__.get_client().get(url, params)
+        resp.raise_for_status()
+
+        for one_item in resp.json():
+            if 'name' in one_item and one_item['name'] == name:
+                logging.debug("Found %s '%s' = [%s]", name_query_key, name, one_item['id'])
+                __internal__.resolution_cache.put(url_endpoint, name, one_item)
+                return one_item
+
+        return None
+
+    @staticmethod
+    def common_geostreams_create(clowder_url: str, clowder_key: str, url_endpoint: str, request_body: Union[str, bytes]) -> \
+            Optional[str]:
+        """Common function for creating an object in GeoStreams
+        Arguments:
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            url_endpoint: the endpoint to query (URL particle appended to the base URL, eg: 'streams')
+            request_body: the body of the request
+        Return:
+            Returns the ID of the created object or None if no ID was returned
+        """
+        url = __internal__.get_geostreams_api_url(clowder_url, url_endpoint)
+        if clowder_key:
+            url = url + '?key=' + clowder_key
+
+        result = __internal__.get_client().post(url,
+                                          headers={'Content-type': 'application/json'},
+                                          data=request_body)
+        result.raise_for_status()
+
+        result_id = None
+        result_json = result.json()
+        if isinstance(result_json, dict) and 'id' in result_json:
+            result_id = result_json['id']
+            logging.debug("Created GeoStreams %s: id = '%s'", url_endpoint, result_id)
+        else:
+            logging.debug("Call to GeoStreams create %s returned no ID", url_endpoint)
+
+        return result_id
+
+    @staticmethod
+    def is_not_found_error(ex: Exception) -> bool:
+        """Returns whether an exception indicates a GeoStreams object doesn't exist
+        Arguments:
+            ex: the exception to check
+        Return:
+            Returns True if the exception is an HTTP 404 error and False otherwise
+        """
+        response = getattr(ex, 'response', None)
+        return response is not None and response.status_code == 404
+
+    @staticmethod
+    def get_sensor_by_name(sensor_name: str, clowder_url: str, clowder_key: str) -> Optional[dict]:
+        """Returns the GeoStreams sensor information retrieved from Clowder
+        Arguments:
+            sensor_name: the name of the data sensor to retrieve
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+        Return:
+            Returns the information on the sensor or None if the stream can't be found
+        """
+        return __internal__._common_geostreams_name_get(clowder_url, clowder_key, 'sensors', 'sensor_name', sensor_name)
+
+    @staticmethod
+    def get_stream_by_name(stream_name: str, clowder_url: str, clowder_key: str) -> Optional[dict]:
+        """Returns the GeoStreams stream information retrieved from Clowder
+        Arguments:
+            stream_name: the name of the data stream to retrieve
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+        Return:
+            Returns the information on the stream or None if the stream can't be found
+        """
+        return __internal__._common_geostreams_name_get(clowder_url, clowder_key, 'streams', 'stream_name', stream_name)
+
+    @staticmethod
+    def creation_lock(url_endpoint: str, name: str):
+        """Returns the context manager to hold while creating a named GeoStreams object, which keeps other shards from
+           creating the same object at the same time
+        Arguments:
+            url_endpoint: the endpoint of the object (eg: 'streams')
+            name: the name of the object
+        """
+        if __internal__.shard_coordinator:
+            return __internal__.shard_coordinator.creation_lock(url_endpoint, name)
+        return contextlib.nullcontext()
+
+    @staticmethod
+    def create_sensor(sensor_name: str, clowder_url: str, clowder_key: str, geom: dict, sensor_type: dict, region: str) -> str:
+        """Create a new sensor in Geostreams.
+        Arguments:
+            sensor_name: name of new sensor to create
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            geom: GeoJSON object of sensor geometry
+            sensor_type: JSON object with {"id", "title", and "sensorType"}
+            region: region of sensor
+        """
+        body = {
+            "name": sensor_name,
+            "type": "Point",
+            "geometry": geom,
+            "properties": {
+                "popupContent": sensor_name,
+                "type": sensor_type,
+                "name": sensor_name,
+                "region": region
+            }
+        }
+
+        sensor_id = __internal__.common_geostreams_create(clowder_url, clowder_key, 'sensors', __internal__.encode_json(body))
+        __internal__.resolution_cache.put('sensors', sensor_name, {'id': sensor_id, 'name': sensor_name, 'geometry': geom})
+        return sensor_id
+
+    @staticmethod
+    def create_stream(stream_name: str, clowder_url: str, clowder_key: str, sensor_id: str, geom: dict, properties=None) -> str:
+        """Create the indicated GeoStream
+        Arguments:
+            stream_name: the name of the  data stream to retrieve
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            sensor_id: the ID of the sensor associated with the stream
+            geom: the geometry of the stream to create
+            properties: additional properties for the stream
+        Return:
+            The ID of the created stream
+        """
+        body = {
+            "name": stream_name,
+            "type": "Feature",
+            "geometry": geom,
+            "properties": {} if not properties else properties,
+            "sensor_id": str(sensor_id)
+        }
+
+        stream_id = __internal__.common_geostreams_create(clowder_url, clowder_key, 'streams', __internal__.encode_json(body))
+        __internal__.resolution_cache.put('streams', stream_name, {'id': stream_id, 'name': stream_name, 'geometry': geom,
+                                                                   'sensor_id': str(sensor_id)})
+        return stream_id
+
+    @staticmethod
+    def resolve_sensor(sensor_name: str, clowder_url: str, clowder_key: str, geom: dict) -> str:
+        """Returns the ID of the named plot sensor, creating the sensor if it doesn't exist
+        Arguments:
+            sensor_name: the name of the sensor
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            geom: GeoJSON object of sensor geometry used when creating the sensor
+        Return:
+            The ID of the sensor
+        """
+        with __internal__.metrics.time_stage('sensor_resolve'), \
+                __internal__.resolution_cache.name_lock('sensors', sensor_name):
+            sensor_data = __internal__.get_sensor_by_name(sensor_name, clowder_url, clowder_key)
+            if sensor_data:
+                return sensor_data['id']
+
+            with __internal__.creation_lock('sensors', sensor_name):
+                # Another shard may have created the sensor while this one waited for the lock
+                sensor_data = __internal__.get_sensor_by_name(sensor_name, clowder_url, clowder_key) \
+                    if __internal__.shard_coordinator else None
+                if sensor_data:
+                    return sensor_data['id']
+
+                return __internal__.create_sensor(sensor_name, clowder_url, clowder_key, geom,
+                                                  {
+                                                      "id": "MAC Field Scanner",
+                                                      "title": "MAC Field Scanner",
+                                                      "sensorType": GEOSTREAMS_CSV_SENSOR_TYPE
+                                                  },
+                                                  "Maricopa")
+
+    @staticmethod
+    def resolve_stream(stream_name: str, clowder_url: str, clowder_key: str, sensor_id: str, geom: dict) -> str:
+        """Returns the ID of the named stream, creating the stream if it doesn't exist
+        Arguments:
+            stream_name: the name of the stream
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            sensor_id: the ID of the sensor associated with the stream
+            geom: the geometry of the stream used when creating the stream
+        Return:
+            The ID of the stream
+        """
+        with __internal__.metrics.time_stage('stream_resolve'), \
+                __internal__.resolution_cache.name_lock('streams', stream_name):
+            stream_data = __internal__.get_stream_by_name(stream_name, clowder_url, clowder_key)
+            if stream_data:
+                return stream_data['id']
+
+            with __internal__.creation_lock('streams', stream_name):
+                # Another shard may have created the stream while this one waited for the lock
+                stream_data = __internal__.get_stream_by_name(stream_name, clowder_url, clowder_key) \
+                    if __internal__.shard_coordinator else None
+                if stream_data:
+                    return stream_data['id']
+
+                return __internal__.create_stream(stream_name, clowder_url, clowder_key, sensor_id, geom)
+
+    @staticmethod
+    def create_data_points(clowder_url: str, clowder_key: str, stream_id: str, data_point_list: list) -> None:
+        """Uploads the data points to GeoStreams
+        Arguments:
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            stream_id: the ID of the stream to upload to
+            data_point_list: the list of data points to upload
+        """
+        __internal__.create_encoded_data_points(clowder_url, clowder_key, stream_id,
+                                                [__internal__.encode_json(one_point) for one_point in data_point_list])
+
+    @staticmethod
+    def create_encoded_data_points(clowder_url: str, clowder_key: str, stream_id: str, data_point_list: list) -> None:
+        """Uploads data points that are already serialized to GeoStreams
+        Arguments:
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            stream_id: the ID of the stream to upload to
+            data_point_list: the list of the JSON of the data points to upload, as queued by DatapointBatcher
+        """
+        body = b'{"datapoints":[' + b','.join(data_point_list) + b'],"stream_id":' + \
+            __internal__.encode_json(str(stream_id)) + b'}'
+
+        with __internal__.metrics.time_stage('datapoint_upload'):
+            __internal__.common_geostreams_create(clowder_url, clowder_key, 'datapoints/bulk', body)
+
+    @staticmethod
+    def parse_site_geometry(wkt: str) -> dict:
+        """Returns the GeoJSON of a site's WKT geometry, parsing each distinct geometry only once
+        Arguments:
+            wkt: the WKT of the site geometry
+        Return:
+            The GeoJSON geometry
+        """
+        geom = __internal__.site_geometry_cache.get(wkt)
+        if geom is None:
+            # pylint: disable=import-outside-toplevel
+            from terrautils.spatial import wkt_to_geojson
+            geom = json.loads(wkt_to_geojson(wkt))
+            __internal__.site_geometry_cache.put(wkt, geom)
+        return geom
+
+    @staticmethod
+    def get_matched_sites(clowder_url: str, clowder_key: str, plot_name: str, lat_lon: tuple, filter_date: str) -> dict:
+        """Returns sensor metadata matching the plot, remembering the results for nearby points on the same date
+        Arguments:
+            clowder_url: the URL of the Clowder instance to load the file to
+            clowder_key: the key to use when accessing Clowder
+            plot_name: name of plot to map data point into if possible, otherwise query BETY
+            lat_lon: [latitude, longitude] tuple of data point location
+            filter_date: date used to restrict number of sites returned from BETYdb
+        Return:
+            Returns the sites matching the plot and date. An empty dict may be returned
+        """
+        precision = __internal__.site_cache_precision
+        key = (plot_name, round(float(lat_lon[0]), precision), round(float(lat_lon[1]), precision), filter_date)
+        matched_sites = __internal__.matched_sites_cache.get(key)
+        if matched_sites is None:
+            matched_sites = __internal__.find_matched_sites(clowder_url, clowder_key, plot_name, lat_lon, filter_date)
+            __internal__.matched_sites_cache.put(key, matched_sites)
+        return matched_sites
+
+    @staticmethod
+    def find_matched_sites(clowder_url: str, clowder_key: str, plot_name: str, lat_lon: tuple, filter_date: str) -> dict:
+        """Returns sensor metadata matching the plot
+        Arguments:
+            clowder_url: the URL of the Clowder instance to load the file to
+            clowder_key: the key to use when accessing Clowder
+            plot_name: name of plot to map data point into if possible, otherwise query BETY
+            lat_lon: [latitude, longitude] tuple of data point location
+            filter_date: date used to restrict number of sites returned from BETYdb
+        Return:
+            Returns the sites matching the plot and date. An empty dict may be returned
+        """
+        # SENSOR is the plot
+        matched_sites = {}
+        if plot_name:
+            # If provided a plot name, see if the sensor exists before going into more expensive logic
+            sensor_data = __internal__.get_sensor_by_name(plot_name, clowder_url, clowder_key)
+            if sensor_data:
+                matched_sites[sensor_data['id']] = {
+                    "name": plot_name,
+                    "geom": sensor_data['geometry']
+                }
+
+        if not matched_sites:
+            # If we don't have existing sensor to use quickly, we must query geographically
+            with __internal__.metrics.time_stage('site_match'):
+                if __internal__.site_matcher:
+                    site_list = __internal__.site_matcher.get_sites(lat_lon, filter_date)
+                else:
+                    site_list = __internal__.site_source.get_sites_by_latlon(lat_lon, filter_date)
+            for plot_name, plot_geom in site_list:
+                # Get existing sensor with this plot name from geostreams, or create if it doesn't exist
+                sensor_id = __internal__.resolve_sensor(plot_name, clowder_url, clowder_key, plot_geom)
+                matched_sites[sensor_id] = {"name": plot_name, "geom": plot_geom}
+
+        return matched_sites
+
+    @staticmethod
+    def build_datapoint(geom: dict, start_time: str, end_time: str, properties: dict = None) -> dict:
+        """Returns the GeoStreams representation of a data point
+        Arguments:
+            geom: GeoJSON object of sensor geometry
+            start_time: start time, in format 2017-01-25T09:33:02-06:00
+            end_time: end time, in format 2017-01-25T09:33:02-06:00
+            properties: JSON object with any desired properties
+        Return:
+            The data point without a stream ID
+        """
+        return {
+            "start_time": start_time,
+            "end_time": end_time,
+            "type": "Point",
+            "geometry": geom,
+            "properties": properties
+        }
+
+    @staticmethod
+    def create_datapoint(clowder_url: str, clowder_key: str, stream_id: str, geom: dict, start_time: str, end_time: str,
+                         properties: dict = None) -> str:
+        """Create a new data point in Geostreams
+        Arguments:
+            clowder_url: the URL of the Clowder instance to load the file to
+            clowder_key: the key to use when accessing Clowder
+            stream_id: id of stream to attach data point to
+            geom: GeoJSON object of sensor geometry
+            start_time: start time, in format 2017-01-25T09:33:02-06:00
+            end_time: end time, in format 2017-01-25T09:33:02-06:00
+            properties: JSON object with any desired properties
+        Return:
+            The ID of the created data point
+        """
+        body = __internal__.build_datapoint(geom, start_time, end_time, properties)
+        body["stream_id"] = str(stream_id)
+
+        with __internal__.metrics.time_stage('datapoint_upload'):
+            return __internal__.common_geostreams_create(clowder_url, clowder_key, 'datapoints', __internal__.encode_json(body))
+
+    @staticmethod
+    def resolve_datapoint_streams(clowder_traits_url: str, clowder_key: str, stream_prefix: str, lat_lon: tuple,
+                                  filter_date: str = '', plot_name: str = None) -> list:
+        """Returns the streams a data point belongs to, creating the sensors and streams if they don't exist
+        Arguments:
+            clowder_traits_url: the URL of the Clowder instance to load the file to
+            clowder_key: the key to use when accessing Clowder
+            stream_prefix: prefix of stream to attach data point to
+            lat_lon: [latitude, longitude] tuple of data point location
+            filter_date: date used to restrict number of sites returned from BETYdb
+            plot_name: name of plot to map data point into if possible, otherwise query BETY
+        Return:
+            Returns a list of (stream ID, plot geometry) tuples; when the run is a shard, only the streams belonging to the
+            shard are returned
+        """
+        matched_sites = __internal__.get_matched_sites(clowder_traits_url, clowder_key, plot_name, lat_lon, filter_date)
+
+        streams = []
+        for sensor_id in matched_sites:
+            # The streams of other shards are left to them
+            if __internal__.shard_coordinator and \
+                    not __internal__.shard_coordinator.owns(stream_prefix, matched_sites[sensor_id]["name"]):
+                continue
+            plot_geom = matched_sites[sensor_id]["geom"]
+            stream_name = "%s (%s)" % (stream_prefix, sensor_id)
+            try:
+                stream_id = __internal__.resolve_stream(stream_name, clowder_traits_url, clowder_key, sensor_id, plot_geom)
+            except requests.HTTPError as ex:
+                if not __internal__.is_not_found_error(ex):
+                    raise
+                # The sensor may have been removed since it was stored in the cache
+                plot_name = matched_sites[sensor_id]["name"]
+                logging.info("Sensor %s is no longer available, resolving '%s' again", sensor_id, plot_name)
+                __internal__.resolution_cache.evict('sensors', plot_name)
+                __internal__.matched_sites_cache.clear()
+                sensor_id = __internal__.resolve_sensor(plot_name, clowder_traits_url, clowder_key, plot_geom)
+                stream_name = "%s (%s)" % (stream_prefix, sensor_id)
+                stream_id = __internal__.resolve_stream(stream_name, clowder_traits_url, clowder_key, sensor_id, plot_geom)
+            streams.append((stream_id, plot_geom))
+
+        return streams
+
+    @staticmethod
+    def create_datapoint_with_dependencies(clowder_traits_url: str, clowder_key: str, stream_prefix: str, lat_lon: tuple,
+                                           start_time: str, end_time: str, metadata: dict = None, filter_date: str = '',
+                                           geom: dict = None, plot_name: str = None, batcher: DatapointBatcher = None) -> None:
+        """ Submit traits CSV file to Clowder
+        Arguments:
+            clowder_traits_url: the URL of the Clowder instance to load the file to
+            clowder_key: the key to use when accessing Clowder
+            stream_prefix: prefix of stream to attach data point to
+            lat_lon: [latitude, longitude] tuple of data point location
+            start_time: start time, in format 2017-01-25T09:33:02-06:00
+            end_time: end time, in format 2017-01-25T09:33:02-06:00
+            metadata: JSON object with any desired properties
+            filter_date: date used to restrict number of sites returned from BETYdb
+            geom: geometry for data point (use plot if not provided)
+            plot_name: name of plot to map data point into if possible, otherwise query BETY
+            batcher: queues the data point for a bulk upload when specified, otherwise the data point is uploaded now
+        Exceptions:
+            Raises RuntimeError exception if a Clowder URL is not specified
+        """
+        streams = __internal__.resolve_datapoint_streams(clowder_traits_url, clowder_key, stream_prefix, lat_lon, filter_date,
+                                                         plot_name)
+        __internal__.add_datapoints(clowder_traits_url, clowder_key, streams, start_time, end_time, metadata, geom, batcher)
+
+    @staticmethod
+    def add_datapoints(clowder_traits_url: str, clowder_key: str, streams: list, start_time: str, end_time: str,
+                       metadata: dict = None, geom: dict = None, batcher: DatapointBatcher = None,
+                       deduplicator: DatapointDeduplicator = None) -> None:
+        """Uploads, or queues for upload, a data point to each of its resolved streams
+        Arguments:
+            clowder_traits_url: the URL of the Clowder instance to load the file to
+            clowder_key: the key to use when accessing Clowder
+            streams: the list of (stream ID, plot geometry) tuples returned by resolve_datapoint_streams()
+            start_time: start time, in format 2017-01-25T09:33:02-06:00
+            end_time: end time, in format 2017-01-25T09:33:02-06:00
+            metadata: JSON object with any desired properties
+            geom: geometry for data point (use plot if not provided)
+            batcher: queues the data point for a bulk upload when specified, otherwise the data point is uploaded now
+            deduplicator: data points already in a stream are skipped when specified
+        """
+        for stream_id, plot_geom in streams:
+            if deduplicator and deduplicator.is_duplicate(stream_id, start_time, metadata):
+                continue
+            if not geom:
+                geom = plot_geom
+            if batcher:
+                batcher.add(stream_id, geom, start_time, end_time, metadata)
+            else:
+                logging.info("Posting datapoint to stream %s", stream_id)
+                __internal__.create_datapoint(clowder_traits_url, clowder_key, stream_id, geom, start_time, end_time, metadata)
+
+    @staticmethod
+    def get_row_values(row: dict) -> tuple:
+        """Returns the values of a CSV row used to create a data point
+        Arguments:
+            row: the CSV row
+        Return:
+            Returns a tuple of the trait, the [latitude, longitude] tuple, the data point time, the data point
+            metadata, and the filter date
+        """
+        dp_metadata = {
+            "source": row['source'],
+            "value": row['value']
+        }
+        return row['trait'], (row['lat'], row['lon']), row['dp_time'], dp_metadata, row['timestamp']
+
+    @staticmethod
+    def get_row_key(row_values: tuple) -> tuple:
+        """Returns the key identifying the streams of a CSV row
+        Arguments:
+            row_values: the row values returned by get_row_values()
+        Return:
+            Returns a tuple of the trait, the latitude, the longitude, and the filter date
+        """
+        return row_values[0], row_values[1][0], row_values[1][1], row_values[4]
+
+    @staticmethod
+    def get_csv_compression(file_path: str) -> Optional[str]:
+        """Returns the compression of a CSV file
+        Arguments:
+            file_path: the path of the file
+        Return:
+            Returns the compression named in CSV_FILE_EXTENSIONS, or None if the file isn't compressed
+        Exceptions:
+            Raises ValueError if the file isn't a CSV file
+        """
+        lower_path = file_path.lower()
+        for extension, compression in CSV_FILE_EXTENSIONS.items():
+            if lower_path.endswith(extension):
+                return compression
+        raise ValueError("'%s' isn't a CSV file" % os.path.basename(file_path))
+
+    @staticmethod
+    def is_csv_file(file_path: str) -> bool:
+        """Returns whether a file is a CSV file, compressed or not
+        Arguments:
+            file_path: the path of the file
+        """
+        return any(file_path.lower().endswith(extension) for extension in CSV_FILE_EXTENSIONS)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def open_csv_file(file_path: str):
+        """Context manager opening a CSV file for reading its bytes, decompressing compressed files as they are read and
+           memory mapping uncompressed files
+        Arguments:
+            file_path: the path of the file
+        Return:
+            Returns an object with the read() and readline() methods of a binary file
+        Exceptions:
+            Raises RuntimeError if the file is zstd compressed and the zstandard package isn't installed
+        """
+        compression = __internal__.get_csv_compression(file_path)
+        if compression == 'gzip':
+            in_file = gzip.open(file_path, 'rb')
+        elif compression == 'bz2':
+            in_file = bz2.open(file_path, 'rb')
+        elif compression == 'zstd':
+            try:
+                # pylint: disable=import-outside-toplevel
+                import zstandard
+            except ImportError as ex:
+                raise RuntimeError("Install the zstandard package to read zstd compressed files") from ex
+            raw_file = open(file_path, 'rb')
+            in_file = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw_file, closefd=True),
+                                        ZSTD_READ_BUFFER_BYTES)
+        else:
+            with open(file_path, 'rb') as raw_file:
+                # Empty files can't be mapped
+                if os.fstat(raw_file.fileno()).st_size:
+                    in_file = mmap.mmap(raw_file.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    in_file = io.BytesIO()
+        try:
+            yield in_file
+        finally:
+            in_file.close()
+
+    @staticmethod
+    def seek_csv_file(in_file, position: int, offset: int) -> None:
+        """Moves forward to a byte offset in a file opened by open_csv_file()
+        Arguments:
+            in_file: the opened file
+            position: the current byte offset in the file
+            offset: the byte offset to move to
+        Notes:
+            Compressed files are decompressed up to the offset
+        """
+        if isinstance(in_file, (mmap.mmap, io.BytesIO)):
+            in_file.seek(offset)
+            return
+        remaining = offset - position
+        while remaining > 0:
+            skipped = len(in_file.read(min(remaining, ZSTD_READ_BUFFER_BYTES)))
+            if not skipped:
+                break
+            remaining -= skipped
+
+    @staticmethod
+    def get_row_ranges(file_path: str, start_offset: int, count: int) -> list:
+        """Splits the rows of an uncompressed CSV file into ranges of about the same size that start and end on line breaks
+        Arguments:
+            file_path: the path of the CSV file
+            start_offset: the byte offset of the first row; rows start after the header when zero
+            count: the number of ranges to split the rows into
+        Return:
+            Returns a list of (start offset, end offset) tuples, which is empty if the file has no rows
+        Notes:
+            Values spanning lines aren't supported since ranges are split on line breaks
+        """
+        with __internal__.open_csv_file(file_path) as in_file:
+            file_size = len(in_file.getvalue()) if isinstance(in_file, io.BytesIO) else in_file.size()
+            start = max(start_offset, len(in_file.readline()))
+            if start >= file_size:
+                return []
+            range_bytes = max(1, (file_size - start) // max(1, count))
+            ranges = []
+            while start < file_size:
+                end = in_file.find(b'\n', min(start + range_bytes, file_size) - 1) + 1 if len(ranges) < count - 1 else 0
+                if end <= 0:
+                    end = file_size
+                ranges.append((start, end))
+                start = end
+            return ranges
+
+    @staticmethod
+    def read_csv_rows(file_path: str, start_offset: int = 0, end_offset: int = None):
+        """Generator returning the rows in a CSV file along with the byte offset following each row
+        Arguments:
+            file_path: the path of the CSV file
+            start_offset: the byte offset of the first row to return; rows start after the header when zero
+            end_offset: the byte offset to stop reading rows at; rows are read to the end of the file when not specified
+        Return:
+            Yields a tuple of the row dictionary and the byte offset of the next row
+        Notes:
+            The offsets of compressed files are offsets into their uncompressed contents
+        """
+        with __internal__.open_csv_file(file_path) as in_file:
+            header = in_file.readline()
+            field_names = next(csv.reader([header.decode('utf-8')]), None)
+            if not field_names:
+                return
+            offset = max(start_offset, len(header))
+            __internal__.seek_csv_file(in_file, len(header), offset)
+            consumed = [offset]
+
+            def read_lines():
+                """Returns the lines of the file while keeping track of the bytes read"""
+                for line in iter(in_file.readline, b''):
+                    if end_offset is not None and consumed[0] >= end_offset:
+                        break
+                    consumed[0] += len(line)
+                    yield line.decode('utf-8')
+
+            # The time spent reading rows is added up locally and recorded once the rows have been read
+            parse_seconds = 0.0
+            rows_read = 0
+            started = time.perf_counter()
+            try:
+                for row in csv.DictReader(read_lines(), fieldnames=field_names):
+                    parse_seconds += time.perf_counter() - started
+                    rows_read += 1
+                    yield row, consumed[0]
+                    started = time.perf_counter()
+            finally:
+                __internal__.metrics.add_stage('csv_parse', parse_seconds, rows_read)
+
+    @staticmethod
+    def read_csv_blocks(file_path: str, start_offset: int = 0, block_bytes: int = DEFAULT_CSV_BLOCK_BYTES,
+                        end_offset: int = None):
+        """Generator returning the header and blocks of whole lines of a CSV file
+        Arguments:
+            file_path: the path of the CSV file
+            start_offset: the byte offset of the first line to return; lines start after the header when zero
+            block_bytes: the approximate size of each block
+            end_offset: the byte offset of the end of the lines to return, which must be the start of a line; lines are read
+                        to the end of the file when not specified
+        Return:
+            Yields a tuple of the header line, the block of lines, and the byte offset of the block
+        """
+        with __internal__.open_csv_file(file_path) as in_file:
+            header = in_file.readline()
+            if not header.strip():
+                return
+            offset = max(start_offset, len(header))
+            __internal__.seek_csv_file(in_file, len(header), offset)
+            remainder = b''
+            while True:
+                read_bytes = max(1, block_bytes)
+                if end_offset is not None:
+                    read_bytes = min(read_bytes, end_offset - offset - len(remainder))
+                data = in_file.read(read_bytes) if read_bytes > 0 else b''
+                if not data:
+                    break
+                data = remainder + data
+                block_end = data.rfind(b'\n') + 1
+                if not block_end:
+                    remainder = data
+                    continue
+                remainder = data[block_end:]
+                yield header, data[:block_end], offset
+                offset += block_end
+            if remainder.strip():
+                yield header, remainder, offset
+
+    @staticmethod
+    def get_columnar_parser():
+        """Returns the function used to parse blocks of CSV lines into columns
+        Return:
+            Returns parse_block_pyarrow() when pyarrow is installed, otherwise parse_block_pandas()
+        Exceptions:
+            Raises RuntimeError if neither pyarrow nor pandas is installed
+        """
+        # pylint: disable=import-outside-toplevel,unused-import
+        try:
+            import pyarrow.csv
+            return __internal__.parse_block_pyarrow
+        except ImportError:
+            pass
+        try:
+            import pandas
+            return __internal__.parse_block_pandas
+        except ImportError:
+            pass
+        raise RuntimeError("The columnar CSV reader needs pyarrow or pandas to be installed")
+
+    @staticmethod
+    def parse_block_pyarrow(data: bytes) -> tuple:
+        """Parses CSV lines into columns using pyarrow
+        Arguments:
+            data: the header line followed by the lines to parse
+        Return:
+            Returns a tuple of a dictionary of the values of each text column, a dictionary of the values of each number
+            column with None for values that aren't numbers, and a dictionary of the text of those values by row index
+        """
+        # pylint: disable=import-outside-toplevel
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.csv
+
+        table = pyarrow.csv.read_csv(io.BytesIO(data), convert_options=pyarrow.csv.ConvertOptions(
+            include_columns=CSV_REQUIRED_COLUMNS, column_types={name: pyarrow.string() for name in CSV_REQUIRED_COLUMNS},
+            strings_can_be_null=False))
+        numbers = {}
+        not_numbers = {}
+        for name in CSV_NUMBER_COLUMNS:
+            column = pyarrow.compute.utf8_trim_whitespace(table.column(name))
+            is_number = pyarrow.compute.match_substring_regex(column, CSV_NUMBER_PATTERN)
+            numbers[name] = pyarrow.compute.cast(pyarrow.compute.if_else(is_number, column, None),
+                                                 pyarrow.float64()).to_pylist()
+            indexes = pyarrow.compute.indices_nonzero(pyarrow.compute.invert(is_number)).to_pylist()
+            not_numbers[name] = dict(zip(indexes, table.column(name).take(indexes).to_pylist())) if indexes else {}
+        texts = {name: table.column(name).to_pylist() for name in CSV_REQUIRED_COLUMNS if name not in CSV_NUMBER_COLUMNS}
+        return texts, numbers, not_numbers
+
+    @staticmethod
+    def parse_block_pandas(data: bytes) -> tuple:
+        """Parses CSV lines into columns using pandas
+        Arguments:
+            data: the header line followed by the lines to parse
+        Return:
+            Returns the same values as parse_block_pyarrow()
+        """
+        # pylint: disable=import-outside-toplevel
+        import pandas
+
+        frame = pandas.read_csv(io.BytesIO(data), usecols=CSV_REQUIRED_COLUMNS, dtype=str, keep_default_na=False)
+        numbers = {}
+        not_numbers = {}
+        for name in CSV_NUMBER_COLUMNS:
+            column = frame[name].str.strip()
+            is_number = column.str.fullmatch(CSV_NUMBER_PATTERN).astype(bool)
+            numbers[name] = pandas.to_numeric(column.where(is_number), errors='coerce').astype(object) \
+                .where(is_number, None).tolist()
+            not_numbers[name] = dict(zip(frame.index[~is_number].tolist(), frame[name][~is_number].tolist()))
+        texts = {name: frame[name].tolist() for name in CSV_REQUIRED_COLUMNS if name not in CSV_NUMBER_COLUMNS}
+        return texts, numbers, not_numbers
+
+    @staticmethod
+    def get_invalid_rows(columns: dict, not_numbers: dict, first_row: int) -> list:
+        """Returns descriptions of the rows of a parsed block that can't be uploaded
+        Arguments:
+            columns: the values of the text columns returned by the block parser
+            not_numbers: the values of the number columns that aren't numbers, as returned by the block parser
+            first_row: the number of the first row of the block
+        Return:
+            Returns a list of the problems found, which is empty when all rows are valid
+        """
+        problems = []
+        for name in ['lat', 'lon']:
+            problems.extend((index, "%s '%s' is not a number" % (name, text)) for index, text in not_numbers[name].items())
+        bad_times = {one_time for one_time in set(columns['dp_time']) if __internal__.parse_time(one_time) is None}
+        if bad_times:
+            problems.extend((index, "dp_time '%s' can't be parsed" % one_time)
+                            for index, one_time in enumerate(columns['dp_time']) if one_time in bad_times)
+        return ['row %s: %s' % (first_row + index, problem) for index, problem in sorted(problems)]
+
+    @staticmethod
+    def read_columnar_values(file_path: str, start_offset: int = 0, block_bytes: int = DEFAULT_CSV_BLOCK_BYTES,
+                             end_offset: int = None):
+        """Generator returning the typed values of the rows in a CSV file, parsing and validating a block of rows at a time
+        Arguments:
+            file_path: the path of the CSV file
+            start_offset: the byte offset of the first row to return; rows start after the header when zero
+            block_bytes: the approximate size of each block of rows
+            end_offset: the byte offset to stop reading rows at, which must be the start of a row; rows are read to the end
+                        of the file when not specified
+        Return:
+            Yields a tuple of the row values returned by get_row_values(), with numeric coordinates and values, and the
+            byte offset of the next row
+        Exceptions:
+            Raises ValueError if a required column is missing or a block has rows with invalid coordinates or times
+        Notes:
+            Values that span lines aren't supported since blocks are split on line breaks
+        """
+        parse_block = __internal__.get_columnar_parser()
+        first_row = 1
+        for header, block, block_offset in __internal__.read_csv_blocks(file_path, start_offset, block_bytes, end_offset):
+            started = time.perf_counter()
+            if first_row == 1:
+                missing = [name for name in CSV_REQUIRED_COLUMNS
+                           if name not in next(csv.reader([header.decode('utf-8')]), [])]
+                if missing:
+                    raise ValueError("CSV file is missing columns: %s" % ', '.join(missing))
+
+            columns, numbers, not_numbers = parse_block(header + block)
+            row_count = len(columns['dp_time'])
+            problems = __internal__.get_invalid_rows(columns, not_numbers, first_row)
+            if problems:
+                raise ValueError("CSV file has %s invalid rows: %s" %
+                                 (len(problems), '; '.join(problems[:CSV_MAX_REPORTED_ERRORS])))
+
+            # Find the offset following each row, skipping the empty lines the parser skipped
+            lines = block.splitlines(keepends=True)
+            row_ends = [line_end for line, line_end in zip(lines, itertools.accumulate(map(len, lines)))
+                        if line not in (b'\n', b'\r\n', b'\r')]
+            if len(row_ends) != row_count:
+                raise ValueError("CSV file has values spanning lines near row %s, which the columnar reader doesn't support"
+                                 % first_row)
+
+            # Values that aren't numbers are kept as text
+            values = numbers['value']
+            for index, text in not_numbers['value'].items():
+                values[index] = text
+            __internal__.metrics.add_stage('csv_parse', time.perf_counter() - started, row_count)
+
+            for trait, lat, lon, dp_time, source, value, timestamp, row_end in zip(
+                    columns['trait'], numbers['lat'], numbers['lon'], columns['dp_time'], columns['source'], values,
+                    columns['timestamp'], row_ends):
+                yield (trait, (lat, lon), dp_time, {"source": source, "value": value}, timestamp), block_offset + row_end
+            first_row += row_count
+
+    @staticmethod
+    def read_csv_values(args: argparse.Namespace, file_path: str, start_offset: int = 0, end_offset: int = None):
+        """Generator returning the values of the rows in a CSV file using the reader chosen on the command line
+        Arguments:
+            args: the command line arguments
+            file_path: the path of the CSV file
+            start_offset: the byte offset of the first row to return; rows start after the header when zero
+            end_offset: the byte offset to stop reading rows at, which must be the start of a row; rows are read to the end
+                        of the file when not specified
+        Return:
+            Yields a tuple of the row values returned by get_row_values() and the byte offset of the next row
+        """
+        if args.csv_reader == 'columnar':
+            yield from __internal__.read_columnar_values(file_path, start_offset, args.csv_block_bytes, end_offset)
+            return
+        for row, offset in __internal__.read_csv_rows(file_path, start_offset, end_offset):
+            yield __internal__.get_row_values(row), offset
+
+    @staticmethod
+    def collect_row_keys(rows_values) -> dict:
+        """Returns the distinct stream keys of CSV rows along with the time span of each key's rows
+        Arguments:
+            rows_values: iterable of the row values returned by get_row_values()
+        Return:
+            Returns a dictionary of the keys returned by get_row_key() with a list of the earliest and latest data point
+            times of each key (None when no times could be parsed)
+        """
+        row_keys = {}
+        for row_values in rows_values:
+            time_span = row_keys.setdefault(__internal__.get_row_key(row_values), [None, None])
+            dp_time = __internal__.parse_time(row_values[2])
+            if dp_time:
+                if not time_span[0] or dp_time < time_span[0]:
+                    time_span[0] = dp_time
+                if not time_span[1] or dp_time > time_span[1]:
+                    time_span[1] = dp_time
+        return row_keys
+
+    @staticmethod
+    def parse_time(time_str: str) -> Optional[datetime.datetime]:
+        """Parses an ISO 8601 timestamp, treating timestamps without a time zone as UTC
+        Arguments:
+            time_str: the timestamp to parse (eg: 2017-01-25T09:33:02-06:00)
+        Return:
+            Returns the timestamp in UTC, or None if it can't be parsed
+        """
+        if not isinstance(time_str, str):
+            return None
+        try:
+            parsed = datetime.datetime.fromisoformat(time_str.strip().replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            return parsed.replace(tzinfo=datetime.timezone.utc)
+        return parsed.astimezone(datetime.timezone.utc)
+
+    @staticmethod
+    def get_stream_datapoints(clowder_url: str, clowder_key: str, stream_id: str, since: datetime.datetime,
+                              until: datetime.datetime, slice_hours: float = DEFAULT_DEDUP_SLICE_HOURS):
+        """Generator returning the datapoints of a stream in a time window, fetching one slice of the window at a time
+        Arguments:
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder (can be None or '')
+            stream_id: the ID of the stream
+            since: the start of the time window
+            until: the end of the time window
+            slice_hours: the number of hours of datapoints to fetch in each request
+        Return:
+            Yields each datapoint; datapoints on the boundary of two slices may be returned twice
+        """
+        url = __internal__.get_geostreams_api_url(clowder_url, 'datapoints')
+        slice_start = since
+        while True:
+            slice_end = min(slice_start + datetime.timedelta(hours=slice_hours), until)
+            params = {'stream_id': str(stream_id), 'since': slice_start.isoformat(), 'until': slice_end.isoformat()}
+            if clowder_key:
+                params['key'] = clowder_key
+
+            logging.debug("Calling geostreams url '%s' with params '%s'", url, str(params))
+            resp = __internal__.get_client().get(url, params)
+            resp.raise_for_status()
+            for one_point in resp.json():
+                yield one_point
+
+            if slice_end >= until:
+                break
+            slice_start = slice_end
+
+    @staticmethod
+    def load_existing_datapoints(args: argparse.Namespace, resolved_streams: dict, row_keys: dict,
+                                 executor: concurrent.futures.Executor = None) -> DatapointDeduplicator:
+        """Fetches the datapoints that already exist in the time spans of the rows of each resolved stream
+        Arguments:
+            args: the command line arguments
+            resolved_streams: the dictionary of resolved streams returned by resolve_row_keys()
+            row_keys: the dictionary of row key time spans returned by collect_row_keys()
+            executor: streams are fetched concurrently using the executor when specified
+        Return:
+            Returns the deduplicator holding the existing datapoints
+        """
+        # Aggregated datapoints start and end on period boundaries, which can lie outside the times of the rows
+        widen = AGGREGATE_PERIODS[args.aggregate] if args.aggregate else datetime.timedelta()
+        stream_spans = {}
+        for row_key, streams in resolved_streams.items():
+            key_span = row_keys.get(row_key)
+            if not key_span or not key_span[0]:
+                continue
+            key_span = [key_span[0] - widen, key_span[1] + widen]
+            for stream_id, _ in streams:
+                span = stream_spans.setdefault(str(stream_id), list(key_span))
+                span[0] = min(span[0], key_span[0])
+                span[1] = max(span[1], key_span[1])
+
+        deduplicator = DatapointDeduplicator(args.clowder_url, args.clowder_key, args.dedup_slice_hours)
+        loads = [(stream_id, span[0], span[1]) for stream_id, span in stream_spans.items()]
+        if executor:
+            list(executor.map(lambda load: deduplicator.load_stream(*load), loads))
+        else:
+            for one_load in loads:
+                deduplicator.load_stream(*one_load)
+        return deduplicator
+
+    @staticmethod
+    def resolve_row_keys(clowder_url: str, clowder_key: str, row_keys: Iterable,
+                         executor: concurrent.futures.Executor = None, errors: dict = None) -> dict:
+        """Resolves the streams of row keys
+        Arguments:
+            clowder_url: the URL of the Clowder instance to access
+            clowder_key: the key to use when accessing Clowder
+            row_keys: the keys returned by get_row_key() to resolve
+            executor: the keys are resolved concurrently using the executor when specified
+            errors: when specified, the exception of each key that can't be resolved is stored in this dictionary instead
+                    of being raised, and the key is left out of the returned dictionary
+        Return:
+            Returns a dictionary of the list of resolved streams for each key
+        """
+        def resolve_key(row_key: tuple) -> Optional[list]:
+            """Resolves the streams of one row key"""
+            try:
+                return __internal__.resolve_datapoint_streams(clowder_url, clowder_key, row_key[0],
+                                                              (row_key[1], row_key[2]), row_key[3])
+            except Exception as ex:
+                if errors is None:
+                    raise
+                errors[row_key] = ex
+                return None
+
+        row_keys = list(row_keys)
+        if executor:
+            resolved = dict(zip(row_keys, executor.map(resolve_key, row_keys)))
+        else:
+            resolved = {row_key: resolve_key(row_key) for row_key in row_keys}
+        return {row_key: streams for row_key, streams in resolved.items() if row_key not in (errors or {})}
 
-            joined_parts = '/'.join(url_parts).replace('//', '/').strip('/')
+    @staticmethod
+    def upload_csv_file(args: argparse.Namespace, file_path: str, resolved_streams: dict,
+                        executor: concurrent.futures.Executor = None, journal: CheckpointJournal = None,
+                        checkpoint: dict = None, row_keys: dict = None) -> tuple:
+        """Uploads the data points in a CSV file whose row keys have been resolved
+        Arguments:
+            args: the command line arguments
+            file_path: the path of the CSV file
+            resolved_streams: the dictionary of resolved streams returned by resolve_row_keys() for the file
+            executor: uploads are made concurrently using the executor when specified
+            journal: progress is recorded in the journal when specified
+            checkpoint: the checkpoint to resume uploading from, as returned by get_resume_checkpoint()
+            row_keys: the row key time spans returned by collect_row_keys(), used to find existing data points
+        Return:
+            Returns a tuple of the file report and the list of the number of data points in each upload
+        """
+        start_timestamp = datetime.datetime.now()
+        batcher = DatapointBatcher(args.clowder_url, args.clowder_key, args.batch_size, args.batch_max_bytes, executor,
+                                   args.workers * UPLOADS_IN_FLIGHT_PER_WORKER)
+        start_offset = checkpoint['offset'] if checkpoint else 0
+        start_row = checkpoint['rows'] if checkpoint else 0
+        lines_read = 0
+        # The offset following the last row handed to the batcher, which is where to resume from after an error
+        last_offset = start_offset
+        error = None
+        deduplicator = None
+        aggregator = DatapointAggregator(args.aggregate) if args.aggregate else None
+        try:
+            if args.dedup:
+                deduplicator = __internal__.load_existing_datapoints(args, resolved_streams, row_keys or {}, executor)
 
-            return built_url + joined_parts
+            offset = start_offset
+            for row_values, offset in __internal__.read_csv_values(args, file_path, start_offset):
+                _, _, time_fmt, dp_metadata, _ = row_values
+                streams = resolved_streams[__internal__.get_row_key(row_values)]
+                if not aggregator or not aggregator.add(streams, time_fmt, dp_metadata):
+                    __internal__.add_datapoints(args.clowder_url, args.clowder_key, streams, time_fmt, time_fmt, dp_metadata,
+                                                batcher=batcher, deduplicator=deduplicator)
+                lines_read += 1
+                last_offset = offset
 
-        if not url_particles:
-            return url_join(base_url, tuple(GEOSTREAMS_API_URL_PARTICLE))
+                # Aggregated datapoints are only complete at the end of the file, so there's no clean point to resume from
+                if journal and not aggregator and lines_read % args.checkpoint_rows == 0:
+                    # Upload everything read so far so that the checkpoint is a clean point to resume from
+                    batcher.flush()
+                    batcher.wait()
+                    journal.save(offset, start_row + lines_read)
+                    __internal__.save_shard_progress(file_path, 'running', start_row + lines_read, batcher)
 
-        if isinstance(url_particles, str):
-            return url_join(base_url, (GEOSTREAMS_API_URL_PARTICLE, url_particles))
+            if aggregator:
+                for streams, start_time, end_time, properties in aggregator.get_datapoints():
+                    __internal__.add_datapoints(args.clowder_url, args.clowder_key, streams, start_time, end_time, properties,
+                                                batcher=batcher, deduplicator=deduplicator)
+            batcher.flush()
+            batcher.wait()
+            if journal:
+                journal.save(offset, start_row + lines_read, complete=True)
+            __internal__.save_shard_progress(file_path, 'complete', start_row + lines_read, batcher)
+        except Exception as ex:
+            logging.exception("Error reading CSV file '%s'. Continuing processing", os.path.basename(file_path))
+            error = repr(ex)
+            try:
+                # Upload the datapoints that were resolved before the error occurred, and record that they were uploaded;
+                # wait() raises if any upload failed, so the checkpoint never moves past datapoints that weren't stored
+                batcher.flush()
+                batcher.wait()
+                if journal and not aggregator and not batcher.failed:
+                    journal.save(last_offset, start_row + lines_read)
+            except Exception:
+                logging.exception("Error uploading remaining datapoints for CSV file '%s'", os.path.basename(file_path))
+            __internal__.save_shard_progress(file_path, 'error', start_row + lines_read, batcher)
 
-        formatted_particles = tuple(str(part) for part in url_particles)
-        return url_join(base_url, tuple(GEOSTREAMS_API_URL_PARTICLE) + formatted_particles)
+        report = __internal__.get_file_report(file_path, datetime.datetime.now() - start_timestamp, lines_read, error)
+        report['datapoint_batches'] = str(batcher.batches_sent)
+        if start_row:
+            report['resumed_from_row'] = str(start_row)
+        if deduplicator:
+            report['datapoints_skipped'] = str(deduplicator.skipped)
+            report['datapoints_uploaded'] = str(sum(batcher.batch_sizes))
+        if aggregator:
+            report['lines_aggregated'] = str(aggregator.rows_aggregated)
+            report['lines_not_aggregated'] = str(aggregator.rows_not_aggregated)
+        return report, batcher.batch_sizes
 
     @staticmethod
-    def _common_geostreams_name_get(clowder_url: str, clowder_key: str, url_endpoint: str, name_query_key: str, name: str) -> \
-            Optional[dict]:
-        """Common function for retrieving data from GeoStreams by name
+    def save_shard_progress(file_path: str, status: str, lines: int, batcher: DatapointBatcher) -> None:
+        """Records the progress of uploading a CSV file when the run is a shard
         Arguments:
-            clowder_url: the URL of the Clowder instance to access
-            clowder_key: the key to use when accessing Clowder (can be None or '')
-            url_endpoint: the endpoint to query (URL particle appended to the base URL, eg: 'streams')
-            name_query_key: the name of the query portion of URL identifying the name to search on (eg: 'stream_name')
-            name: the name to search on
+            file_path: the path of the CSV file
+            status: the status of the file's upload
+            lines: the number of lines of the file read so far
+            batcher: the batcher uploading the file's datapoints
+        """
+        if not __internal__.shard_coordinator or not __internal__.shard_coordinator.run_folder:
+            return
+        try:
+            __internal__.shard_coordinator.save_progress({'status': status, 'lines_loaded': str(lines),
+                                                          'datapoints_uploaded': str(sum(batcher.batch_sizes))}, file_path)
+        except OSError:
+            logging.exception("Unable to record the shard progress of CSV file '%s'", os.path.basename(file_path))
+
+    @staticmethod
+    def open_checkpoint_journal(args: argparse.Namespace, file_path: str) -> Optional[CheckpointJournal]:
+        """Opens the checkpoint journal of a CSV file in the working space
+        Arguments:
+            args: the command line arguments
+            file_path: the path of the CSV file
         Return:
-            Returns the found information, or None if not found
+            Returns the journal, or None if checkpoints are disabled or there is no working space
         """
-        url = __internal__.get_geostreams_api_url(clowder_url, url_endpoint)
-        params = {name_query_key: name}
-        if clowder_key:
-            params['key'] = clowder_key
+        working_space = getattr(args, 'working_space', None)
+        if not working_space or args.checkpoint_rows <= 0:
+            return None
 
-        logging.debug("Calling geostreams url '%s' with params '%s'", url, str(params))
-        resp = requests.get(url, params)
-        resp.raise_for_status()
+        journal_folder = os.path.join(working_space, CHECKPOINT_FOLDER_NAME)
+        if args.shard:
+            # Each shard uploads different rows of a file, so each has its own checkpoints
+            journal_folder = os.path.join(journal_folder, 'shard-%s-of-%s' % args.shard)
+        os.makedirs(journal_folder, exist_ok=True)
+        return CheckpointJournal(journal_folder, file_path)
 
-        for one_item in resp.json():
-            if 'name' in one_item and one_item['name'] == name:
-                logging.debug("Found %s '%s' = [%s]", name_query_key, name, one_item['id'])
-                return one_item
+    @staticmethod
+    def get_resume_checkpoint(args: argparse.Namespace, journal: Optional[CheckpointJournal]) -> Optional[dict]:
+        """Returns the checkpoint to resume uploading a CSV file from
+        Arguments:
+            args: the command line arguments
+            journal: the journal of the file
+        Return:
+            Returns the checkpoint returned by CheckpointJournal.load(), or None if the upload isn't being resumed
+        """
+        if not args.resume or not journal:
+            return None
 
-        return None
+        checkpoint = journal.load()
+        if checkpoint['rows']:
+            logging.info("Resuming upload of '%s' after row %s", os.path.basename(journal.file_path), checkpoint['rows'])
+        return checkpoint
 
     @staticmethod
-    def common_geostreams_create(clowder_url: str, clowder_key: str, url_endpoint: str, request_body: str) -> Optional[str]:
-        """Common function for creating an object in GeoStreams
+    def get_file_report(file_path: str, processing_time: datetime.timedelta, lines_read: int = 0, error: str = None) -> dict:
+        """Returns the report on the processing of a file
         Arguments:
-            clowder_url: the URL of the Clowder instance to access
-            clowder_key: the key to use when accessing Clowder (can be None or '')
-            url_endpoint: the endpoint to query (URL particle appended to the base URL, eg: 'streams')
-            request_body: the body of the request
+            file_path: the path of the file
+            processing_time: the time taken to process the file
+            lines_read: the number of lines loaded from the file
+            error: the error that stopped processing of the file, if there was one
         Return:
-            Returns the ID of the created object or None if no ID was returned
+            The file report
         """
-        url = __internal__.get_geostreams_api_url(clowder_url, url_endpoint)
-        if clowder_key:
-            url = url + '?key=' + clowder_key
+        report = {
+            'file': file_path,
+            'status': 'error' if error is not None else 'loaded',
+            'processing_time': str(processing_time),
+            'lines_loaded': str(lines_read)
+        }
+        if error is not None:
+            report['error'] = error
+        return report
 
-        result = requests.post(url,
-                               headers={'Content-type': 'application/json'},
-                               data=request_body)
-        result.raise_for_status()
+    @staticmethod
+    def process_csv_file(args: argparse.Namespace, file_path: str) -> tuple:
+        """Resolves the streams of, and uploads the data points in, a CSV file
+        Arguments:
+            args: the command line arguments
+            file_path: the path of the CSV file
+        Return:
+            Returns a tuple of the file report and the list of the number of data points in each upload
+        """
+        start_timestamp = datetime.datetime.now()
+        try:
+            journal = __internal__.open_checkpoint_journal(args, file_path)
+            checkpoint = __internal__.get_resume_checkpoint(args, journal)
+            if checkpoint and checkpoint['complete']:
+                logging.info("All rows of '%s' were already uploaded", os.path.basename(file_path))
+                return __internal__.get_file_report(file_path, datetime.datetime.now() - start_timestamp), []
 
-        result_id = None
-        result_json = result.json()
-        if isinstance(result_json, dict) and 'id' in result_json:
-            result_id = result_json['id']
-            logging.debug("Created GeoStreams %s: id = '%s'", url_endpoint, result_id)
+            # Find the distinct trait, location, and date combinations in the file and resolve their streams
+            row_keys = __internal__.collect_row_keys(
+                row_values for row_values, _ in __internal__.read_csv_values(args, file_path,
+                                                                             checkpoint['offset'] if checkpoint else 0))
+            resolved_streams = __internal__.resolve_row_keys(args.clowder_url, args.clowder_key, row_keys, __internal__.executor)
+        except Exception as ex:
+            logging.exception("Error reading CSV file '%s'. Continuing processing", os.path.basename(file_path))
+            return __internal__.get_file_report(file_path, datetime.datetime.now() - start_timestamp, error=repr(ex)), []
+
+        # Read the file again, queueing up the data points for upload
+        report, batch_sizes = __internal__.upload_csv_file(args, file_path, resolved_streams, __internal__.executor,
+                                                           journal, checkpoint, row_keys)
+        report['processing_time'] = str(datetime.datetime.now() - start_timestamp)
+        return report, batch_sizes
+
+    @staticmethod
+    def scan_csv_file_in_worker(args: argparse.Namespace, file_path: str) -> tuple:
+        """Process pool entry point returning the distinct row keys of a CSV file
+        Arguments:
+            args: the command line arguments
+            file_path: the path of the CSV file
+        Return:
+            Returns a tuple of the row keys returned by collect_row_keys(), the file's checkpoint journal, the checkpoint to
+            resume from, the time taken, and the state of the worker's metrics
+        """
+        start_timestamp = datetime.datetime.now()
+        __internal__.metrics = RunMetrics()
+        journal = __internal__.open_checkpoint_journal(args, file_path)
+        checkpoint = __internal__.get_resume_checkpoint(args, journal)
+        if checkpoint and checkpoint['complete']:
+            row_keys = {}
         else:
-            logging.debug("Call to GeoStreams create %s returned no ID", url_endpoint)
+            row_keys = __internal__.collect_row_keys(
+                row_values for row_values, _ in __internal__.read_csv_values(args, file_path,
+                                                                             checkpoint['offset'] if checkpoint else 0))
+        return row_keys, journal, checkpoint, datetime.datetime.now() - start_timestamp, __internal__.metrics.get_state()
 
-        return result_id
+    @staticmethod
+    def open_checkpoint_in_worker(args: argparse.Namespace, file_path: str) -> tuple:
+        """Process pool entry point returning the checkpoint journal of a CSV file whose rows are scanned in ranges
+        Arguments:
+            args: the command line arguments
+            file_path: the path of the CSV file
+        Return:
+            Returns a tuple of the file's checkpoint journal, the checkpoint to resume from, and the time taken
+        """
+        start_timestamp = datetime.datetime.now()
+        journal = __internal__.open_checkpoint_journal(args, file_path)
+        checkpoint = __internal__.get_resume_checkpoint(args, journal)
+        return journal, checkpoint, datetime.datetime.now() - start_timestamp
 
     @staticmethod
-    def get_sensor_by_name(sensor_name: str, clowder_url: str, clowder_key: str) -> Optional[dict]:
-        """Returns the GeoStreams sensor information retrieved from Clowder
+    def scan_csv_range_in_worker(args: argparse.Namespace, file_path: str, start_offset: int, end_offset: int) -> tuple:
+        """Process pool entry point returning the distinct row keys of a range of rows of a CSV file
         Arguments:
-            sensor_name: the name of the data sensor to retrieve
-            clowder_url: the URL of the Clowder instance to access
-            clowder_key: the key to use when accessing Clowder (can be None or '')
+            args: the command line arguments
+            file_path: the path of the CSV file
+            start_offset: the byte offset of the first row of the range
+            end_offset: the byte offset of the end of the range
         Return:
-            Returns the information on the sensor or None if the stream can't be found
+            Returns a tuple of the row keys returned by collect_row_keys(), the time taken, and the state of the worker's
+            metrics
         """
-        return __internal__._common_geostreams_name_get(clowder_url, clowder_key, 'sensors', 'sensor_name', sensor_name)
+        start_timestamp = datetime.datetime.now()
+        __internal__.metrics = RunMetrics()
+        row_keys = __internal__.collect_row_keys(
+            row_values for row_values, _ in __internal__.read_csv_values(args, file_path, start_offset, end_offset))
+        return row_keys, datetime.datetime.now() - start_timestamp, __internal__.metrics.get_state()
 
     @staticmethod
-    def get_stream_by_name(stream_name: str, clowder_url: str, clowder_key: str) -> Optional[dict]:
-        """Returns the GeoStreams stream information retrieved from Clowder
+    def get_scan_ranges(args: argparse.Namespace, file_path: str) -> list:
+        """Returns the ranges of rows of a CSV file that are scanned by separate processes
         Arguments:
-            stream_name: the name of the data stream to retrieve
-            clowder_url: the URL of the Clowder instance to access
-            clowder_key: the key to use when accessing Clowder (can be None or '')
+            args: the command line arguments
+            file_path: the path of the CSV file
         Return:
-            Returns the information on the stream or None if the stream can't be found
+            Returns the list of ranges returned by get_row_ranges(), or an empty list if the file is scanned as a whole
         """
-        return __internal__._common_geostreams_name_get(clowder_url, clowder_key, 'streams', 'stream_name', stream_name)
+        if args.file_workers <= 1 or args.csv_split_bytes <= 0 or __internal__.get_csv_compression(file_path) or \
+                os.path.getsize(file_path) < args.csv_split_bytes:
+            return []
+        return __internal__.get_row_ranges(file_path, 0, args.file_workers)
 
     @staticmethod
-    def create_sensor(sensor_name: str, clowder_url: str, clowder_key: str, geom: dict, sensor_type: dict, region: str) -> str:
-        """Create a new sensor in Geostreams.
+    def get_scan_result(scanning: list) -> tuple:
+        """Combines the results of the process pool jobs scanning a CSV file
         Arguments:
-            sensor_name: name of new sensor to create
-            clowder_url: the URL of the Clowder instance to access
-            clowder_key: the key to use when accessing Clowder (can be None or '')
-            geom: GeoJSON object of sensor geometry
-            sensor_type: JSON object with {"id", "title", and "sensorType"}
-            region: region of sensor
+            scanning: the future of scan_csv_file_in_worker(), or the future of open_checkpoint_in_worker() followed by the
+                      futures of scan_csv_range_in_worker() for each range of the file
+        Return:
+            Returns the value returned by scan_csv_file_in_worker()
         """
-        body = {
-            "name": sensor_name,
-            "type": "Point",
-            "geometry": geom,
-            "properties": {
-                "popupContent": sensor_name,
-                "type": sensor_type,
-                "name": sensor_name,
-                "region": region
-            }
-        }
+        if len(scanning) == 1:
+            return scanning[0].result()
 
-        return __internal__.common_geostreams_create(clowder_url, clowder_key, 'sensors', json.dumps(body))
+        journal, checkpoint, scan_time = scanning[0].result()
+        row_keys = {}
+        metrics = RunMetrics()
+        for one_range in scanning[1:]:
+            range_keys, range_time, range_metrics = one_range.result()
+            metrics.merge(range_metrics)
+            scan_time = max(scan_time, range_time)
+            for row_key, range_span in range_keys.items():
+                time_span = row_keys.setdefault(row_key, [None, None])
+                if range_span[0] and (not time_span[0] or range_span[0] < time_span[0]):
+                    time_span[0] = range_span[0]
+                if range_span[1] and (not time_span[1] or range_span[1] > time_span[1]):
+                    time_span[1] = range_span[1]
+        if checkpoint and checkpoint['complete']:
+            row_keys = {}
+        return row_keys, journal, checkpoint, scan_time, metrics.get_state()
 
     @staticmethod
-    def create_stream(stream_name: str, clowder_url: str, clowder_key: str, sensor_id: str, geom: dict, properties=None) -> str:
-        """Create the indicated GeoStream
+    def upload_csv_file_in_worker(args: argparse.Namespace, file_path: str, resolved_streams: dict, stream_entries: dict,
+                                  scan_result: tuple, shard_folder: str = None) -> tuple:
+        """Process pool entry point uploading the data points in a CSV file whose row keys have been resolved
         Arguments:
-            stream_name: the name of the  data stream to retrieve
-            clowder_url: the URL of the Clowder instance to access
-            clowder_key: the key to use when accessing Clowder (can be None or '')
-            sensor_id: the ID of the sensor associated with the stream
-            geom: the geometry of the stream to create
-            properties: additional properties for the stream
+            args: the command line arguments
+            file_path: the path of the CSV file
+            resolved_streams: the dictionary of resolved streams returned by resolve_row_keys() for the file
+            stream_entries: the resolution cache entries of the streams, used to replace streams that have been removed
+            scan_result: the value returned by scan_csv_file_in_worker() for the file
+            shard_folder: the folder the progress of the shard being uploaded is recorded in
         Return:
-            The ID of the created stream
+            Returns the value returned by upload_csv_file() followed by the state of the worker's metrics
         """
-        body = {
-            "name": stream_name,
-            "type": "Feature",
-            "geometry": geom,
-            "properties": {} if not properties else properties,
-            "sensor_id": str(sensor_id)
-        }
+        start_timestamp = datetime.datetime.now()
+        row_keys, journal, checkpoint, scan_time, _ = scan_result
+        if checkpoint and checkpoint['complete']:
+            logging.info("All rows of '%s' were already uploaded", os.path.basename(file_path))
+            return __internal__.get_file_report(file_path, scan_time), [], None
 
-        return __internal__.common_geostreams_create(clowder_url, clowder_key, 'streams', json.dumps(body))
+        worker_args = argparse.Namespace(**vars(args))
+        worker_args.resolution_index = 'bypass'
+        # Share the GeoStreams request limits between the processes uploading at the same time
+        worker_args.geostreams_max_rate = args.geostreams_max_rate / args.file_workers
+        worker_args.geostreams_max_in_flight = int(math.ceil(args.geostreams_max_in_flight / args.file_workers))
+        __internal__.configure_run(worker_args)
+        if __internal__.shard_coordinator:
+            __internal__.shard_coordinator.run_folder = shard_folder
+        try:
+            for stream_name, stream_info in stream_entries.items():
+                __internal__.resolution_cache.put('streams', stream_name, stream_info)
+            report, batch_sizes = __internal__.upload_csv_file(worker_args, file_path, resolved_streams, __internal__.executor,
+                                                               journal, checkpoint, row_keys)
+            report['processing_time'] = str(datetime.datetime.now() - start_timestamp + scan_time)
+            return report, batch_sizes, __internal__.metrics.get_state()
+        finally:
+            __internal__.release_run()
 
     @staticmethod
-    def create_data_points(clowder_url: str, clowder_key: str, stream_id: str, data_point_list: list) -> None:
-        """Uploads the data points to GeoStreams
+    def process_csv_files_in_parallel(args: argparse.Namespace, file_paths: list) -> list:
+        """Processes CSV files in a pool of processes, resolving the streams of all the files in this process so that
+           no sensor or stream is created more than once
         Arguments:
-            clowder_url: the URL of the Clowder instance to access
-            clowder_key: the key to use when accessing Clowder (can be None or '')
-            stream_id: the ID of the stream to upload to
-            data_point_list: the list of data points to upload
+            args: the command line arguments
+            file_paths: the paths of the CSV files
+        Return:
+            Returns a list of the values returned by upload_csv_file() for each file, in file order
         """
-        body = {
-            "datapoints": data_point_list,
-            "stream_id": str(stream_id)
-        }
+        results = {}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.file_workers,
+                                                    mp_context=multiprocessing.get_context('spawn')) as pool:
+            # Find the distinct row keys of every file, then resolve them all at once
+            # Large files are scanned in ranges of rows by several processes
+            scans = []
+            for one_file in file_paths:
+                ranges = __internal__.get_scan_ranges(args, one_file)
+                if ranges:
+                    scanning = [pool.submit(__internal__.open_checkpoint_in_worker, args, one_file)] + \
+                        [pool.submit(__internal__.scan_csv_range_in_worker, args, one_file, start, end) for start, end in ranges]
+                else:
+                    scanning = [pool.submit(__internal__.scan_csv_file_in_worker, args, one_file)]
+                scans.append((one_file, scanning))
+            file_keys = {}
+            scan_results = {}
+            for one_file, scanning in scans:
+                try:
+                    scan_results[one_file] = __internal__.get_scan_result(scanning)
+                    file_keys[one_file] = scan_results[one_file][0]
+                    __internal__.metrics.merge(scan_results[one_file][4])
+                except Exception as ex:
+                    logging.error("Error reading CSV file '%s'. Continuing processing: %s", os.path.basename(one_file), str(ex))
+                    results[one_file] = (__internal__.get_file_report(one_file, datetime.timedelta(), error=repr(ex)), [])
+
+            all_keys = set()
+            for row_keys in file_keys.values():
+                all_keys.update(row_keys)
+            key_errors = {}
+            resolved_streams = __internal__.resolve_row_keys(args.clowder_url, args.clowder_key, all_keys, __internal__.executor,
+                                                             key_errors)
+            for one_file in [one_file for one_file, row_keys in file_keys.items() if not key_errors.keys().isdisjoint(row_keys)]:
+                # The rows of the file can't all be uploaded, so none of them are
+                ex = next(key_errors[row_key] for row_key in file_keys.pop(one_file) if row_key in key_errors)
+                logging.error("Error resolving the streams of CSV file '%s'. Continuing processing: %s",
+                              os.path.basename(one_file), str(ex))
+                results[one_file] = (__internal__.get_file_report(one_file, datetime.timedelta(), error=repr(ex)), [])
+            stream_entries = {}
+            with __internal__.resolution_cache.lock:
+                for (url_endpoint, name), info in __internal__.resolution_cache.entries.items():
+                    if url_endpoint == 'streams':
+                        stream_entries[str(info.get('id'))] = (name, info)
+
+            # Upload the files' data points
+            uploads = []
+            for one_file, row_keys in file_keys.items():
+                file_streams = {row_key: resolved_streams[row_key] for row_key in row_keys}
+                file_entries = dict(stream_entries[str(stream_id)] for streams in file_streams.values()
+                                    for stream_id, _ in streams if str(stream_id) in stream_entries)
+                shard_folder = __internal__.shard_coordinator.run_folder if __internal__.shard_coordinator else None
+                uploads.append((one_file, pool.submit(__internal__.upload_csv_file_in_worker, args, one_file, file_streams,
+                                                      file_entries, scan_results[one_file], shard_folder)))
+            for one_file, uploading in uploads:
+                try:
+                    report, batch_sizes, worker_metrics = uploading.result()
+                    __internal__.metrics.merge(worker_metrics)
+                except Exception as ex:
+                    logging.error("Error uploading CSV file '%s'. Continuing processing: %s", os.path.basename(one_file), str(ex))
+                    report, batch_sizes = __internal__.get_file_report(one_file, datetime.timedelta(), error=repr(ex)), []
+                results[one_file] = (report, batch_sizes)
 
-        __internal__.common_geostreams_create(clowder_url, clowder_key, 'datapoints/bulk', json.dumps(body))
+        return [results[one_file] for one_file in file_paths]
 
     @staticmethod
-    def get_matched_sites(clowder_url: str, clowder_key: str, plot_name: str, lat_lon: tuple, filter_date: str) -> dict:
-        """Returns sensor metadata matching the plot
+    def configure_run(args: argparse.Namespace) -> None:
+        """Prepares the shared clients, caches and workers used while processing
         Arguments:
-            clowder_url: the URL of the Clowder instance to load the file to
-            clowder_key: the key to use when accessing Clowder
-            plot_name: name of plot to map data point into if possible, otherwise query BETY
-            lat_lon: [latitude, longitude] tuple of data point location
-            filter_date: date used to restrict number of sites returned from BETYdb
+            args: the command line arguments
+        """
+        __internal__.metrics = RunMetrics()
+        __internal__.geostreams_limiter = RateLimiter('GeoStreams', args.geostreams_max_rate, args.geostreams_max_in_flight,
+                                                      args.rate_target_latency)
+        __internal__.betydb_limiter = RateLimiter('BETYdb', args.betydb_max_rate, args.betydb_max_in_flight,
+                                                  args.rate_target_latency)
+        if args.offline:
+            # pylint: disable=import-outside-toplevel
+            import offline_backend
+            __internal__.client = offline_backend.OfflineGeoStreams(args.offline_store, args.offline_latency)
+            if not args.site_file and not args.manifest:
+                logging.warning("Running offline without a site file, sites will be fetched from BETYdb")
+        else:
+            __internal__.client = GeoStreamsClient(max(args.http_pool_size, args.workers), args.http_timeout,
+                                                   args.http_retries, args.http_backoff, __internal__.metrics,
+                                                   args.http_gzip_min_bytes, __internal__.geostreams_limiter)
+        __internal__.executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+        __internal__.resolution_cache = ResolutionCache(__internal__.open_resolution_index(args))
+        if args.manifest:
+            __internal__.load_manifest(args)
+        site_file = args.site_file or args.manifest
+        __internal__.site_source = FileSites(site_file) if site_file else BetydbSites()
+        __internal__.site_matcher = SiteMatcher(__internal__.site_source) if args.site_index else None
+        __internal__.matched_sites_cache = LruCache(args.site_cache_size)
+        __internal__.site_geometry_cache = LruCache(args.site_cache_size)
+        __internal__.site_cache_precision = args.site_cache_precision
+        __internal__.shard_coordinator = ShardCoordinator(args.working_space, args.shard) \
+            if args.shard and getattr(args, 'working_space', None) else None
+
+    @staticmethod
+    def release_run() -> None:
+        """Releases the connections, files and workers prepared by configure_run()
+        """
+        if __internal__.executor:
+            __internal__.executor.shutdown()
+            __internal__.executor = None
+        __internal__.resolution_cache.close()
+        if __internal__.client:
+            __internal__.client.close()
+            __internal__.client = None
+
+    @staticmethod
+    def reset_job_counters() -> None:
+        """Starts the metrics and cache counters of a job afresh while keeping the clients and caches of the service
+        """
+        __internal__.metrics = RunMetrics()
+        if isinstance(__internal__.client, GeoStreamsClient):
+            __internal__.client.metrics = __internal__.metrics
+        __internal__.resolution_cache.hits = 0
+        __internal__.resolution_cache.misses = 0
+        __internal__.resolution_cache.index_hits = 0
+        __internal__.matched_sites_cache.hits = 0
+        __internal__.matched_sites_cache.misses = 0
+
+    @staticmethod
+    def get_store_url(args: argparse.Namespace) -> Optional[str]:
+        """Returns the URL identifying where sensors and streams are stored, keeping the IDs of an offline store apart from
+           those of Clowder
+        Arguments:
+            args: the command line arguments
         Return:
-            Returns the sites matching the plot and date. An empty dict may be returned
+            Returns the URL, or None when the sensors and streams are in an offline store in memory
         """
-        # SENSOR is the plot
-        matched_sites = {}
-        if plot_name:
-            # If provided a plot name, see if the sensor exists before going into more expensive logic
-            sensor_data = __internal__.get_sensor_by_name(plot_name, clowder_url, clowder_key)
-            if sensor_data:
-                matched_sites[sensor_data['id']] = {
-                    "name": plot_name,
-                    "geom": sensor_data['geometry']
-                }
+        if args.offline:
+            if args.offline_store == ':memory:':
+                return None
+            return 'offline:' + os.path.abspath(args.offline_store)
+        return args.clowder_url
 
-        if not matched_sites:
-            # If we don't have existing sensor to use quickly, we must query geographically
-            site_list = get_sites_by_latlon(lat_lon, filter_date)
-            for one_site in site_list:
-                plot_name = one_site['sitename']
-                plot_geom = json.loads(wkt_to_geojson(one_site['geometry']))
+    @staticmethod
+    def load_manifest(args: argparse.Namespace) -> None:
+        """Adds the sensors and streams in a manifest written by warm_up() to the resolution cache
+        Arguments:
+            args: the command line arguments
+        """
+        try:
+            with open(args.manifest, 'r') as in_file:
+                manifest = json.load(in_file)
+        except (OSError, ValueError):
+            logging.exception("Unable to load manifest '%s', sensors and streams will be looked up", args.manifest)
+            return
+        store_url = __internal__.get_store_url(args)
+        if not store_url or manifest.get('store_url') != store_url:
+            logging.warning("Manifest '%s' was made for '%s', sensors and streams will be looked up", args.manifest,
+                            manifest.get('store_url'))
+            return
 
-                # Get existing sensor with this plot name from geostreams, or create if it doesn't exist
-                sensor_data = __internal__.get_sensor_by_name(plot_name, clowder_url, clowder_key)
-                if not sensor_data:
-                    sensor_id = __internal__.create_sensor(plot_name, clowder_url, clowder_key, plot_geom,
-                                                           {
-                                                               "id": "MAC Field Scanner",
-                                                               "title": "MAC Field Scanner",
-                                                               "sensorType": GEOSTREAMS_CSV_SENSOR_TYPE
-                                                           },
-                                                           "Maricopa")
-                    matched_sites[sensor_id] = {"name": plot_name, "geom": plot_geom}
-                else:
-                    sensor_id = sensor_data['id']
-                    matched_sites[sensor_id] = {"name": plot_name, "geom": plot_geom}
+        stream_count = 0
+        for one_feature in manifest.get('features', []):
+            properties = one_feature['properties']
+            sensor_id = properties['sensor_id']
+            __internal__.resolution_cache.put('sensors', properties['sitename'],
+                                              {'id': sensor_id, 'name': properties['sitename'],
+                                               'geometry': one_feature['geometry']})
+            for trait, stream_id in properties.get('streams', {}).items():
+                stream_name = "%s (%s)" % (trait, sensor_id)
+                __internal__.resolution_cache.put('streams', stream_name,
+                                                  {'id': stream_id, 'name': stream_name, 'geometry': one_feature['geometry'],
+                                                   'sensor_id': str(sensor_id)})
+                stream_count += 1
+        logging.info("Loaded %s sensors and %s streams from manifest '%s'", len(manifest.get('features', [])), stream_count,
+                     args.manifest)
 
-        return matched_sites
+    @staticmethod
+    def write_manifest(manifest_path: str, manifest: dict) -> None:
+        """Writes a manifest, replacing any previous manifest only once the new one is complete
+        Arguments:
+            manifest_path: the path of the manifest
+            manifest: the manifest to write
+        """
+        temp_path = manifest_path + '.tmp'
+        with open(temp_path, 'w') as out_file:
+            json.dump(manifest, out_file)
+        os.replace(temp_path, manifest_path)
 
     @staticmethod
-    def create_datapoint(clowder_url: str, clowder_key: str, stream_id: str, geom: dict, start_time: str, end_time: str,
-                         properties: dict = None) -> str:
-        """Create a new data point in Geostreams
+    def open_resolution_index(args: argparse.Namespace) -> Optional[ResolutionIndex]:
+        """Opens the persistent sensor and stream index in the working space
         Arguments:
-            clowder_url: the URL of the Clowder instance to load the file to
-            clowder_key: the key to use when accessing Clowder
-            stream_id: id of stream to attach data point to
-            geom: GeoJSON object of sensor geometry
-            start_time: start time, in format 2017-01-25T09:33:02-06:00
-            end_time: end time, in format 2017-01-25T09:33:02-06:00
-            properties: JSON object with any desired properties
+            args: the command line arguments
         Return:
-            The ID of the created data point
+            Returns the index, or None if the index is bypassed or there is no working space
         """
-        body = {
-            "start_time": start_time,
-            "end_time": end_time,
-            "type": "Point",
-            "geometry": geom,
-            "properties": properties,
-            "stream_id": str(stream_id)
-        }
+        working_space = getattr(args, 'working_space', None)
+        if args.resolution_index == 'bypass' or not working_space:
+            return None
+
+        # Don't keep the entries of an offline store in memory
+        index_url = __internal__.get_store_url(args)
+        if not index_url:
+            return None
 
-        return __internal__.common_geostreams_create(clowder_url, clowder_key, 'datapoints', json.dumps(body))
+        index_path = os.path.join(working_space, RESOLUTION_INDEX_FILE_NAME)
+        try:
+            index = ResolutionIndex(index_path, index_url, args.resolution_index_ttl * 3600)
+        except sqlite3.Error:
+            logging.exception("Unable to open sensor and stream index '%s', continuing without it", index_path)
+            return None
+        if args.resolution_index == 'rebuild':
+            logging.info("Rebuilding sensor and stream index '%s'", index_path)
+            index.clear()
+
+        return index
 
     @staticmethod
-    def create_datapoint_with_dependencies(clowder_traits_url: str, clowder_key: str, stream_prefix: str, lat_lon: tuple,
-                                           start_time: str, end_time: str, metadata: dict = None, filter_date: str = '',
-                                           geom: dict = None, plot_name: str = None) -> None:
-        """ Submit traits CSV file to Clowder
+    def write_metrics_file(args: argparse.Namespace, run_values: dict) -> None:
+        """Writes the metrics of the run to the metrics file, replacing the previous file so that it's never read partially
         Arguments:
-            clowder_traits_url: the URL of the Clowder instance to load the file to
-            clowder_key: the key to use when accessing Clowder
-            stream_prefix: prefix of stream to attach data point to
-            lat_lon: [latitude, longitude] tuple of data point location
-            start_time: start time, in format 2017-01-25T09:33:02-06:00
-            end_time: end time, in format 2017-01-25T09:33:02-06:00
-            metadata: JSON object with any desired properties
-            filter_date: date used to restrict number of sites returned from BETYdb
-            geom: geometry for data point (use plot if not provided)
-            plot_name: name of plot to map data point into if possible, otherwise query BETY
-        Exceptions:
-            Raises RuntimeError exception if a Clowder URL is not specified
+            args: the command line arguments
+            run_values: additional values describing the run
         """
-        matched_sites = __internal__.get_matched_sites(clowder_traits_url, clowder_key, plot_name, lat_lon, filter_date)
+        if not args.metrics_file:
+            return
 
-        for sensor_id in matched_sites:
-            plot_geom = matched_sites[sensor_id]["geom"]
-            stream_name = "%s (%s)" % (stream_prefix, sensor_id)
-            stream_data = __internal__.get_stream_by_name(stream_name, clowder_traits_url, clowder_key)
-            if not stream_data:
-                stream_id = __internal__.create_stream(stream_name, clowder_traits_url, clowder_key, sensor_id, plot_geom)
-            else:
-                stream_id = stream_data['id']
+        temp_path = args.metrics_file + '.tmp'
+        try:
+            with open(temp_path, 'w') as out_file:
+                out_file.write(__internal__.metrics.get_text(run_values, args.metrics_format == 'openmetrics'))
+            os.replace(temp_path, args.metrics_file)
+        except OSError:
+            logging.exception("Unable to write metrics file '%s'", args.metrics_file)
 
-            logging.info("Posting datapoint to stream %s", stream_id)
-            if not geom:
-                geom = plot_geom
-            __internal__.create_datapoint(clowder_traits_url, clowder_key, stream_id, geom, start_time, end_time, metadata)
+
+def parse_shard(value: str) -> tuple:
+    """Parses the shard of a sharded upload from the command line
+    Arguments:
+        value: the shard as <shard number>/<shard count> (eg: 2/4), with shard numbers starting at 1
+    Return:
+        Returns the (shard number, shard count) tuple
+    Exceptions:
+        Raises argparse.ArgumentTypeError if the value isn't a valid shard
+    """
+    try:
+        number, count = (int(part) for part in value.split('/'))
+    except ValueError as ex:
+        raise argparse.ArgumentTypeError("expected <shard number>/<shard count>, not '%s'" % value) from ex
+    if count < 1 or not 1 <= number <= count:
+        raise argparse.ArgumentTypeError("the shard number must be from 1 to the shard count, not '%s'" % value)
+    return number, count
 
 
 def add_parameters(parser: argparse.ArgumentParser) -> None:
@@ -336,6 +3284,96 @@ def add_parameters(parser: argparse.ArgumentParser) -> None:
     parser.add_argument('--clowder_key', default=CLOWDER_DEFAULT_KEY,
                         help="the key to use when accessing Clowder %s" %
                         ("(default: using environment value)" if CLOWDER_DEFAULT_KEY else ''))
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="the maximum number of datapoints uploaded to a stream at one time (default %s)" % DEFAULT_BATCH_SIZE)
+    parser.add_argument('--batch_max_bytes', type=int, default=DEFAULT_BATCH_MAX_BYTES,
+                        help="the approximate maximum size in bytes of datapoints uploaded at one time (default %s)" %
+                        DEFAULT_BATCH_MAX_BYTES)
+    parser.add_argument('--http_pool_size', type=int, default=DEFAULT_HTTP_POOL_SIZE,
+                        help="the number of connections kept open to GeoStreams (default %s)" % DEFAULT_HTTP_POOL_SIZE)
+    parser.add_argument('--http_timeout', type=float, default=DEFAULT_HTTP_TIMEOUT,
+                        help="the number of seconds to wait for GeoStreams to respond (default %s)" % DEFAULT_HTTP_TIMEOUT)
+    parser.add_argument('--http_retries', type=int, default=DEFAULT_HTTP_RETRIES,
+                        help="the number of times a failed GeoStreams request is retried (default %s)" % DEFAULT_HTTP_RETRIES)
+    parser.add_argument('--http_backoff', type=float, default=DEFAULT_HTTP_BACKOFF,
+                        help="the number of seconds to wait before retrying a failed request, doubling with each retry "
+                             "(default %s)" % DEFAULT_HTTP_BACKOFF)
+    parser.add_argument('--http_gzip_min_bytes', type=int, default=DEFAULT_HTTP_GZIP_MIN_BYTES,
+                        help="compress request bodies of at least this many bytes with gzip, 0 to disable (default %s)" %
+                        DEFAULT_HTTP_GZIP_MIN_BYTES)
+    parser.add_argument('--geostreams_max_rate', type=float, default=0.0,
+                        help="the highest number of GeoStreams requests per second, 0 for no fixed limit; the rate is "
+                             "lowered while GeoStreams reports being overloaded (default 0)")
+    parser.add_argument('--geostreams_max_in_flight', type=int, default=0,
+                        help="the highest number of GeoStreams requests made at one time, 0 for no limit (default 0)")
+    parser.add_argument('--betydb_max_rate', type=float, default=0.0,
+                        help="the highest number of BETYdb requests per second, 0 for no fixed limit (default 0)")
+    parser.add_argument('--betydb_max_in_flight', type=int, default=0,
+                        help="the highest number of BETYdb requests made at one time, 0 for no limit (default 0)")
+    parser.add_argument('--rate_target_latency', type=float, default=0.0,
+                        help="the number of seconds after which a slow response lowers the request rate, 0 to only lower "
+                             "the rate when a service reports being overloaded (default 0)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="the number of threads resolving sensors and streams and uploading datapoints (default %s)" %
+                        DEFAULT_WORKERS)
+    parser.add_argument('--file_workers', type=int, default=DEFAULT_FILE_WORKERS,
+                        help="the number of processes loading CSV files at the same time (default %s)" % DEFAULT_FILE_WORKERS)
+    parser.add_argument('--resume', action='store_true',
+                        help="continue uploading CSV files from their last checkpoint in the working space")
+    parser.add_argument('--checkpoint_rows', type=int, default=DEFAULT_CHECKPOINT_ROWS,
+                        help="the number of rows between upload checkpoints recorded in the working space, 0 to disable "
+                             "(default %s)" % DEFAULT_CHECKPOINT_ROWS)
+    parser.add_argument('--aggregate', choices=list(AGGREGATE_PERIODS.keys()),
+                        help="upload one data point with the mean, minimum, maximum, and count of the numeric values of each "
+                             "stream, source, and %s instead of a data point for each row" % ' or '.join(AGGREGATE_PERIODS))
+    parser.add_argument('--dedup', action='store_true',
+                        help="skip data points that already exist in their streams with the same time, value, and source")
+    parser.add_argument('--dedup_slice_hours', type=float, default=DEFAULT_DEDUP_SLICE_HOURS,
+                        help="the number of hours of existing data points fetched in each request when checking for "
+                             "duplicates (default %s)" % DEFAULT_DEDUP_SLICE_HOURS)
+    parser.add_argument('--offline', action='store_true',
+                        help="upload to a local stand-in for GeoStreams instead of Clowder, for dry runs and performance tests")
+    parser.add_argument('--offline_store', default=':memory:',
+                        help="the SQLite file the offline stand-in stores GeoStreams objects in (default in memory)")
+    parser.add_argument('--offline_latency', type=float, default=0.0,
+                        help="the number of seconds each request to the offline stand-in takes (default 0)")
+    parser.add_argument('--site_index', action='store_true',
+                        help="fetch the sites for each date once and match data points to plots locally")
+    parser.add_argument('--site_file',
+                        help="GeoJSON or CSV (sitename, WKT geometry) file of sites to match data points to instead of "
+                             "querying BETYdb")
+    parser.add_argument('--site_cache_size', type=int, default=DEFAULT_SITE_CACHE_SIZE,
+                        help="the number of data point locations to remember matched sites for, 0 to disable (default %s)" %
+                        DEFAULT_SITE_CACHE_SIZE)
+    parser.add_argument('--site_cache_precision', type=int, default=DEFAULT_SITE_CACHE_PRECISION,
+                        help="the number of decimal places of latitude and longitude used to identify data point locations "
+                             "with the same matched sites (default %s)" % DEFAULT_SITE_CACHE_PRECISION)
+    parser.add_argument('--resolution_index', choices=RESOLUTION_INDEX_MODES, default=RESOLUTION_INDEX_MODES[0],
+                        help="how to treat the sensor and stream index stored in the working space: use it, bypass it, or "
+                             "rebuild it from scratch (default '%s')" % RESOLUTION_INDEX_MODES[0])
+    parser.add_argument('--resolution_index_ttl', type=float, default=DEFAULT_RESOLUTION_INDEX_TTL_HOURS,
+                        help="the number of hours a stored sensor or stream entry remains valid (default %s)" %
+                        DEFAULT_RESOLUTION_INDEX_TTL_HOURS)
+    parser.add_argument('--csv_reader', choices=CSV_READERS, default=CSV_READERS[0],
+                        help="how CSV files are read: one row at a time, or in blocks of typed and validated columns using "
+                             "pyarrow or pandas (default '%s')" % CSV_READERS[0])
+    parser.add_argument('--csv_block_bytes', type=int, default=DEFAULT_CSV_BLOCK_BYTES,
+                        help="the approximate size of the blocks of rows read by the columnar CSV reader (default %s)" %
+                        DEFAULT_CSV_BLOCK_BYTES)
+    parser.add_argument('--csv_split_bytes', type=int, default=DEFAULT_CSV_SPLIT_BYTES,
+                        help="uncompressed CSV files of at least this size are scanned in ranges of rows by the --file_workers "
+                             "processes, 0 to disable (default %s)" % DEFAULT_CSV_SPLIT_BYTES)
+    parser.add_argument('--shard', type=parse_shard,
+                        help="upload only the streams belonging to this shard of the files, as <shard number>/<shard count> "
+                             "(eg: 2/4); the runs uploading the shards coordinate through the working space")
+    parser.add_argument('--manifest',
+                        help="a JSON manifest of the sensors, streams, and sites of a season written by warm_up.py; its "
+                             "sensors and streams aren't looked up, and its sites are used when there's no site file")
+    parser.add_argument('--metrics_file',
+                        help="the file to write the stage timers and GeoStreams request metrics of the run to, for example "
+                             "for the Prometheus node exporter's textfile collector")
+    parser.add_argument('--metrics_format', choices=METRICS_FORMATS, default=METRICS_FORMATS[0],
+                        help="the format of the metrics file (default '%s')" % METRICS_FORMATS[0])
 
     # Here we specify a default metadata file that we provide to get around the requirement while also allowing
     # pylint: disable=protected-access
@@ -356,7 +3394,7 @@ def check_continue(transformer: transformer_class.Transformer, check_md: dict) -
     """
     # pylint: disable=unused-argument
     for one_file in check_md['list_files']():
-        if os.path.splitext(one_file)[1].lower() == '.csv':
+        if __internal__.is_csv_file(one_file):
             return tuple([0])
 
     return -1, "Unable to find a CSV file in the list of files"
@@ -373,61 +3411,211 @@ def perform_process(transformer: transformer_class.Transformer, check_md: dict)
     # Process each CSV file into BETYdb
     start_timestamp = datetime.datetime.now()
     files_count = 0
-    files_csv = 0
-    lines_read = 0
-    error_count = 0
-    files_loaded = []
+    csv_files = []
     for one_file in check_md['list_files']():
         files_count += 1
-        if os.path.splitext(one_file)[1].lower() == '.csv':
-            files_csv += 1
-
+        if __internal__.is_csv_file(one_file):
             # Make sure we can access the file
             if not os.path.exists(one_file):
                 msg = "Unable to access csv file '%s'" % one_file
                 logging.debug(msg)
                 return {'code': -1000,
                         'error': msg}
+            csv_files.append(one_file)
+    if transformer.args.shard and not getattr(transformer.args, 'working_space', None):
+        return {'code': -1003, 'error': "A working space shared by the shards is needed to upload a shard"}
 
-            try:
-                # Read in the lines from the file
-                with open(one_file, 'r') as in_file:
-                    reader = csv.DictReader(in_file)
-                    files_loaded.append(one_file)
-                    for row in reader:
-                        centroid_lonlat = [row['lon'], row['lat']]
-                        time_fmt = row['dp_time']
-                        timestamp = row['timestamp']
-                        dp_metadata = {
-                            "source": row['source'],
-                            "value": row['value']
-                        }
-                        trait = row['trait']
-
-                        __internal__.create_datapoint_with_dependencies(transformer.args.clowder_url, transformer.args.clowder_key,
-                                                                        trait, (centroid_lonlat[1], centroid_lonlat[0]), time_fmt,
-                                                                        time_fmt, dp_metadata, timestamp)
-                        lines_read += 1
+    in_service = __internal__.service_args is not None
+    if in_service:
+        __internal__.reset_job_counters()
+    else:
+        __internal__.configure_run(transformer.args)
+    coordinator = __internal__.shard_coordinator
+    if coordinator:
+        try:
+            coordinator.start(csv_files)
+        except RuntimeError as ex:
+            logging.error(str(ex))
+            if not in_service:
+                __internal__.release_run()
+            return {'code': -1003, 'error': str(ex)}
+    try:
+        if transformer.args.offline and transformer.args.offline_store == ':memory:' and transformer.args.file_workers > 1:
+            logging.warning("An offline store in memory can't be shared between processes, loading files one at a time")
+            results = [__internal__.process_csv_file(transformer.args, one_file) for one_file in csv_files]
+        elif transformer.args.file_workers > 1 and (len(csv_files) > 1 or
+                                                    (csv_files and __internal__.get_scan_ranges(transformer.args, csv_files[0]))):
+            results = __internal__.process_csv_files_in_parallel(transformer.args, csv_files)
+        else:
+            results = [__internal__.process_csv_file(transformer.args, one_file) for one_file in csv_files]
+        resolution_index_hits = __internal__.resolution_cache.index_hits
+    except BaseException as ex:
+        # Release the lease and record the failure so that the other shards don't see this one as still running
+        if coordinator:
+            coordinator.finish({'status': 'failed', 'csv_files': str(len(csv_files)), 'error': repr(ex)})
+        raise
+    finally:
+        if not in_service:
+            __internal__.release_run()
 
-            except Exception:
-                logging.exception("Error reading CSV file '%s'. Continuing processing", os.path.basename(one_file))
-                error_count += 1
+    file_reports = [report for report, _ in results]
+    batch_sizes = [one_size for _, file_batch_sizes in results for one_size in file_batch_sizes]
+    lines_read = sum(int(report['lines_loaded']) for report in file_reports)
+    error_count = sum(1 for report in file_reports if report['status'] == 'error')
+    __internal__.write_metrics_file(transformer.args, {
+        'processing_seconds': (datetime.datetime.now() - start_timestamp).total_seconds(),
+        'csv_files': len(csv_files),
+        'csv_files_failed': error_count,
+        'lines_loaded': lines_read,
+        'datapoints_uploaded': sum(batch_sizes),
+        'last_run_timestamp_seconds': time.time()
+    })
+    shard_summary = None
+    if coordinator:
+        shard_summary = coordinator.finish({
+            'status': 'error' if error_count > 0 else 'complete',
+            'csv_files': str(len(csv_files)),
+            'csv_files_failed': str(error_count),
+            'lines_loaded': str(lines_read),
+            'datapoints_uploaded': str(sum(batch_sizes))
+        })
 
-    if files_csv <= 0:
+    if not csv_files:
         logging.info("No CSV files were found in the list of files to process")
     if error_count > 0:
         logging.error("Errors were found during processing")
-        return {'code': -1001, 'error': "Too many errors occurred during processing. Please correct and try again"}
+        return {'code': -1001, 'error': "Too many errors occurred during processing. Please correct and try again",
+                'files_processed': file_reports, 'metrics': __internal__.metrics.get_report()}
 
-    return {
+    result = {
         'code': 0,
         configuration.TRANSFORMER_NAME: {
             'version': configuration.TRANSFORMER_VERSION,
             'utc_timestamp': datetime.datetime.utcnow().isoformat(),
             'processing_time': str(datetime.datetime.now() - start_timestamp),
             'num_files_received': str(files_count),
-            'num_csv_files': str(files_csv),
+            'num_csv_files': str(len(csv_files)),
             'lines_loaded': str(lines_read),
-            'files_processed': str(files_loaded)
+            'files_processed': file_reports,
+            'datapoint_batches': str(len(batch_sizes)),
+            'datapoints_uploaded': str(sum(batch_sizes)),
+            'datapoints_per_batch': str(batch_sizes),
+            'resolution_cache_hits': str(__internal__.resolution_cache.hits),
+            'resolution_cache_misses': str(__internal__.resolution_cache.misses),
+            'resolution_index_hits': str(resolution_index_hits),
+            'site_cache_hits': str(__internal__.matched_sites_cache.hits),
+            'site_cache_misses': str(__internal__.matched_sites_cache.misses),
+            'rate_limits': {
+                'geostreams': __internal__.geostreams_limiter.get_report(),
+                'betydb': __internal__.betydb_limiter.get_report()
+            },
+            'metrics': __internal__.metrics.get_report()
+        }
+    }
+    if transformer.args.dedup:
+        result[configuration.TRANSFORMER_NAME]['datapoints_skipped'] = \
+            str(sum(int(report.get('datapoints_skipped', 0)) for report in file_reports))
+    if shard_summary:
+        result[configuration.TRANSFORMER_NAME]['shard'] = dict(
+            {key: value for key, value in shard_summary.items() if key != 'progress'},
+            shard='%s/%s' % transformer.args.shard, summary_file=os.path.join(coordinator.run_folder, 'summary.json'))
+
+    return result
+
+
+def start_service(args: argparse.Namespace) -> None:
+    """Prepares the clients, caches and workers once so that following calls to perform_process() reuse them instead of
+       preparing their own
+    Arguments:
+        args: the command line arguments, as defined by add_parameters()
+    Notes:
+        Jobs must be processed one at a time; the metrics and cache counters reported by each job are its own, while the
+        connections, resolved sensors and streams, sites and rate limits carry over from one job to the next
+    """
+    if __internal__.service_args is not None:
+        stop_service()
+    __internal__.configure_run(args)
+    __internal__.service_args = args
+
+
+def stop_service() -> None:
+    """Releases the clients, caches and workers prepared by start_service()
+    """
+    if __internal__.service_args is None:
+        return
+    __internal__.service_args = None
+    __internal__.release_run()
+
+
+def warm_up(args: argparse.Namespace, season_date: str, traits: list) -> dict:
+    """Finds or creates the sensor of every site of a season, and the stream of every trait of each sensor, and writes them
+       to the manifest file named by the command line arguments
+    Arguments:
+        args: the command line arguments, as defined by add_parameters()
+        season_date: the date used to fetch the sites of the season
+        traits: the names of the traits to create streams for
+    Return:
+        Returns a dictionary with the results of warming up
+    """
+    start_timestamp = datetime.datetime.now()
+    if os.path.splitext(args.manifest or '')[1].lower() not in MANIFEST_FILE_EXTENSIONS:
+        return {'code': -1002, 'error': "The manifest must be a %s file" % ' or '.join(MANIFEST_FILE_EXTENSIONS)}
+
+    # Look up every sensor and stream rather than trusting an earlier manifest
+    run_args = argparse.Namespace(**vars(args))
+    run_args.manifest = None
+    __internal__.configure_run(run_args)
+    try:
+        sites = __internal__.site_source.get_sites(season_date)
+        run_map = __internal__.executor.map if __internal__.executor else map
+        sensor_ids = list(run_map(lambda site: __internal__.resolve_sensor(site[0], args.clowder_url, args.clowder_key,
+                                                                          site[1]), sites))
+
+        def resolve_site_stream(job: tuple) -> str:
+            """Resolves the stream of a trait at a site"""
+            trait, site_index = job
+            sensor_id = sensor_ids[site_index]
+            return __internal__.resolve_stream("%s (%s)" % (trait, sensor_id), args.clowder_url, args.clowder_key, sensor_id,
+                                               sites[site_index][1])
+
+        stream_jobs = [(trait, site_index) for site_index in range(len(sites)) for trait in traits]
+        stream_ids = dict(zip(stream_jobs, run_map(resolve_site_stream, stream_jobs)))
+
+        manifest = {
+            'type': 'FeatureCollection',
+            'store_url': __internal__.get_store_url(args),
+            'season_date': season_date,
+            'traits': traits,
+            'utc_timestamp': datetime.datetime.utcnow().isoformat(),
+            'features': [{
+                'type': 'Feature',
+                'properties': {
+                    'sitename': site_name,
+                    'sensor_id': sensor_ids[site_index],
+                    'streams': {trait: stream_ids[(trait, site_index)] for trait in traits}
+                },
+                'geometry': site_geom
+            } for site_index, (site_name, site_geom) in enumerate(sites)]
+        }
+        __internal__.write_manifest(args.manifest, manifest)
+    except Exception as ex:
+        logging.exception("Unable to warm up the sensors and streams of '%s'", season_date)
+        return {'code': -1002, 'error': repr(ex)}
+    finally:
+        __internal__.release_run()
+
+    return {
+        'code': 0,
+        configuration.TRANSFORMER_NAME: {
+            'version': configuration.TRANSFORMER_VERSION,
+            'utc_timestamp': datetime.datetime.utcnow().isoformat(),
+            'processing_time': str(datetime.datetime.now() - start_timestamp),
+            'manifest': args.manifest,
+            'season_date': season_date,
+            'sites': str(len(sites)),
+            'streams': str(len(stream_ids)),
+            'resolution_cache_hits': str(__internal__.resolution_cache.hits),
+            'resolution_cache_misses': str(__internal__.resolution_cache.misses),
+            'metrics': __internal__.metrics.get_report()
         }
     }
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+"""Finds or creates the GeoStreams sensors and streams of a season ahead of uploading its CSV files, and writes them to a
+   manifest that upload runs load with --manifest
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+import transformer
+
+
+def main() -> int:
+    """Warms up the sensors and streams of a season from the command line
+    Return:
+        Returns the process exit code: 0 on success and 1 on failure
+    """
+    parser = argparse.ArgumentParser(description='Creates the GeoStreams sensors and streams of a season and writes them to '
+                                                 'a manifest')
+    parser.add_argument('--working_space', help='the folder holding the sensor and stream index')
+    parser.add_argument('--season_date', required=True, help='the date used to fetch the sites of the season (eg: 2018-06-28)')
+    parser.add_argument('--traits', nargs='+', required=True, help='the names of the traits to create streams for')
+    parser.add_argument('--debug', action='store_true', help='log debug messages')
+    transformer.add_parameters(parser)
+    parser.set_defaults(workers=transformer.DEFAULT_WARM_UP_WORKERS)
+    args = parser.parse_args()
+    if not args.manifest:
+        parser.error('--manifest is required')
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    result = transformer.warm_up(args, args.season_date, args.traits)
+    print(json.dumps(result, indent=2))
+    return 0 if result['code'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
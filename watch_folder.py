@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+"""Runs the transformer as a long-running service that uploads the CSV files dropped into a folder, or named in jobs sent
+   to a local socket, keeping the GeoStreams connections, resolved sensors and streams, and sites in memory between jobs
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import datetime
+import json
+import logging
+import os
+import queue
+import select
+import signal
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+import configuration
+import transformer
+import transformer_class
+
+# The number of seconds between scans of the folder when inotify isn't available
+DEFAULT_POLL_INTERVAL = 2.0
+
+# The inotify events of a file that was written and closed, or moved into the folder
+INOTIFY_CLOSE_WRITE = 0x00000008
+INOTIFY_MOVED_TO = 0x00000080
+INOTIFY_CLOEXEC = 0o2000000
+
+# The result given to the jobs that are still queued when the service stops
+STOPPED_RESULT = {'code': -1, 'error': 'The service stopped before the job was processed'}
+
+# The layout of the fixed part of an inotify event (watch descriptor, mask, cookie, name length)
+INOTIFY_EVENT_FORMAT = 'iIII'
+INOTIFY_EVENT_SIZE = struct.calcsize(INOTIFY_EVENT_FORMAT)
+
+
+class PollingWatcher():
+    """Reports the CSV files of a folder that are new or changed, once their size and modification time stop changing
+    """
+    def __init__(self, folder: str, poll_interval: float = DEFAULT_POLL_INTERVAL, include_existing: bool = False):
+        """Performs initialization of class instance
+        Arguments:
+            folder: the folder to watch
+            poll_interval: the number of seconds between scans of the folder
+            include_existing: report the files already in the folder when True, otherwise only later changes are reported
+        """
+        self.folder = folder
+        self.poll_interval = poll_interval
+        self.pending = {}
+        self.reported = {} if include_existing else self.scan()
+
+    def scan(self) -> dict:
+        """Returns the CSV files of the folder
+        Return:
+            Returns a dictionary of file paths with their (size, modification time)
+        """
+        found = {}
+        with os.scandir(self.folder) as entries:
+            for one_entry in entries:
+                if one_entry.is_file() and transformer.__internal__.is_csv_file(one_entry.name):
+                    stat = one_entry.stat()
+                    found[one_entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return found
+
+    def wait(self, timeout: float) -> list:
+        """Waits for files to be ready
+        Arguments:
+            timeout: the longest number of seconds to wait
+        Return:
+            Returns the list of paths of the files that are ready, which may be empty
+        """
+        time.sleep(min(timeout, self.poll_interval))
+        ready = []
+        found = self.scan()
+        for file_path, state in found.items():
+            if self.reported.get(file_path) == state:
+                continue
+            # A file is only ready when it's unchanged since the previous scan, so that it's not read while being written
+            if self.pending.get(file_path) == state:
+                ready.append(file_path)
+                self.reported[file_path] = state
+                del self.pending[file_path]
+            else:
+                self.pending[file_path] = state
+        for file_path in set(self.reported) - set(found):
+            del self.reported[file_path]
+        return sorted(ready)
+
+    def close(self) -> None:
+        """Releases the watcher's resources
+        """
+
+
+class InotifyWatcher():
+    """Reports the CSV files that are closed after being written, or moved into a folder, using Linux inotify
+    """
+    def __init__(self, folder: str, include_existing: bool = False):
+        """Performs initialization of class instance
+        Arguments:
+            folder: the folder to watch
+            include_existing: report the files already in the folder with the first wait when True
+        Exceptions:
+            Raises OSError if inotify isn't available
+        """
+        self.folder = folder
+        library = ctypes.util.find_library('c')
+        if not library:
+            raise OSError("The C library wasn't found")
+        self.libc = ctypes.CDLL(library, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError("inotify isn't available")
+        self.descriptor = self.libc.inotify_init1(INOTIFY_CLOEXEC)
+        if self.descriptor < 0:
+            raise OSError(ctypes.get_errno(), "Unable to start inotify")
+        if self.libc.inotify_add_watch(self.descriptor, os.fsencode(folder), INOTIFY_CLOSE_WRITE | INOTIFY_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(self.descriptor)
+            raise OSError(error, "Unable to watch folder '%s'" % folder)
+        self.existing = PollingWatcher(folder, include_existing=True).scan() if include_existing else {}
+
+    def wait(self, timeout: float) -> list:
+        """Waits for files to be ready
+        Arguments:
+            timeout: the longest number of seconds to wait
+        Return:
+            Returns the list of paths of the files that are ready, which may be empty
+        """
+        if self.existing:
+            ready, self.existing = sorted(self.existing), {}
+            return ready
+        readable, _, _ = select.select([self.descriptor], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.descriptor, 64 * 1024)
+        ready = []
+        offset = 0
+        while offset + INOTIFY_EVENT_SIZE <= len(data):
+            _, _, _, name_length = struct.unpack_from(INOTIFY_EVENT_FORMAT, data, offset)
+            name = data[offset + INOTIFY_EVENT_SIZE:offset + INOTIFY_EVENT_SIZE + name_length].rstrip(b'\0')
+            offset += INOTIFY_EVENT_SIZE + name_length
+            file_path = os.path.join(self.folder, os.fsdecode(name))
+            if name and transformer.__internal__.is_csv_file(file_path) and file_path not in ready:
+                ready.append(file_path)
+        return ready
+
+    def close(self) -> None:
+        """Releases the watcher's resources
+        """
+        os.close(self.descriptor)
+
+
+def make_watcher(folder: str, poll_interval: float, include_existing: bool, use_polling: bool):
+    """Returns a watcher of a folder, using inotify when it's available and polling otherwise
+    Arguments:
+        folder: the folder to watch
+        poll_interval: the number of seconds between scans of the folder when polling
+        include_existing: report the files already in the folder when True
+        use_polling: poll the folder even if inotify is available
+    Return:
+        Returns the watcher
+    """
+    if not use_polling:
+        try:
+            return InotifyWatcher(folder, include_existing)
+        except (OSError, AttributeError) as ex:
+            logging.info("Polling folder '%s' for files, inotify can't be used: %s", folder, str(ex))
+    return PollingWatcher(folder, poll_interval, include_existing)
+
+
+class UploadService():
+    """Processes upload jobs one at a time with the clients and caches prepared once, and keeps throughput statistics
+    """
+    def __init__(self, args: argparse.Namespace):
+        """Performs initialization of class instance
+        Arguments:
+            args: the command line arguments
+        """
+        self.args = args
+        self.jobs = queue.Queue()
+        self.stopping = threading.Event()
+        self.stopped = False
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stats = {
+            'jobs': 0,
+            'jobs_failed': 0,
+            'csv_files': 0,
+            'lines_loaded': 0,
+            'datapoints_uploaded': 0,
+            'busy_seconds': 0.0,
+            'last_job_seconds': 0.0,
+            'last_job_timestamp': None
+        }
+
+    def submit(self, file_list: list, reply: queue.Queue = None) -> None:
+        """Queues a job
+        Arguments:
+            file_list: the paths of the files to process
+            reply: the queue the job's result is put into when specified
+        Notes:
+            Jobs submitted after the service stopped aren't queued, and are given STOPPED_RESULT instead
+        """
+        with self.lock:
+            if not self.stopped:
+                self.jobs.put((file_list, reply))
+                return
+        if reply is not None:
+            reply.put(dict(STOPPED_RESULT))
+
+    def get_stats(self) -> dict:
+        """Returns the service's throughput statistics
+        Return:
+            Returns a dictionary of statistics
+        """
+        with self.lock:
+            stats = dict(self.stats)
+        uptime = time.time() - self.started
+        stats['uptime_seconds'] = round(uptime, 3)
+        stats['busy_seconds'] = round(stats['busy_seconds'], 3)
+        stats['jobs_queued'] = self.jobs.qsize()
+        stats['lines_per_second'] = round(stats['lines_loaded'] / stats['busy_seconds'], 1) if stats['busy_seconds'] else 0.0
+        stats['seconds_per_job'] = round(stats['busy_seconds'] / stats['jobs'], 4) if stats['jobs'] else 0.0
+        stats['utilization'] = round(stats['busy_seconds'] / uptime, 4) if uptime else 0.0
+        return stats
+
+    def write_stats(self) -> None:
+        """Writes the statistics to the stats file, when one was specified
+        """
+        if not self.args.stats_file:
+            return
+        temp_path = self.args.stats_file + '.tmp'
+        with open(temp_path, 'w') as out_file:
+            json.dump(self.get_stats(), out_file, indent=2)
+        os.replace(temp_path, self.args.stats_file)
+
+    def process(self, file_list: list) -> dict:
+        """Runs the transformer on the files of a job
+        Arguments:
+            file_list: the paths of the files to process
+        Return:
+            Returns the result of processing
+        """
+        job_args = argparse.Namespace(**vars(self.args))
+        job_args.file_list = file_list
+        instance = transformer_class.Transformer()
+        params = instance.get_transformer_params(job_args, [])
+        job_start = time.perf_counter()
+        try:
+            continue_result = transformer.check_continue(instance, **params)
+            if continue_result[0] != 0:
+                result = {'code': continue_result[0], 'error': continue_result[1] if len(continue_result) > 1 else ''}
+            else:
+                result = transformer.perform_process(instance, **params)
+        except Exception as ex:
+            logging.exception("Unable to process job %s", str(file_list))
+            result = {'code': -1, 'error': repr(ex)}
+        job_seconds = time.perf_counter() - job_start
+
+        details = result.get(configuration.TRANSFORMER_NAME, {})
+        with self.lock:
+            self.stats['jobs'] += 1
+            if result.get('code') != 0:
+                self.stats['jobs_failed'] += 1
+            self.stats['csv_files'] += int(details.get('num_csv_files', 0))
+            self.stats['lines_loaded'] += int(details.get('lines_loaded', 0))
+            self.stats['datapoints_uploaded'] += int(details.get('datapoints_uploaded', 0))
+            self.stats['busy_seconds'] += job_seconds
+            self.stats['last_job_seconds'] = round(job_seconds, 4)
+            self.stats['last_job_timestamp'] = datetime.datetime.utcnow().isoformat()
+        logging.info("Job of %s file(s) finished with code %s in %.3f seconds", len(file_list), result.get('code'),
+                     job_seconds)
+        self.write_stats()
+        return result
+
+    def move_done_file(self, file_path: str) -> None:
+        """Moves a successfully processed file into the done folder, when one was specified
+        Arguments:
+            file_path: the path of the file
+        """
+        if self.args.done_folder and os.path.exists(file_path):
+            os.replace(file_path, os.path.join(self.args.done_folder, os.path.basename(file_path)))
+
+    def run(self) -> None:
+        """Processes queued jobs until the service is stopped, then gives the jobs still queued STOPPED_RESULT so that
+           the clients waiting for them aren't left waiting
+        """
+        try:
+            transformer.start_service(self.args)
+            while not self.stopping.is_set():
+                try:
+                    file_list, reply = self.jobs.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                result = self.process(file_list)
+                if reply is not None:
+                    reply.put(result)
+                elif result.get('code') == 0:
+                    for one_file in file_list:
+                        self.move_done_file(one_file)
+        finally:
+            self.reject_queued()
+            transformer.stop_service()
+
+    def reject_queued(self) -> None:
+        """Stops accepting jobs and gives the jobs still queued STOPPED_RESULT
+        """
+        with self.lock:
+            self.stopped = True
+        while True:
+            try:
+                file_list, reply = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            logging.warning("Job of %s file(s) not processed, the service stopped", len(file_list))
+            if reply is not None:
+                reply.put(dict(STOPPED_RESULT))
+
+    def watch(self, watcher) -> None:
+        """Queues the files reported by a watcher as jobs until the service is stopped; intended to run in its own thread
+        Arguments:
+            watcher: the folder watcher
+        """
+        try:
+            while not self.stopping.is_set():
+                ready = watcher.wait(1.0)
+                if ready:
+                    # Files that became ready together are uploaded in one job
+                    self.submit(ready)
+        finally:
+            watcher.close()
+
+
+class JobRequestHandler(socketserver.StreamRequestHandler):
+    """Handles the jobs sent to the service's socket: each line is a JSON object, either {"files": [<path>, ...]} to process
+       files or {"command": "stats"} to get the throughput statistics, and is answered with a line of JSON
+    """
+    def handle(self):
+        """Handles the requests of a connection
+        """
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if request.get('command') == 'stats':
+                    response = self.server.service.get_stats()
+                elif isinstance(request.get('files'), list) and request['files']:
+                    reply = queue.Queue()
+                    self.server.service.submit([os.path.abspath(one_file) for one_file in request['files']], reply)
+                    response = reply.get()
+                else:
+                    response = {'code': -1, 'error': 'Expected a "files" list or the "stats" command'}
+            except (ValueError, AttributeError) as ex:
+                response = {'code': -1, 'error': "Invalid request: %s" % str(ex)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Accepts jobs for the service on a Unix domain socket
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: UploadService):
+        """Performs initialization of class instance
+        Arguments:
+            socket_path: the path of the socket
+            service: the service the jobs are submitted to
+        """
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.service = service
+        super().__init__(socket_path, JobRequestHandler)
+
+
+def main() -> int:
+    """Runs the service from the command line
+    Return:
+        Returns the process exit code
+    """
+    parser = argparse.ArgumentParser(description='Uploads the CSV files dropped into a folder, or sent to a local socket, '
+                                                 'to GeoStreams as they arrive')
+    parser.add_argument('--working_space', help='the folder holding the sensor and stream index and upload checkpoints')
+    parser.add_argument('--watch_folder', help='the folder to upload new CSV files from')
+    parser.add_argument('--socket', help='the path of a Unix domain socket to accept jobs on')
+    parser.add_argument('--poll_interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='the number of seconds between scans of the folder when polling (default %s)' %
+                        DEFAULT_POLL_INTERVAL)
+    parser.add_argument('--poll', action='store_true', help="poll the folder even if inotify is available")
+    parser.add_argument('--process_existing', action='store_true',
+                        help='upload the CSV files already in the folder when the service starts')
+    parser.add_argument('--done_folder', help='the folder successfully uploaded files are moved to')
+    parser.add_argument('--stats_file', help='the JSON file the throughput statistics are written to after each job')
+    parser.add_argument('--debug', action='store_true', help='log debug messages')
+    transformer.add_parameters(parser)
+    args = parser.parse_args()
+    if not args.watch_folder and not args.socket:
+        parser.error('at least one of --watch_folder and --socket is required')
+    if args.watch_folder and not os.path.isdir(args.watch_folder):
+        parser.error("the folder to watch doesn't exist: '%s'" % args.watch_folder)
+    if args.done_folder:
+        os.makedirs(args.done_folder, exist_ok=True)
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    service = UploadService(args)
+
+    def stop(signal_number, _):
+        """Stops the service after the current job"""
+        logging.info("Stopping after signal %s", signal_number)
+        service.stopping.set()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    threads = []
+    server = None
+    if args.watch_folder:
+        watcher = make_watcher(os.path.abspath(args.watch_folder), args.poll_interval, args.process_existing, args.poll)
+        threads.append(threading.Thread(target=service.watch, args=(watcher,), daemon=True))
+    if args.socket:
+        server = JobServer(args.socket, service)
+        threads.append(threading.Thread(target=server.serve_forever, daemon=True))
+    for one_thread in threads:
+        one_thread.start()
+
+    try:
+        service.run()
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+            os.remove(args.socket)
+        service.write_stats()
+    print(json.dumps(service.get_stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())